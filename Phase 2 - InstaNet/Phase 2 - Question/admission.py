@@ -0,0 +1,56 @@
+"""
+This module implements admission control for the server's worker pool.
+
+In ``pool`` mode requests run on a fixed number of worker threads, and
+`AdmissionControl` bounds how many requests may wait for one of them.
+Requests over the limit are shed: they are answered at once with a
+retryable 'busy' status instead of joining an ever longer queue, so a burst
+of clients cannot slow every client down or exhaust the host's memory.
+"""
+
+import threading
+
+
+class AdmissionControl:
+    """
+    Counts the requests admitted to a worker pool and refuses those over its limit.
+
+    Args:
+        workers (int): Worker threads running requests
+        queue_size (int): Admitted requests that may wait for a free worker
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        if workers < 1 or queue_size < 0:
+            raise ValueError("A worker pool needs at least one worker and a non-negative queue size")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.in_flight = 0  # Admitted requests, running or waiting for a worker
+        self._lock = threading.Lock()
+
+    def try_admit(self) -> bool:
+        """
+        Admit a request if a worker or a queue slot is free.
+
+        Returns:
+            bool: True if the request was admitted; it must later be `release`d
+        """
+        with self._lock:
+            if self.in_flight >= self.workers + self.queue_size:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        """
+        Record that an admitted request has finished.
+        """
+        with self._lock:
+            self.in_flight -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        The number of admitted requests waiting for a free worker.
+        """
+        return max(0, self.in_flight - self.workers)
@@ -0,0 +1,466 @@
+"""
+This module implements a multi-client load test of the InstaNet server.
+
+It starts a server in its own process on a scratch data directory, seeds
+that directory with one account per simulated user, and then has every
+simulated user repeat a weighted mix of actions over its own connection
+for a fixed time:
+
+- login: log in again on the open connection
+- feed: fetch the first page of the feed
+- friend_request: send a friend request, which the target then rejects
+  from a second connection
+- text_dm: send a text message to a friend
+- image_dm: send an image message to a friend
+- upload: publish a post
+
+The report lists throughput, p50/p95/p99 latency and error counts per
+action, and the server's resident memory. It is printed and also written
+as JSON, so runs of different releases can be compared.
+
+Example:
+    python benchmarks/load_test.py --users 50 --duration 30 --mode asyncio
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+from client_sdk import AsyncInstaNetClient
+from storage import create_storage
+from constants import DATA_DIRECTORIES, SERVER_MODES, DEFAULT_SERVER_MODE, STORAGE_BACKENDS, DEFAULT_STORAGE
+
+SERVER_SCRIPT = Path(__file__).resolve().parent.parent / 'server.py'
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+DEFAULT_MIX = 'login=1,feed=10,friend_request=1,text_dm=6,image_dm=1,upload=1'
+ACTIONS = ('login', 'feed', 'friend_request', 'text_dm', 'image_dm', 'upload')
+USER_PREFIX = 'load'          # Simulated users are load1, load2, ...
+PASSWORD = 'load'             # Password of every simulated user
+FRIENDS_PER_USER = 5          # Friends seeded on each side of a user
+SERVER_START_TIMEOUT = 30     # Seconds to wait for the server to listen
+RSS_SAMPLE_INTERVAL = 0.5     # Seconds between samples of the server's memory
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """
+    Parse an action mix such as 'feed=10,text_dm=5'.
+
+    Returns:
+        dict: Action -> relative weight
+    """
+    mix = {}
+    for item in text.split(','):
+        action, _, weight = item.partition('=')
+        action = action.strip()
+        if action not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"Unknown action '{action}' (choose from {', '.join(ACTIONS)})")
+        try:
+            mix[action] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight for '{action}': {weight!r}")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one action with a positive weight")
+    return mix
+
+
+def make_image(width: int, height: int) -> bytes:
+    """
+    Render a noisy JPEG, so uploads cost about as much as a photo.
+    """
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def username(index: int) -> str:
+    return f"{USER_PREFIX}{index + 1}"
+
+
+def friends_of(index: int, users: int) -> List[str]:
+    """
+    Return the seeded friends of a user: its neighbours on a ring of all users.
+    """
+    span = min(FRIENDS_PER_USER, (users - 1) // 2)
+    return [username((index + offset) % users) for offset in range(-span, span + 1) if offset]
+
+
+def seed_data(data_root: str, users: int, storage: str) -> None:
+    """
+    Create the simulated users and their friendships in a fresh data directory.
+    """
+    cwd = os.getcwd()
+    os.chdir(data_root)
+    try:
+        for directory in DATA_DIRECTORIES:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+        store = create_storage(storage)
+        try:
+            for i in range(users):
+                store.create_user(username(i), PASSWORD)
+            for i in range(users):
+                for friend in friends_of(i, users):
+                    if store.send_friend_request(username(i), friend):
+                        store.accept_friend_request(friend, username(i))
+        finally:
+            store.close()
+    finally:
+        os.chdir(cwd)
+
+
+class ServerProcess:
+    """
+    An InstaNet server running in a child process on its own data directory.
+
+    Args:
+        data_root (str): Directory the server keeps its data in
+        mode (str): Connection handling engine
+        storage (str): Storage backend
+    """
+
+    def __init__(self, data_root: str, mode: str, storage: str):
+        self.process = subprocess.Popen(
+            [sys.executable, '-u', str(SERVER_SCRIPT), '--mode', mode, '--storage', storage],
+            cwd=data_root, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        self.port = None
+        self.output: List[str] = []  # Last lines the server printed, for error reports
+        self._started = threading.Event()
+        threading.Thread(target=self._drain, daemon=True).start()
+        if not self._started.wait(SERVER_START_TIMEOUT) or self.port is None:
+            self.stop()
+            raise RuntimeError("Server did not start:\n" + ''.join(self.output))
+
+    def _drain(self) -> None:
+        """
+        Read the server's output, so it never blocks on a full pipe, and pick up its port.
+        """
+        for line in self.process.stdout:
+            self.output = self.output[-20:] + [line]
+            if self.port is None:
+                match = re.search(r'Server listening on .*:(\d+)', line)
+                if match:
+                    self.port = int(match.group(1))
+                    self._started.set()
+        self._started.set()
+
+    def rss(self) -> Optional[int]:
+        """
+        Return the server's resident memory in bytes, or None where /proc is unavailable.
+        """
+        try:
+            with open(f'/proc/{self.process.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    def stop(self) -> None:
+        """
+        Stop the server, interrupting it first so it shuts down its worker processes.
+        """
+        for stop in (lambda: self.process.send_signal(signal.SIGINT), self.process.terminate, self.process.kill):
+            if self.process.poll() is not None:
+                return
+            stop()
+            try:
+                self.process.wait(10)
+                return
+            except subprocess.TimeoutExpired:
+                pass
+
+
+class Stats:
+    """
+    Latencies and outcomes of the requests made during the measured window.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {action: [] for action in ACTIONS}
+        self.errors: Dict[str, int] = {action: 0 for action in ACTIONS}      # Responses with status 'error'
+        self.failures: Dict[str, int] = {action: 0 for action in ACTIONS}    # Broken connections
+        self.messages: Dict[str, str] = {}  # First error message seen per action
+
+    def record(self, action: str, latency: float, response: Optional[Dict[str, Any]], failure: str = None) -> None:
+        if failure is not None:
+            self.failures[action] += 1
+            self.messages.setdefault(action, failure)
+            return
+        self.latencies[action].append(latency)
+        if response.get('status') != 'success':
+            self.errors[action] += 1
+            self.messages.setdefault(action, str(response.get('message')))
+
+
+def percentile(ordered: List[float], fraction: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class SimulatedUser:
+    """
+    One user repeating the action mix on its own connection.
+    """
+
+    def __init__(self, index: int, users: int, port: int, mix: Dict[str, float], image: bytes, think_time: float):
+        self.index = index
+        self.name = username(index)
+        self.friends = friends_of(index, users)
+        self.strangers = [username(i) for i in range(users) if i != index and username(i) not in self.friends]
+        self.port = port
+        self.actions = [action for action in mix if mix[action] > 0]
+        self.weights = [mix[action] for action in self.actions]
+        self.image = image
+        self.think_time = think_time
+        self.random = random.Random(index)
+        self.client: Optional[AsyncInstaNetClient] = None
+        self.target: Optional[AsyncInstaNetClient] = None  # Logs in as friend request targets to reject them
+
+    async def connect(self) -> None:
+        self.client = await AsyncInstaNetClient.connect('localhost', self.port)
+        self.target = await AsyncInstaNetClient.connect('localhost', self.port)
+        response = await self.client.login(self.name, PASSWORD)
+        if response.get('status') != 'success':
+            raise RuntimeError(f"Login of {self.name} failed: {response.get('message')}")
+
+    async def perform(self, action: str) -> Dict[str, Any]:
+        client = self.client
+        if action == 'login':
+            return await client.login(self.name, PASSWORD)
+        if action == 'feed':
+            return await client.get_feed()
+        if action == 'friend_request':
+            target = self.random.choice(self.strangers or self.friends)
+            response = await client.send_friend_request(target)
+            if response.get('status') == 'success':
+                # Reject it as the target, so the request can be sent again
+                await self.target.login(target, PASSWORD)
+                await self.target.reject_friend_request(self.name)
+            return response
+        if action == 'text_dm':
+            return await client.send_message(self.random.choice(self.friends), f"load test message from {self.name}")
+        if action == 'image_dm':
+            return await client.send_image(self.random.choice(self.friends), self.image)
+        return await client.upload_post(self.image, caption=f"load test post from {self.name}")
+
+    async def run(self, start: float, stop: float, stats: Stats) -> None:
+        """
+        Repeat the mix until stop; only requests started after start are recorded.
+        """
+        while True:
+            now = time.perf_counter()
+            if now >= stop:
+                return
+            action = self.random.choices(self.actions, self.weights)[0]
+            if self.client is None:
+                # The last reconnect failed, so this iteration cannot run
+                if now >= start:
+                    stats.record(action, 0.0, None, failure='Not connected')
+                await self.reconnect()
+                continue
+            try:
+                response = await self.perform(action)
+            except (RuntimeError, OSError) as e:
+                if now >= start:
+                    stats.record(action, 0.0, None, failure=str(e) or type(e).__name__)
+                await self.reconnect()
+                continue
+            if now >= start:
+                stats.record(action, time.perf_counter() - now, response)
+            if self.think_time:
+                await asyncio.sleep(self.random.expovariate(1 / self.think_time))
+
+    async def reconnect(self) -> None:
+        await self.close()
+        try:
+            await self.connect()
+        except (RuntimeError, OSError):
+            await self.close()  # Leave no half-connected user behind
+            await asyncio.sleep(0.1)
+
+    async def close(self) -> None:
+        for client in (self.client, self.target):
+            if client is not None:
+                await client.close()
+        self.client = self.target = None
+
+
+async def sample_rss(server: ServerProcess, samples: List[int], done: asyncio.Event) -> None:
+    while not done.is_set():
+        rss = server.rss()
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(done.wait(), RSS_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(server: ServerProcess, args, image: bytes) -> Dict[str, Any]:
+    """
+    Connect every simulated user, run the mix, and return the measurements.
+    """
+    users = [SimulatedUser(i, args.users, server.port, args.mix, image, args.think_time) for i in range(args.users)]
+    # Connect in batches so the listen backlog is not overrun
+    for i in range(0, len(users), 50):
+        await asyncio.gather(*(user.connect() for user in users[i:i + 50]))
+    rss_before = server.rss()
+    stats = Stats()
+    samples: List[int] = []
+    done = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(server, samples, done))
+    start = time.perf_counter() + args.warmup
+    stop = start + args.duration
+    await asyncio.gather(*(user.run(start, stop, stats) for user in users))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await sampler
+    await asyncio.gather(*(user.close() for user in users))
+
+    actions = {}
+    for action in ACTIONS:
+        latencies = sorted(stats.latencies[action])
+        if not latencies and not stats.failures[action]:
+            continue
+        actions[action] = {
+            'requests': len(latencies),
+            'throughput': len(latencies) / elapsed,
+            'errors': stats.errors[action],
+            'failures': stats.failures[action],
+            'first_error': stats.messages.get(action),
+            'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else None,
+            'p50_ms': 1000 * percentile(latencies, 0.50) if latencies else None,
+            'p95_ms': 1000 * percentile(latencies, 0.95) if latencies else None,
+            'p99_ms': 1000 * percentile(latencies, 0.99) if latencies else None,
+            'max_ms': 1000 * latencies[-1] if latencies else None
+        }
+    total = sum(entry['requests'] for entry in actions.values())
+    return {
+        'elapsed': elapsed,
+        'total_requests': total,
+        'throughput': total / elapsed,
+        'errors': sum(entry['errors'] for entry in actions.values()),
+        'failures': sum(entry['failures'] for entry in actions.values()),
+        'actions': actions,
+        'server_rss': {
+            'before': rss_before,
+            'peak': max(samples) if samples else None,
+            'after': samples[-1] if samples else None
+        }
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_SCRIPT.parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    def ms(value):
+        return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+
+    print(f"\n{'action':<15}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'failed':>8}")
+    for action, entry in result['actions'].items():
+        print(f"{action:<15}{entry['requests']:>9}{entry['throughput']:>9.1f}"
+              f"{ms(entry['p50_ms'])}{ms(entry['p95_ms'])}{ms(entry['p99_ms'])}"
+              f"{entry['errors']:>8}{entry['failures']:>8}")
+    print(f"{'total':<15}{result['total_requests']:>9}{result['throughput']:>9.1f}"
+          f"{'':>27}{result['errors']:>8}{result['failures']:>8}")
+    rss = result['server_rss']
+    if rss['peak'] is not None:
+        print(f"\nServer RSS: {rss['before'] / 2**20:.1f} MB before, {rss['peak'] / 2**20:.1f} MB peak, "
+              f"{rss['after'] / 2**20:.1f} MB after")
+    for action, entry in result['actions'].items():
+        if entry['first_error']:
+            print(f"First {action} error: {entry['first_error']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='InstaNet multi-client load test')
+    parser.add_argument('--users', type=int, default=20, help='Simulated users (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=20, help='Measured seconds (default: %(default)s)')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds before measuring (default: %(default)s)')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Action weights (default: %(default)s)')
+    parser.add_argument('--think-time', type=float, default=0,
+                        help='Mean pause between a user\'s requests, in seconds (default: none)')
+    parser.add_argument('--image-size', type=int, nargs=2, default=(640, 480), metavar=('WIDTH', 'HEIGHT'),
+                        help='Size of uploaded images (default: 640 480)')
+    parser.add_argument('--mode', choices=SERVER_MODES, default=DEFAULT_SERVER_MODE,
+                        help='Server connection handling engine (default: %(default)s)')
+    parser.add_argument('--storage', choices=STORAGE_BACKENDS, default=DEFAULT_STORAGE,
+                        help='Server storage backend (default: %(default)s)')
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/load-<time>.json)')
+    parser.add_argument('--keep-data', action='store_true', help='Keep the server\'s data directory')
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users must be at least 2")
+
+    image = make_image(*args.image_size)
+    data_root = tempfile.mkdtemp(prefix='instanet-load-')
+    print(f"Seeding {args.users} users in {data_root}")
+    seed_data(data_root, args.users, args.storage)
+    server = ServerProcess(data_root, args.mode, args.storage)
+    print(f"Server ({args.mode}, {args.storage}) on port {server.port}; "
+          f"running {args.users} users for {args.warmup:g}s warmup + {args.duration:g}s")
+    try:
+        result = asyncio.run(run_load(server, args, image))
+    finally:
+        server.stop()
+        if not args.keep_data:
+            shutil.rmtree(data_root, ignore_errors=True)
+
+    started = datetime.now()
+    report = {
+        'benchmark': 'load_test',
+        'timestamp': started.isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'users': args.users,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'mix': args.mix,
+            'think_time': args.think_time,
+            'image_bytes': len(image),
+            'mode': args.mode,
+            'storage': args.storage
+        },
+        'results': result
+    }
+    print_report(result)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load-{started:%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,436 @@
+"""
+This module implements microbenchmarks of the server's hot paths.
+
+It times:
+
+- JSON messages sent and received over loopback TCP, from 100 B to 10 MB,
+  with the legacy helpers (`send_json_message`/`receive_json_message`)
+  and with framed `MessageConnection`s
+- image transfers over socketpairs and loopback TCP, with the legacy
+  helpers (`send_image`/`receive_image`) and with framed connections
+- the server's read-modify-write handlers (`handle_send_message`,
+  `handle_add_comment`, and the friend request handlers backed by
+  users.json) on data sets of growing size, with both storage backends
+
+Each benchmark is repeated and its median time per operation is compared
+with the stored baselines in `baselines.json`. The run fails (exit status 1)
+when any benchmark is slower than its baseline by more than the threshold.
+Baselines depend on the machine; record them on the machine that runs the
+comparison with `--save-baseline`.
+
+Example:
+    python benchmarks/microbench.py --filter json/framed
+    python benchmarks/microbench.py --save-baseline
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from socket_utils import (
+    send_json_message, receive_json_message, send_image, receive_image, MessageConnection
+)
+from message_store import MessageLog
+from storage import SqliteStorage, import_json_data
+from constants import DATA_DIRECTORIES, USERS_FILE, POSTS_FILE, MESSAGES_DIR, SQLITE_DB_FILE
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+BASELINES_FILE = BENCHMARKS_DIR / 'baselines.json'
+RESULTS_DIR = BENCHMARKS_DIR / 'results'
+DEFAULT_THRESHOLD = 0.25      # Allowed slowdown over the baseline (25%)
+MIN_TIME = 0.2                # Seconds each repeat should run for
+REPEATS = 5                   # Repeats per benchmark; the median is reported
+JSON_SIZES = (100, 10 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+IMAGE_SIZES = (1024 * 1024, 10 * 1024 * 1024)
+DATA_SIZES = (100, 1000, 10000)  # Users, posts and messages seeded for handler benchmarks
+ACK = {'status': 'success'}
+
+BENCHMARKS: Dict[str, Callable[[], Any]] = {}  # Name -> context manager yielding the operation to time
+
+
+def benchmark(name: str):
+    """
+    Register a context manager that sets up a benchmark and yields its operation.
+    """
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+def format_size(size: int) -> str:
+    for unit, scale in (('MB', 1024 * 1024), ('KB', 1024)):
+        if size >= scale:
+            return f"{size // scale}{unit}"
+    return f"{size}B"
+
+
+def make_payload(size: int) -> Dict[str, Any]:
+    """
+    Build a message shaped like a page of chat messages, about `size` bytes as JSON.
+    """
+    record = {
+        'id': 0, 'sender': 'user1', 'receiver': 'user2', 'message': 'See you at the lab at five?',
+        'timestamp': '2025-05-13T21:51:37.954155', 'is_image': False
+    }
+    record_size = len(json.dumps(record)) + 2
+    base = {'action': 'benchmark', 'messages': [], 'padding': ''}
+    count = max(0, (size - len(json.dumps(base))) // record_size)
+    base['messages'] = [dict(record, id=i) for i in range(count)]
+    base['padding'] = 'x' * max(0, size - len(json.dumps(base)))
+    return base
+
+
+def socket_pair(transport: str):
+    """
+    Return two connected sockets, over 'socketpair' or loopback 'tcp'.
+    """
+    if transport == 'socketpair':
+        return socket.socketpair()
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        client = socket.create_connection(listener.getsockname())
+        server, _ = listener.accept()
+    for sock in (client, server):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return client, server
+
+
+@contextlib.contextmanager
+def echo_pair(transport: str, serve: Callable[[socket.socket], None]) -> Iterator[socket.socket]:
+    """
+    Connect a socket to a thread answering on the other end until it is closed.
+
+    Args:
+        transport (str): 'socketpair' or 'tcp'
+        serve (callable): Called with the other end; answers requests until the connection closes
+    """
+    client, server = socket_pair(transport)
+
+    def run():
+        try:
+            serve(server)
+        except (RuntimeError, OSError):
+            pass  # The benchmark closed its end
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        yield client
+    finally:
+        client.close()
+        thread.join()
+        server.close()
+
+
+def register_socket_benchmarks() -> None:
+    for size in JSON_SIZES:
+        payload = make_payload(size)
+
+        @benchmark(f"json/legacy/{format_size(size)}")
+        @contextlib.contextmanager
+        def json_legacy(payload=payload):
+            def serve(sock):
+                while True:
+                    receive_json_message(sock)
+                    send_json_message(sock, ACK)
+            with echo_pair('tcp', serve) as sock:
+                def op():
+                    send_json_message(sock, payload)
+                    receive_json_message(sock)
+                yield op
+
+        @benchmark(f"json/framed/{format_size(size)}")
+        @contextlib.contextmanager
+        def json_framed(payload=payload):
+            def serve(sock):
+                conn = MessageConnection(sock)
+                while True:
+                    conn.receive_message()
+                    conn.send_message(ACK)
+            with echo_pair('tcp', serve) as sock:
+                conn = MessageConnection(sock)
+                yield lambda: conn.request(payload)
+
+    for transport in ('socketpair', 'tcp'):
+        for size in IMAGE_SIZES:
+            data = os.urandom(size)
+
+            @benchmark(f"image/legacy/{transport}/{format_size(size)}")
+            @contextlib.contextmanager
+            def image_legacy(transport=transport, data=data):
+                def serve(sock):
+                    while True:
+                        receive_image(sock)
+                        send_json_message(sock, ACK)
+                with echo_pair(transport, serve) as sock:
+                    def op():
+                        send_image(sock, data)
+                        receive_json_message(sock)
+                    yield op
+
+            @benchmark(f"image/framed/{transport}/{format_size(size)}")
+            @contextlib.contextmanager
+            def image_framed(transport=transport, data=data):
+                def serve(sock):
+                    conn = MessageConnection(sock)
+                    while True:
+                        conn.receive_message()
+                        conn.receive_image()
+                        conn.send_message(ACK)
+                with echo_pair(transport, serve) as sock:
+                    conn = MessageConnection(sock)
+                    def op():
+                        conn.send_message_with_image({'action': 'benchmark'}, data)
+                        conn.receive_message()
+                    yield op
+
+
+def seed_json_data(size: int) -> None:
+    """
+    Write a JSON data tree with `size` users, posts and messages into the current directory.
+    """
+    for directory in DATA_DIRECTORIES:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+    users = {
+        f"user{i}": {'password': 'pass', 'friends': [], 'requests': []}
+        for i in range(size)
+    }
+    for i in range(1, min(size, 50)):
+        users['user0']['friends'].append(f"user{i}")
+        users[f"user{i}"]['friends'].append('user0')
+    with open(USERS_FILE, 'w') as f:
+        json.dump(users, f, indent=4)
+    posts = [
+        {
+            'username': f"user{i % size}",
+            'image_path': f"data/images/post{i}.jpg",
+            'caption': f"Post number {i}",
+            'timestamp': '2025-05-13 21:52:29',
+            'comments': [{'user': 'user1', 'text': 'Nice!'}]
+        }
+        for i in range(size)
+    ]
+    with open(POSTS_FILE, 'w') as f:
+        json.dump(posts, f, indent=4)
+    messages = MessageLog(MESSAGES_DIR)
+    for i in range(size):
+        messages.append('user0', 'user1', {
+            'sender': 'user0' if i % 2 else 'user1', 'receiver': 'user1' if i % 2 else 'user0',
+            'message': f"Message number {i}", 'timestamp': '2025-05-13T21:51:37.954155', 'is_image': False
+        })
+
+
+@contextlib.contextmanager
+def server_with_data(backend: str, size: int):
+    """
+    Create a server, without serving connections, on a scratch data directory of the given size.
+    """
+    from server import InstagramServer
+
+    cwd = os.getcwd()
+    root = tempfile.mkdtemp(prefix='instanet-bench-')
+    os.chdir(root)
+    server = None
+    try:
+        seed_json_data(size)
+        if backend == 'sqlite':
+            target = SqliteStorage(SQLITE_DB_FILE)
+            import_json_data(target)
+            target.close()
+        with contextlib.redirect_stdout(io.StringIO()):
+            server = InstagramServer(port=None, storage=backend)
+        yield server
+    finally:
+        if server is not None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                server.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def register_handler_benchmarks() -> None:
+    for backend in ('json', 'sqlite'):
+        for size in DATA_SIZES:
+            @benchmark(f"handler/send_message/{backend}/{size}")
+            @contextlib.contextmanager
+            def send_message(backend=backend, size=size):
+                with server_with_data(backend, size) as server:
+                    request = {
+                        'action': 'send_message', 'sender': 'user0', 'receiver': 'user1',
+                        'message': 'Benchmark message', 'timestamp': '2025-05-13T21:51:37.954155',
+                        'is_image': False
+                    }
+                    yield lambda: server.handle_send_message(request)
+
+            @benchmark(f"handler/add_comment/{backend}/{size}")
+            @contextlib.contextmanager
+            def add_comment(backend=backend, size=size):
+                with server_with_data(backend, size) as server:
+                    request = {'action': 'add_comment', 'post_id': size // 2, 'user': 'user1', 'text': 'Nice!'}
+                    yield lambda: server.handle_add_comment(request)
+
+            @benchmark(f"handler/friend_request/{backend}/{size}")
+            @contextlib.contextmanager
+            def friend_request(backend=backend, size=size):
+                with server_with_data(backend, size) as server:
+                    receiver = f"user{size - 1}"
+                    send = {'action': 'send_friend_request', 'sender': 'user0', 'receiver': receiver}
+                    reject = {'action': 'reject_friend_request', 'user': receiver, 'friend': 'user0'}
+                    def op():
+                        server.handle_friend_request(send)
+                        server.handle_reject_friend_request(reject)
+                    yield op
+
+
+register_socket_benchmarks()
+register_handler_benchmarks()
+
+
+def measure(op: Callable[[], Any], min_time: float, repeats: int) -> Dict[str, float]:
+    """
+    Time an operation, calibrating the number of calls so each repeat lasts about min_time.
+
+    Returns:
+        dict: Median, fastest and slowest seconds per call, and calls per repeat
+    """
+    start = time.perf_counter()
+    op()  # Warm up and estimate
+    first = time.perf_counter() - start
+    number = max(1, int(min_time / first)) if first > 0 else 1000
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        times.append((time.perf_counter() - start) / number)
+    return {'median': statistics.median(times), 'min': min(times), 'max': max(times), 'number': number}
+
+
+def machine_info() -> Dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count()
+    }
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def transfer_size(name: str) -> Optional[int]:
+    """
+    Return the bytes moved per operation of a socket benchmark, from its name.
+    """
+    if not name.startswith(('json/', 'image/')):
+        return None
+    label = name.rsplit('/', 1)[1]
+    for unit, scale in (('MB', 1024 * 1024), ('KB', 1024), ('B', 1)):
+        if label.endswith(unit):
+            return int(label[:-len(unit)]) * scale
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='InstaNet microbenchmarks')
+    parser.add_argument('--filter', action='append', default=[],
+                        help='Only run benchmarks whose name contains this text (repeatable)')
+    parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+    parser.add_argument('--quick', action='store_true',
+                        help='Fewer, shorter repeats; results are noisier')
+    parser.add_argument('--baseline', default=str(BASELINES_FILE), help='Baselines file (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed slowdown over the baseline, as a fraction (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store this run\'s results as the baselines instead of comparing')
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/micro-<time>.json)')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.filter or any(f in name for f in args.filter)]
+    if args.list:
+        print('\n'.join(names))
+        return
+    if not names:
+        parser.error("No benchmark matches the filter")
+
+    baselines = {}
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists() and not args.save_baseline:
+        stored = json.loads(baseline_path.read_text())
+        baselines = stored.get('benchmarks', {})
+        if stored.get('machine') != machine_info():
+            print(f"Note: baselines were recorded on a different machine ({stored.get('machine')})")
+
+    min_time, repeats = (MIN_TIME / 4, 3) if args.quick else (MIN_TIME, REPEATS)
+    results: Dict[str, Dict[str, float]] = {}
+    regressions: List[str] = []
+    print(f"{'benchmark':<40}{'time/op':>12}{'MB/s':>10}{'baseline':>12}{'change':>9}")
+    for name in names:
+        with BENCHMARKS[name]() as op:
+            result = measure(op, min_time, repeats)
+        results[name] = result
+        size = transfer_size(name)
+        rate = f"{size / result['median'] / 2**20:10.1f}" if size else f"{'':>10}"
+        line = f"{name:<40}{format_time(result['median']):>12}{rate}"
+        baseline = baselines.get(name)
+        if baseline is not None:
+            change = result['median'] / baseline - 1
+            line += f"{format_time(baseline):>12}{change:>+9.0%}"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        elif not args.save_baseline:
+            line += f"{'new':>12}"
+        print(line, flush=True)
+
+    run = {
+        'benchmark': 'microbench',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'machine': machine_info(),
+        'results': results
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"micro-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(run, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.save_baseline:
+        stored = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        merged = dict(stored.get('benchmarks', {}))
+        merged.update({name: result['median'] for name, result in results.items()})
+        baseline_path.write_text(json.dumps({
+            'timestamp': run['timestamp'],
+            'machine': run['machine'],
+            'benchmarks': dict(sorted(merged.items()))
+        }, indent=2) + '\n')
+        print(f"Baselines saved to {baseline_path}")
+    elif regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
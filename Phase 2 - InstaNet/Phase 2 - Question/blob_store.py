@@ -0,0 +1,255 @@
+"""
+This module implements the content-addressed blob store holding uploaded images.
+
+Every blob is named by the SHA-256 of its bytes and stored in a sharded
+layout, ``<directory>/ab/cd/abcd...``, so no directory grows too large and the
+same image uploaded or forwarded many times is stored once. The hash is
+computed while the data is written, so storing a blob reads it only once.
+
+Each post or message holding a blob counts as a reference. Reference changes
+are appended to ``refs.log`` and the log is compacted when the store is
+opened. Blobs whose last reference was released (and uploads abandoned
+half-way) are removed by `collect_garbage`. Posts and messages are never
+deleted, so a reference is only released when storing the post or message
+fails after its blob was committed; garbage collection therefore only sweeps
+such orphaned writes. A blob the log knows nothing about is never removed,
+so a lost log cannot destroy images.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from constants import BLOBS_DIR
+
+TMP_MAX_AGE = 3600  # Seconds before an unfinished upload's temporary file is removed
+
+
+class BlobWriter:
+    """
+    Writes one blob, hashing it as the data arrives.
+
+    Use it as a context manager; `commit` stores the blob, and leaving the
+    block without committing discards the data.
+
+    Args:
+        store (BlobStore): The store the blob is written to
+    """
+
+    def __init__(self, store: 'BlobStore'):
+        self.store = store
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._tmp_path = os.path.join(store.tmp_dir, f"{os.getpid()}-{threading.get_ident()}-{time.time_ns()}")
+        self._file = open(self._tmp_path, 'wb')
+
+    def __enter__(self) -> 'BlobWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.discard()
+
+    def write(self, data) -> None:
+        """
+        Append data to the blob.
+        """
+        self._digest.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self) -> str:
+        """
+        Store the blob and take a reference to it.
+
+        Returns:
+            str: The blob's digest
+        """
+        self._file.close()
+        return self.store._commit(self._tmp_path, self._digest.hexdigest())
+
+    def discard(self) -> None:
+        """
+        Drop the data if the blob has not been committed.
+        """
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class BlobStore:
+    """
+    Thread-safe, reference-counted store of content-addressed blobs.
+
+    `stored_bytes` is the total size of the stored blobs.
+
+    Args:
+        directory (str): Root directory of the store
+    """
+
+    def __init__(self, directory: str = BLOBS_DIR):
+        self.directory = directory
+        self.tmp_dir = os.path.join(directory, 'tmp')
+        self.refs_path = os.path.join(directory, 'refs.log')
+        self._lock = threading.Lock()
+        self._refs: Dict[str, int] = {}
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._load_refs()
+        self.stored_bytes = sum(os.path.getsize(path) for path in self._blob_paths())
+        self._refs_log = open(self.refs_path, 'a')
+
+    def _load_refs(self) -> None:
+        """
+        Sum the reference log and rewrite it with one line per known blob.
+        """
+        if os.path.exists(self.refs_path):
+            with open(self.refs_path, 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 2 or not line.endswith('\n'):
+                        continue  # Torn final line
+                    digest, delta = parts
+                    self._refs[digest] = self._refs.get(digest, 0) + int(delta)
+        # Released blobs stay listed with a count of 0 until they are collected
+        self._refs = {
+            digest: max(count, 0) for digest, count in self._refs.items()
+            if count > 0 or self.exists(digest)
+        }
+        tmp_path = f"{self.refs_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(f"{digest} {count}\n" for digest, count in self._refs.items())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.refs_path)
+
+    def _log_ref(self, digest: str, delta: int) -> None:
+        """
+        Record a reference change. Must be called with the lock held.
+        """
+        self._refs[digest] = self._refs.get(digest, 0) + delta
+        self._refs_log.write(f"{digest} {delta}\n")
+        self._refs_log.flush()
+
+    def path(self, digest: str) -> str:
+        """
+        Return where a blob is stored.
+        """
+        return os.path.join(self.directory, digest[:2], digest[2:4], digest)
+
+    def digest_of(self, path: str) -> Optional[str]:
+        """
+        Return the digest of a blob given its path (or any path naming a blob).
+
+        Returns:
+            str: The digest, or None if the path does not name a blob
+        """
+        name = os.path.basename(str(path).replace('\\', '/'))
+        if len(name) != 64 or name.strip('0123456789abcdef'):
+            return None
+        return name
+
+    def _blob_paths(self):
+        """
+        Yield the path of every stored blob.
+        """
+        for shard in sorted(os.listdir(self.directory)):
+            shard_path = os.path.join(self.directory, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_path):
+                continue
+            for subshard in os.listdir(shard_path):
+                subshard_path = os.path.join(shard_path, subshard)
+                for digest in os.listdir(subshard_path):
+                    yield os.path.join(subshard_path, digest)
+
+    def exists(self, digest: str) -> bool:
+        """
+        Check whether a blob is stored.
+        """
+        return os.path.isfile(self.path(digest))
+
+    def writer(self) -> BlobWriter:
+        """
+        Start writing a new blob.
+        """
+        return BlobWriter(self)
+
+    def put(self, data: bytes) -> str:
+        """
+        Store a blob held in memory and take a reference to it.
+
+        Returns:
+            str: The blob's digest
+        """
+        with self.writer() as writer:
+            writer.write(data)
+            return writer.commit()
+
+    def _commit(self, tmp_path: str, digest: str) -> str:
+        """
+        Move a written blob into place unless an identical blob is already stored.
+        """
+        path = self.path(digest)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                size = os.path.getsize(tmp_path)
+                os.replace(tmp_path, path)
+                self.stored_bytes += size
+            self._log_ref(digest, 1)
+        return digest
+
+    def retain(self, digest: str) -> None:
+        """
+        Take another reference to a stored blob.
+        """
+        if not self.exists(digest):
+            raise KeyError(digest)
+        with self._lock:
+            self._log_ref(digest, 1)
+
+    def release(self, digest: str) -> None:
+        """
+        Drop a reference to a blob. Blobs left unreferenced are removed by `collect_garbage`.
+        """
+        with self._lock:
+            if self._refs.get(digest, 0) > 0:
+                self._log_ref(digest, -1)
+
+    def collect_garbage(self) -> List[str]:
+        """
+        Remove released blobs that nothing references any more, and
+        temporary files of abandoned uploads.
+
+        Returns:
+            list: Digests of the removed blobs
+        """
+        removed = []
+        for path in self._blob_paths():
+            digest = os.path.basename(path)
+            with self._lock:
+                if self._refs.get(digest) == 0:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    self.stored_bytes -= size
+                    self._refs.pop(digest, None)
+                    removed.append(digest)
+        cutoff = time.time() - TMP_MAX_AGE
+        for name in os.listdir(self.tmp_dir):
+            tmp_path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.path.getmtime(tmp_path) < cutoff:
+                    os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def close(self) -> None:
+        """
+        Close the reference log.
+        """
+        with self._lock:
+            self._refs_log.close()
+
@@ -11,8 +11,9 @@ The module provides:
 - Real-time updates and notifications
 - Image message support
 
-The client communicates with the server using JSON messages over sockets
-and provides a modern, Instagram-like user interface.
+The client talks to the server through the `client_sdk` library, which
+sends JSON messages over sockets, and provides a modern, Instagram-like
+user interface on top of it.
 """
 
 import json
@@ -25,20 +26,24 @@ from datetime import datetime
 import base64
 import sys
 import argparse
-from socket_utils import (
-    create_client_socket, send_json_message, receive_json_message,
-    send_json_message_with_image, receive_json_message_with_image
-)
+from client_sdk import InstaNetClient
+from network_worker import NetworkWorker
+from feed_view import FeedView
+from image_cache import ImageCache
+from client_cache import ClientCache, is_immutable
 from constants import (
     INSTAGRAM_COLORS, FONT_BOLD, FONT_REGULAR, FONT_SMALL,
     DEFAULT_HOST, DEFAULT_PORT, MAX_RETRIES, RETRY_DELAY,
     WINDOW_TITLE, WINDOW_SIZE, LOGIN_FRAME_SIZE,
     INPUT_FIELD_HEIGHT, BUTTON_HEIGHT, CORNER_RADIUS, PADDING,
-    MESSAGE_BUBBLE_RADIUS, MESSAGE_WRAP_LENGTH, MESSAGE_PADDING, MESSAGE_VERTICAL_PADDING
+    MESSAGE_BUBBLE_RADIUS, MESSAGE_WRAP_LENGTH, MESSAGE_PADDING, MESSAGE_VERTICAL_PADDING,
+    MESSAGES_PAGE_SIZE, CHAT_POLL_INTERVAL, FEED_PAGE_SIZE, IMAGE_CACHE_BUDGET,
+    CLIENT_CACHE_DIR, CLIENT_CACHE_SIZE
 )
 import io
 import os
 import shutil
+import threading
 from pathlib import Path
 
 class InstagramClient:
@@ -54,7 +59,9 @@ class InstagramClient:
     - Messaging functionality
     """
     
-    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY,
+                 legacy_protocol=False, image_cache_budget=IMAGE_CACHE_BUDGET,
+                 cache_dir=CLIENT_CACHE_DIR, cache_size=CLIENT_CACHE_SIZE):
         """
         Initialize the Instagram client.
         
@@ -63,35 +70,116 @@ class InstagramClient:
             port (int): The server port number
             max_retries (int): Maximum number of connection retries
             retry_delay (int): Delay between retries in seconds
+            legacy_protocol (bool): Send bare JSON messages for servers without framing support
+            image_cache_budget (int): Bytes of decoded images to keep in memory
+            cache_dir (str): Directory of the on-disk cache of images and responses
+            cache_size (int): Bytes the on-disk cache may use
         """
         self.host = host
         self.port = port
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.legacy_protocol = legacy_protocol
         self.connected = False
         self.current_user = None
-        self.socket = None
+        self.api = None  # Client SDK connection, used on the network thread
         self.last_message_timestamp = None
+        self.chat_messages = []  # Messages of the open chat, oldest first
+        self.first_message_widget = None  # Bubble of the oldest message shown
+        self.load_earlier_button = None
+        self.chat_has_more = False  # Whether older messages exist on the server
+        self.current_chat_friend = None
+        self.chat_refresh_job = None  # Pending poll while push updates are unavailable
+        self.push_client = None  # Second connection receiving server events
+        server_dir = f"{host}_{port}".replace(':', '_')
+        self.cache = ClientCache(os.path.join(os.path.expanduser(cache_dir), server_dir), cache_size)
+        self.image_cache = ImageCache(image_cache_budget)  # Decoded images, shared by all pages
         self.setup_gui()
+        self.worker = NetworkWorker(self.root)  # Runs all server I/O off the Tk thread
         self.connect_to_server()
 
     def connect_to_server(self):
         """
-        Establish connection to the server with retry logic.
+        Establish connection to the server with retry logic, on the network thread.
+        
+        Requests submitted meanwhile are queued behind the connection attempt.
+        If it fails after all retries, an error is shown and the client exits.
+        """
+        self.worker.submit(self.open_connection, errback=self.connection_failed)
+
+    def open_connection(self):
+        """
+        Open the connection to the server. Runs on the network thread.
         
         Raises:
             RuntimeError: If connection fails after all retries
         """
-        try:
-            self.socket = create_client_socket(self.host, self.port, self.max_retries, self.retry_delay)
-            self.connected = True
-            print(f"Connected to server at {self.host}:{self.port}")
-        except RuntimeError as e:
-            print(str(e))
-            messagebox.showerror("Connection Error", 
-                               f"Could not connect to server at {self.host}:{self.port}\n"
-                               "Please make sure the server is running and try again.")
-            sys.exit(1)
+        self.api = InstaNetClient(self.host, self.port, framed=not self.legacy_protocol,
+                                  max_retries=self.max_retries, retry_delay=self.retry_delay)
+        self.connected = True
+        print(f"Connected to server at {self.host}:{self.port}")
+
+    def close_connection(self):
+        """
+        Close the connection to the server. Runs on the network thread.
+        """
+        if self.api:
+            self.api.close()
+        self.connected = False
+
+    def connection_failed(self, error):
+        """
+        Report that the server could not be reached and exit.
+        
+        Args:
+            error (Exception): The error raised while connecting
+        """
+        print(str(error))
+        messagebox.showerror("Connection Error", 
+                           f"Could not connect to server at {self.host}:{self.port}\n"
+                           "Please make sure the server is running and try again.")
+        sys.exit(1)
+
+    def call_api(self, action, args, kwargs):
+        """
+        Call a client SDK action on the current connection. Runs on the network thread.
+        
+        The action is looked up when the call runs, since reconnecting
+        replaces the connection.
+        
+        Args:
+            action (str): Name of the `InstaNetClient` method to call
+            args (tuple): Positional arguments of the call
+            kwargs (dict): Keyword arguments of the call
+            
+        Returns:
+            dict: The server's response
+        """
+        return getattr(self.api, action)(*args, **kwargs)
+
+    def request_async(self, action, *args, callback, errback=None, **kwargs):
+        """
+        Call a client SDK action in the background.
+        
+        Args:
+            action (str): Name of the `InstaNetClient` method to call
+            *args, **kwargs: Arguments of the call
+            callback (callable): Called on the Tk thread with the response
+            errback (callable, optional): Called on the Tk thread if the
+                connection fails; defaults to showing an error
+        """
+        self.worker.submit(self.call_api, action, args, kwargs,
+                           callback=callback, errback=errback or self.show_network_error)
+
+    def show_network_error(self, error):
+        """
+        Report a request that failed because of the connection.
+        
+        Args:
+            error (Exception): The error raised by the request
+        """
+        print(f"Request failed: {error}")
+        messagebox.showerror("Connection Error", f"Request to the server failed: {error}")
 
     def send_message(self, friend):
         """
@@ -99,38 +187,28 @@ class InstagramClient:
         
         Args:
             friend (str): The username of the friend to message
-            
-        Raises:
-            RuntimeError: If message sending fails
         """
         message = self.message_entry.get()
         if message:
-            request = {
-                'action': 'send_message',
-                'sender': self.current_user,
-                'receiver': friend,
-                'message': message,
-                'timestamp': datetime.now().isoformat(),
-                'is_image': False
-            }
-            send_json_message(self.socket, request)
-            response = receive_json_message(self.socket)
-
-            if response['status'] == 'success':
-                self.message_entry.delete(0, tk.END)
-                self.load_messages(friend)
-            else:
-                messagebox.showerror("Error", "Failed to send message")
+            def on_response(response):
+                if response['status'] == 'success':
+                    if self.message_entry.winfo_exists():
+                        self.message_entry.delete(0, tk.END)
+                    self.refresh_messages(friend)
+                else:
+                    messagebox.showerror("Error", "Failed to send message")
+            
+            self.request_async('send_message', friend, message, callback=on_response)
 
     def send_image(self, friend):
         """
         Send an image to a friend.
         
+        The image is uploaded in the background, so the chat stays usable
+        while it is sent.
+        
         Args:
             friend (str): The username of the friend to send the image to
-            
-        Raises:
-            RuntimeError: If image sending fails
         """
         file_path = filedialog.askopenfilename(
             title="Select Image",
@@ -138,28 +216,16 @@ class InstagramClient:
         )
         
         if file_path:
-            try:
-                with open(file_path, 'rb') as f:
-                    image_data = f.read()
-                
-                request = {
-                    'action': 'send_message',
-                    'sender': self.current_user,
-                    'receiver': friend,
-                    'message': "Image",
-                    'timestamp': datetime.now().isoformat(),
-                    'is_image': True
-                }
-                
-                send_json_message_with_image(self.socket, request, image_data)
-                response = receive_json_message(self.socket)
-                
+            def on_response(response):
                 if response['status'] == 'success':
-                    self.load_messages(friend)
+                    self.refresh_messages(friend)
                 else:
                     messagebox.showerror("Error", "Failed to send image")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to send image: {str(e)}")
+            
+            def on_error(error):
+                messagebox.showerror("Error", f"Failed to send image: {str(error)}")
+            
+            self.request_async('send_image', friend, file_path, callback=on_response, errback=on_error)
 
     def reconnect(self):
         """
@@ -168,8 +234,7 @@ class InstagramClient:
         This is called when the connection is lost and the user needs to
         re-establish communication with the server.
         """
-        if self.socket:
-            self.socket.close()
+        self.worker.submit(self.close_connection)
         self.connect_to_server()
 
     def setup_gui(self):
@@ -287,25 +352,97 @@ class InstagramClient:
         username = self.username_entry.get().lower()
         password = self.password_entry.get()
 
-        request = {
-            'action': 'login',
-            'username': username,
-            'password': password
-        }
-
-        self.socket.send(json.dumps(request).encode('utf-8'))
-        response = json.loads(self.socket.recv(4096).decode('utf-8'))
-
-        if response['status'] == 'success':
-            self.current_user = username
-            self.login_frame.place_forget()
-            self.top_bar.pack(side="top", fill="x")
-            self.content_frame.pack(expand=True, fill="both")
-            self.nav_bar.pack(side="bottom", fill="x")
-            self.upload_btn.place(relx=0.5, rely=0.93, anchor="center")
-            self.show_home()
-        else:
-            messagebox.showerror("Error", "Invalid credentials")
+        def on_response(response):
+            if response['status'] == 'success':
+                self.current_user = username
+                self.start_push_listener(password)
+                self.login_frame.place_forget()
+                self.top_bar.pack(side="top", fill="x")
+                self.content_frame.pack(expand=True, fill="both")
+                self.nav_bar.pack(side="bottom", fill="x")
+                self.upload_btn.place(relx=0.5, rely=0.93, anchor="center")
+                self.show_home()
+            else:
+                messagebox.showerror("Error", "Invalid credentials")
+
+        self.request_async('login', username, password, callback=on_response)
+
+    def start_push_listener(self, password):
+        """
+        Open a second connection on which the server pushes new messages.
+        
+        Args:
+            password (str): The current user's password, used to log in the connection
+            
+        The connection is opened on its own thread. If the server does not
+        support push (or the connection fails), the chat view falls back to
+        polling.
+        """
+        threading.Thread(target=self.listen_for_events, args=(self.current_user, password), daemon=True).start()
+
+    def listen_for_events(self, username, password):
+        """
+        Subscribe to server events and hand them to the Tk main loop.
+        
+        Args:
+            username (str): The user to subscribe as
+            password (str): The user's password
+        """
+        try:
+            listener = InstaNetClient(self.host, self.port, framed=not self.legacy_protocol,
+                                      max_retries=1, retry_delay=0)
+        except RuntimeError as e:
+            print(f"Push updates unavailable: {e}")
+            return
+        try:
+            response = listener.login(username, password)
+            if response['status'] == 'success':
+                response = listener.subscribe()
+            if response['status'] != 'success':
+                print(f"Push updates unavailable: {response.get('message')}")
+                return
+            self.push_client = listener
+            if self.current_user != username:
+                return  # Logged out while subscribing
+            while True:
+                event = listener.next_event()
+                self.worker.call_soon(self.handle_push_event, event)
+        except RuntimeError:
+            pass  # Closed on logout or by the server
+        finally:
+            if self.push_client is listener:
+                self.push_client = None
+            listener.close()
+
+    def stop_push_listener(self):
+        """
+        Close the push connection, if any.
+        """
+        if self.push_client is not None:
+            listener, self.push_client = self.push_client, None
+            listener.close()
+
+    def handle_push_event(self, event):
+        """
+        Apply a server-pushed event to the UI.
+        
+        Args:
+            event (dict): The pushed event
+        """
+        if event.get('event') != 'new_message':
+            return
+        message = event['message']
+        friend = self.current_chat_friend
+        if friend is None or not self.messages_area.winfo_exists():
+            return
+        if {message['sender'], message['receiver']} != {self.current_user, friend}:
+            return
+        last_id = self.chat_messages[-1]['id'] if self.chat_messages else -1
+        if message['id'] == last_id + 1:
+            self.append_messages([message])
+        elif message['id'] > last_id:
+            # Missed an event; fetch everything after the last message shown
+            self.refresh_messages(friend)
 
     def show_home(self):
         """
@@ -317,78 +454,133 @@ class InstagramClient:
         self.clear_content()
         self.nav_bar.pack(side="bottom", fill="x")
         self.upload_btn.place(relx=0.5, rely=0.93, anchor="center")
-        scrollable_feed = ctk.CTkScrollableFrame(self.content_frame, fg_color="transparent")
-        scrollable_feed.pack(fill="both", expand=True, padx=0, pady=0)
-        
-        # Load posts from local JSON file
-        try:
-            with open('data/posts/posts.json', 'r') as f:
-                posts = json.load(f)
-            
-            # Display posts in reverse chronological order
-            for post in reversed(posts):
-                self.create_post_widget(post, parent=scrollable_feed)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load feed: {str(e)}")
-
-    def create_post_widget(self, post, parent=None):
-        """
-        Create a widget for displaying a post.
-        """
-        if parent is None:
-            parent = self.content_frame
-        post_frame = ctk.CTkFrame(
-            parent,
-            fg_color="transparent",
-            corner_radius=10
+        feed = FeedView(
+            self.content_frame,
+            fetch_page=self.fetch_feed_page,
+            fetch_image=lambda image_path, done: self.load_photo(image_path, 'feed', done)
         )
-        post_frame.pack(fill="x", padx=20, pady=10)
+        feed.pack(fill="both", expand=True, padx=0, pady=0)
 
-        # Username and timestamp
-        header_frame = ctk.CTkFrame(post_frame, fg_color="transparent")
-        header_frame.pack(fill="x", padx=10, pady=(10, 5))
+    def fetch_feed_page(self, before, done, author=None):
+        """
+        Fetch a page of the feed from the server in the background.
         
-        username_label = ctk.CTkLabel(
-            header_frame,
-            text=post['username'],
-            font=("Helvetica", 14, "bold"),
-            text_color="#000000"
-        )
-        username_label.pack(side="left")
+        Args:
+            before (int): Id of the oldest post already shown, or None for the newest page
+            done (callable): Called on the Tk thread with the posts (None if
+                the request failed) and whether older posts exist
+            author (str, optional): Only fetch this user's posts
+        """
+        # Show the newest page from the cache right away, then update it from the server
+        key = f"feed:{self.current_user}:{author or ''}"
+        cached = self.cache.get_response(key) if before is None else None
+        if cached is not None:
+            done(cached['posts'], cached['has_more'])
+        
+        def on_response(response):
+            if response.get('status') != 'success':
+                if cached is None:
+                    messagebox.showerror("Error", f"Failed to load feed: {response.get('message', 'Unknown error')}")
+                    done(None, False)
+                return
+            posts, has_more = response['posts'], response.get('has_more', False)
+            if before is None:
+                self.cache.put_response(key, {'posts': posts, 'has_more': has_more})
+            done(posts, has_more, replace=cached is not None)
+        
+        def on_error(error):
+            if cached is None:
+                self.show_network_error(error)
+                done(None, False)
+            else:
+                print(f"Failed to refresh feed: {error}")
         
-        timestamp_label = ctk.CTkLabel(
-            header_frame,
-            text=post['timestamp'],
-            font=("Helvetica", 10)
-        )
-        timestamp_label.pack(side="right")
+        self.request_async('get_feed', limit=FEED_PAGE_SIZE, before=before, author=author,
+                           callback=on_response, errback=on_error)
 
-        # Image
-        try:
-            image_path = post['image_path']
-            if os.path.exists(image_path):
-                image = Image.open(image_path)
-                image = image.resize((400, 400), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(image)
-                image_label = ctk.CTkLabel(post_frame, image=photo, text="")
-                image_label.image = photo
-                image_label.pack(pady=5)
+    def fetch_image(self, image_path, size=None):
+        """
+        Download and decode an image. Runs on the network thread.
+        
+        Downloaded images are kept in the client cache. A cached copy of a
+        content-addressed image is used as is; any other cached copy is
+        revalidated with its content hash, so an unchanged image is not
+        transferred again.
+        
+        Args:
+            image_path (str): The image path stored with a post or message
+            size (str, optional): A derivative such as 'feed' or 'chat'
+            
+        Returns:
+            PIL.Image.Image: The image, or None if the server could not provide it
+        """
+        cached = self.cache.get_image(image_path, size)
+        if cached is not None and is_immutable(image_path):
+            data = cached[1]
+        else:
+            response = self.api.get_image(image_path, size=size, etag=cached[0] if cached else None)
+            data = response.get('image_bytes')
+            if response.get('status') == 'not_modified' and cached is not None:
+                data = cached[1]
+            elif response.get('status') == 'success' and data is not None:
+                self.cache.put_image(image_path, size, response['etag'], data)
             else:
-                ctk.CTkLabel(post_frame, text="Image not found", font=("Helvetica", 12)).pack(pady=5)
-        except Exception as e:
-            print(f"Error loading image: {e}")
-            ctk.CTkLabel(post_frame, text="Error loading image", font=("Helvetica", 12)).pack(pady=5)
-
-        # Caption
-        if post.get('caption'):
-            caption_label = ctk.CTkLabel(
-                post_frame,
-                text=post['caption'],
-                font=("Helvetica", 12),
-                text_color="#000000",
-                wraplength=400
-            )
-            caption_label.pack(padx=10, pady=5)
+                print(f"Error fetching image {image_path}: {response.get('message', 'Unknown error')}")
+                return None
+        image = Image.open(io.BytesIO(data))
+        image.load()  # Decode here rather than on the Tk thread
+        return image
+
+    def load_photo(self, image_path, size, done):
+        """
+        Get an image ready to show, from the decoded image cache or else downloaded in the background.
+        
+        Args:
+            image_path (str): The image path stored with a post or message
+            size (str): The derivative to show
+            done (callable): Called on the Tk thread with the PhotoImage, or
+                None if it could not be loaded; called right away on a cache hit
+        """
+        key = (image_path, size)
+        photo = self.image_cache.get(key)
+        if photo is not None:
+            done(photo)
+            return
+        
+        def on_image(image):
+            if image is None:
+                done(None)
+                return
+            photo = ImageTk.PhotoImage(image)
+            self.image_cache.put(key, photo)
+            done(photo)
+        
+        def on_error(error):
+            print(f"Error loading image: {error}")
+            done(None)
+        
+        self.worker.submit(self.fetch_image, image_path, size, callback=on_image, errback=on_error)
+
+    def load_image_async(self, label, image_path, size, error_text="Error loading image"):
+        """
+        Show an image in label, downloading it in the background if it is not cached.
+        
+        Args:
+            label: The label showing a placeholder until the image is loaded
+            image_path (str): The image path stored with a post or message
+            size (str): The derivative to show
+            error_text (str): Text shown in the label if the image cannot be loaded
+        """
+        def on_photo(photo):
+            if not label.winfo_exists():
+                return
+            if photo is None:
+                label.configure(text=error_text)
+                return
+            label.configure(image=photo, text="")
+            label.image = photo  # Keep a reference
+
+        self.load_photo(image_path, size, on_photo)
 
     def show_search(self):
         """
@@ -425,11 +617,9 @@ class InstagramClient:
         search_button.pack(side="right", padx=5)
         
         # Get all users
-        request = {'action': 'get_all_users'}
-        send_json_message(self.socket, request)
-        response = receive_json_message(self.socket)
-        
-        if response['status'] == 'success':
+        def on_response(response):
+            if response['status'] != 'success' or not search_frame.winfo_exists():
+                return
             users_frame = ctk.CTkScrollableFrame(self.content_frame, fg_color="transparent")
             users_frame.pack(fill="both", expand=True, padx=20, pady=10)
             
@@ -452,6 +642,8 @@ class InstagramClient:
                         height=30,
                         command=lambda u=user: self.send_friend_request(u)
                     ).pack(side="right", padx=10)
+        
+        self.request_async('get_all_users', callback=on_response)
 
     def show_friend_requests(self):
         """
@@ -480,86 +672,69 @@ class InstagramClient:
         )
         requests_label.pack(pady=(10, 5), anchor="w")
         
-        # Get user data to check requests
-        request = {
-            'action': 'get_user_data',
-            'username': self.current_user
-        }
-        send_json_message(self.socket, request)
-        response = receive_json_message(self.socket)
-        
-        if response['status'] == 'success':
-            requests = response['user_data'].get('requests', [])
-            if not requests:
-                ctk.CTkLabel(
-                    main_frame,
-                    text="No pending friend requests",
-                    font=("Helvetica", 14),
-                    text_color="#000000"
-                ).pack(pady=10)
-            else:
-                for requester in requests:
-                    request_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-                    request_frame.pack(fill="x", pady=5)
-                    
+        def on_response(responses):
+            if not main_frame.winfo_exists():
+                return
+            response, users_response = responses
+            
+            if response['status'] == 'success':
+                requests = response['user_data'].get('requests', [])
+                if not requests:
                     ctk.CTkLabel(
-                        request_frame,
-                        text=requester,
+                        main_frame,
+                        text="No pending friend requests",
                         font=("Helvetica", 14),
                         text_color="#000000"
-                    ).pack(side="left", padx=10)
-                    
-                    ctk.CTkButton(
-                        request_frame,
-                        text="Accept",
-                        width=80,
-                        height=30,
-                        fg_color=INSTAGRAM_COLORS["primary"],
-                        hover_color=INSTAGRAM_COLORS["primary_hover"],
-                        command=lambda r=requester: self.accept_friend_request(r)
-                    ).pack(side="right", padx=5)
-                    
-                    ctk.CTkButton(
-                        request_frame,
-                        text="Reject",
-                        width=80,
-                        height=30,
-                        fg_color="#ff4444",
-                        hover_color="#ff6666",
-                        command=lambda r=requester: self.reject_friend_request(r)
-                    ).pack(side="right", padx=5)
-        
-        # Divider line
-        divider = ctk.CTkFrame(main_frame, height=1, fg_color="#dbdbdb")
-        divider.pack(fill="x", pady=20)
-        
-        # Available Users Section
-        users_label = ctk.CTkLabel(
-            main_frame,
-            text="Add Friends",
-            font=("Helvetica", 18, "bold"),
-            text_color="#000000"
-        )
-        users_label.pack(pady=(0, 5), anchor="w")
-        
-        # Get all users
-        request = {'action': 'get_all_users'}
-        send_json_message(self.socket, request)
-        response = receive_json_message(self.socket)
-        
-        if response['status'] == 'success':
-            # Get current user's friends
-            request = {
-                'action': 'get_user_data',
-                'username': self.current_user
-            }
-            send_json_message(self.socket, request)
-            user_response = receive_json_message(self.socket)
+                    ).pack(pady=10)
+                else:
+                    for requester in requests:
+                        request_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+                        request_frame.pack(fill="x", pady=5)
+                        
+                        ctk.CTkLabel(
+                            request_frame,
+                            text=requester,
+                            font=("Helvetica", 14),
+                            text_color="#000000"
+                        ).pack(side="left", padx=10)
+                        
+                        ctk.CTkButton(
+                            request_frame,
+                            text="Accept",
+                            width=80,
+                            height=30,
+                            fg_color=INSTAGRAM_COLORS["primary"],
+                            hover_color=INSTAGRAM_COLORS["primary_hover"],
+                            command=lambda r=requester: self.accept_friend_request(r)
+                        ).pack(side="right", padx=5)
+                        
+                        ctk.CTkButton(
+                            request_frame,
+                            text="Reject",
+                            width=80,
+                            height=30,
+                            fg_color="#ff4444",
+                            hover_color="#ff6666",
+                            command=lambda r=requester: self.reject_friend_request(r)
+                        ).pack(side="right", padx=5)
+            
+            # Divider line
+            divider = ctk.CTkFrame(main_frame, height=1, fg_color="#dbdbdb")
+            divider.pack(fill="x", pady=20)
+            
+            # Available Users Section
+            users_label = ctk.CTkLabel(
+                main_frame,
+                text="Add Friends",
+                font=("Helvetica", 18, "bold"),
+                text_color="#000000"
+            )
+            users_label.pack(pady=(0, 5), anchor="w")
             
-            if user_response['status'] == 'success':
-                current_friends = user_response['user_data'].get('friends', [])
+            if users_response['status'] == 'success' and response['status'] == 'success':
+                current_friends = response['user_data'].get('friends', [])
                 
-                for user in response['users']:
+                for user in users_response['users']:
                     if user != self.current_user and user not in current_friends:
                         user_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
                         user_frame.pack(fill="x", pady=5)
@@ -578,6 +753,20 @@ class InstagramClient:
                             height=30,
                             command=lambda u=user: self.send_friend_request(u)
                         ).pack(side="right", padx=10)
+        
+        # Get user data (requests and friends) and all users in one round of requests
+        self.worker.submit(self.fetch_friend_data, callback=on_response, errback=self.show_network_error)
+
+    def fetch_friend_data(self):
+        """
+        Fetch the data shown on the friend requests page. Runs on the network thread.
+        
+        Returns:
+            tuple: The responses to get_user_data and get_all_users
+        """
+        user_response = self.api.get_user_data()
+        users_response = self.api.get_all_users()
+        return user_response, users_response
 
     def accept_friend_request(self, requester):
         """
@@ -586,22 +775,17 @@ class InstagramClient:
         Args:
             requester (str): The username of the person who sent the request
         """
-        request = {
-            'action': 'accept_friend_request',
-            'user': self.current_user,
-            'friend': requester
-        }
-        send_json_message(self.socket, request)
-        response = receive_json_message(self.socket)
-        
-        if response['status'] == 'success':
-            # Refresh the requests view while maintaining navigation state
-            current_page = self.page_stack[-1]
-            self.show_friend_requests()
-            if current_page not in self.page_stack:
-                self.page_stack.append(current_page)
-        else:
-            messagebox.showerror("Error", "Failed to accept friend request")
+        def on_response(response):
+            if response['status'] == 'success':
+                # Refresh the requests view while maintaining navigation state
+                current_page = self.page_stack[-1]
+                self.show_friend_requests()
+                if current_page not in self.page_stack:
+                    self.page_stack.append(current_page)
+            else:
+                messagebox.showerror("Error", "Failed to accept friend request")
+        
+        self.request_async('accept_friend_request', requester, callback=on_response)
 
     def reject_friend_request(self, requester):
         """
@@ -610,22 +794,17 @@ class InstagramClient:
         Args:
             requester (str): The username of the person who sent the request
         """
-        request = {
-            'action': 'reject_friend_request',
-            'user': self.current_user,
-            'friend': requester
-        }
-        send_json_message(self.socket, request)
-        response = receive_json_message(self.socket)
-        
-        if response['status'] == 'success':
-            # Refresh the requests view while maintaining navigation state
-            current_page = self.page_stack[-1]
-            self.show_friend_requests()
-            if current_page not in self.page_stack:
-                self.page_stack.append(current_page)
-        else:
-            messagebox.showerror("Error", "Failed to reject friend request")
+        def on_response(response):
+            if response['status'] == 'success':
+                # Refresh the requests view while maintaining navigation state
+                current_page = self.page_stack[-1]
+                self.show_friend_requests()
+                if current_page not in self.page_stack:
+                    self.page_stack.append(current_page)
+            else:
+                messagebox.showerror("Error", "Failed to reject friend request")
+        
+        self.request_async('reject_friend_request', requester, callback=on_response)
 
     def send_friend_request(self, user):
         """
@@ -634,18 +813,13 @@ class InstagramClient:
         Args:
             user (str): The username to send the request to
         """
-        request = {
-            'action': 'send_friend_request',
-            'sender': self.current_user,
-            'receiver': user
-        }
-        send_json_message(self.socket, request)
-        response = receive_json_message(self.socket)
+        def on_response(response):
+            if response['status'] == 'success':
+                messagebox.showinfo("Success", "Friend request sent")
+            else:
+                messagebox.showerror("Error", "Failed to send friend request")
         
-        if response['status'] == 'success':
-            messagebox.showinfo("Success", "Friend request sent")
-        else:
-            messagebox.showerror("Error", "Failed to send friend request")
+        self.request_async('send_friend_request', user, callback=on_response)
 
     def start_chat(self, friend):
         """
@@ -702,7 +876,7 @@ class InstagramClient:
         self.caption_entry.pack(pady=10)
         
         # Upload button
-        upload_button = ctk.CTkButton(
+        self.upload_button = ctk.CTkButton(
             upload_frame,
             text="Upload",
             width=200,
@@ -711,7 +885,7 @@ class InstagramClient:
             hover_color=INSTAGRAM_COLORS["primary_hover"],
             command=self.post_image
         )
-        upload_button.pack(pady=10)
+        self.upload_button.pack(pady=10)
 
     def choose_image(self):
         """
@@ -728,9 +902,13 @@ class InstagramClient:
         )
         if file_path:
             try:
-                image = Image.open(file_path)
-                image = image.resize((300, 300), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(image)
+                key = (file_path, os.path.getmtime(file_path), 'upload_preview')
+                photo = self.image_cache.get(key)
+                if photo is None:
+                    image = Image.open(file_path)
+                    image = image.resize((300, 300), Image.Resampling.LANCZOS)
+                    photo = ImageTk.PhotoImage(image)
+                    self.image_cache.put(key, photo)
                 self.image_preview.configure(image=photo, text="")
                 self.image_preview.image = photo
                 self.selected_image_path = file_path
@@ -740,41 +918,38 @@ class InstagramClient:
     def post_image(self):
         """
         Upload the selected image to the server.
+        
+        The image is streamed in the background; the upload button is
+        disabled until the server has answered.
         """
         if not self.selected_image_path:
             messagebox.showerror("Error", "Please select an image first")
             return
             
-        try:
-            # Read the image file
-            with open(self.selected_image_path, 'rb') as f:
-                image_data = f.read()
-            
-            # Get caption
-            caption = self.caption_entry.get()
-            
-            # Prepare the upload request
-            request = {
-                'action': 'upload_post',
-                'username': self.current_user,
-                'caption': caption,
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            
-            # Send the request and image data
-            send_json_message_with_image(self.socket, request, image_data)
-            
-            # Wait for server response
-            response = receive_json_message(self.socket)
-            
+        # Get caption
+        caption = self.caption_entry.get()
+        
+        # Keep the button disabled while the image uploads
+        upload_button = self.upload_button
+        upload_button.configure(state="disabled", text="Uploading...")
+        
+        def on_response(response):
+            if upload_button.winfo_exists():
+                upload_button.configure(state="normal", text="Upload")
             if response['status'] == 'success':
                 messagebox.showinfo("Success", "Image uploaded successfully")
                 self.show_home()  # Refresh feed
             else:
                 messagebox.showerror("Error", response.get('message', 'Failed to upload image'))
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to upload image: {str(e)}")
+        
+        def on_error(error):
+            if upload_button.winfo_exists():
+                upload_button.configure(state="normal", text="Upload")
+            messagebox.showerror("Error", f"Failed to upload image: {str(error)}")
+        
+        # Send the request and stream the image file
+        self.request_async('upload_post', self.selected_image_path, caption=caption,
+                           callback=on_response, errback=on_error)
 
     def show_messages(self, selected_friend=None):
         """
@@ -813,14 +988,9 @@ class InstagramClient:
             ).pack(side="left")
             
             # Get user data to show friends
-            request = {
-                'action': 'get_user_data',
-                'username': self.current_user
-            }
-            send_json_message(self.socket, request)
-            response = receive_json_message(self.socket)
-            
-            if response['status'] == 'success':
+            def on_response(response):
+                if response['status'] != 'success' or not friends_frame.winfo_exists():
+                    return
                 friends = response['user_data'].get('friends', [])
                 if not friends:
                     ctk.CTkLabel(
@@ -848,10 +1018,15 @@ class InstagramClient:
                             command=lambda f=friend: self.start_chat(f)
                         )
                         friend_button.pack(pady=2, padx=10)
+            
+            self.request_async('get_user_data', callback=on_response)
         
         else:
             # Full-width chat area when a friend is selected
             self.current_chat_friend = selected_friend
+            self.chat_messages = []
+            self.first_message_widget = None
+            self.load_earlier_button = None
             
             # Chat header with friend's name
             chat_header = ctk.CTkFrame(messages_frame, fg_color="white", height=60)
@@ -912,10 +1087,15 @@ class InstagramClient:
             
             # Load existing messages
             self.load_messages(selected_friend)
-            # Start auto-refresh
-            self.auto_refresh_chat()
+            # New messages are pushed by the server; poll only without push
+            if self.chat_refresh_job is not None:
+                self.root.after_cancel(self.chat_refresh_job)
+                self.chat_refresh_job = None
+            if self.push_client is None:
+                self.chat_refresh_job = self.root.after(CHAT_POLL_INTERVAL, self.auto_refresh_chat)
 
-    def add_message_bubble(self, parent, sender, text, time_str, sent_by_me, is_image=False, image_path=None):
+    def add_message_bubble(self, parent, sender, text, time_str, sent_by_me, is_image=False, image_path=None,
+                           before=None):
         """
         Add a message bubble to the chat.
         
@@ -927,10 +1107,14 @@ class InstagramClient:
             sent_by_me (bool): Whether the message was sent by the current user
             is_image (bool): Whether the message contains an image
             image_path (str): Path to the image file if is_image is True
+            before (optional): Insert the bubble above this widget instead of at the bottom
+            
+        Returns:
+            The frame holding the whole message
         """
         # Create a container frame for the entire message
         message_container = ctk.CTkFrame(parent, fg_color="transparent")
-        message_container.pack(fill="x", pady=5)
+        message_container.pack(fill="x", pady=5, before=before)
         
         if sent_by_me:
             # Right-aligned for current user's messages
@@ -956,23 +1140,15 @@ class InstagramClient:
         bubble.pack(padx=10)
         
         if is_image and image_path:
-            try:
-                # Load and resize image
-                image = Image.open(image_path)
-                image.thumbnail((300, 300))  # Resize while maintaining aspect ratio
-                photo = ImageTk.PhotoImage(image)
-                
-                # Create image label
-                image_label = ctk.CTkLabel(
-                    bubble,
-                    image=photo,
-                    text=""
-                )
-                image_label.image = photo  # Keep a reference
-                image_label.pack(padx=15, pady=8)
-            except Exception as e:
-                print(f"Error loading image: {e}")
-                text = "Failed to load image"
+            # Create image label; the server-rendered chat derivative is filled in once downloaded
+            image_label = ctk.CTkLabel(
+                bubble,
+                text="Loading image...",
+                font=("Helvetica", 12),
+                text_color=text_color
+            )
+            image_label.pack(padx=15, pady=8)
+            self.load_image_async(image_label, image_path, 'chat', error_text="Failed to load image")
             message_label = ctk.CTkLabel(
                 bubble,
                 text=text,
@@ -1002,56 +1178,238 @@ class InstagramClient:
             text_color=INSTAGRAM_COLORS["text_subtle"]
         )
         time_label.pack(pady=2)
+        return message_container
 
     def load_messages(self, friend):
         """
-        Load and display messages with a friend.
+        Load and display the most recent messages with a friend.
         
         Args:
             friend (str): The username of the friend to load messages with
         """
-        request = {
-            'action': 'get_messages',
-            'user1': self.current_user,
-            'user2': friend
-        }
-        send_json_message(self.socket, request)
-        response = receive_json_message(self.socket)
-        
-        if response['status'] == 'success':
-            # Clear existing messages
-            for widget in self.messages_area.winfo_children():
-                widget.destroy()
-            
-            # Add messages
-            for message in response['messages']:
-                sent_by_me = message['sender'] == self.current_user
-                time_str = datetime.fromisoformat(message['timestamp']).strftime("%H:%M")
-                self.add_message_bubble(
-                    self.messages_area,
-                    message['sender'],
-                    message['message'],
-                    time_str,
-                    sent_by_me,
-                    message.get('is_image', False),
-                    message.get('image_path')
-                )
+        # Show the conversation from the cache right away, then update it from the server
+        cached = self.cache.get_response(self.chat_cache_key(friend))
+        if cached is not None:
+            self.chat_messages = cached['messages']
+            self.chat_has_more = cached['has_more']
+            self.render_messages(friend)
+        
+        def on_response(response):
+            if response['status'] != 'success' or not self.is_chat_open(friend):
+                return
+            messages = response['messages']
+            # Keep messages pushed since the request was answered
+            last_id = messages[-1]['id'] if messages else -1
+            messages = messages + [m for m in self.chat_messages if m['id'] > last_id]
+            has_more = response.get('has_more', False)
+            if [m['id'] for m in messages] != [m['id'] for m in self.chat_messages] or has_more != self.chat_has_more:
+                self.chat_messages = messages
+                self.chat_has_more = has_more
+                self.render_messages(friend)
+            self.save_chat_to_cache(friend)
+        
+        self.request_async('get_messages', friend, limit=MESSAGES_PAGE_SIZE, callback=on_response)
+
+    def chat_cache_key(self, friend):
+        """
+        Return the key under which the conversation with friend is cached.
+        """
+        return f"messages:{self.current_user}:{friend}"
+
+    def save_chat_to_cache(self, friend):
+        """
+        Cache the latest page of the open conversation.
+        
+        Args:
+            friend (str): The username of the friend in the open chat
+        """
+        self.cache.put_response(self.chat_cache_key(friend), {
+            'messages': self.chat_messages[-MESSAGES_PAGE_SIZE:],
+            'has_more': self.chat_has_more or len(self.chat_messages) > MESSAGES_PAGE_SIZE
+        })
+
+    def refresh_messages(self, friend):
+        """
+        Fetch and display only the messages newer than the last one shown.
+        
+        Args:
+            friend (str): The username of the friend in the open chat
+        """
+        if not self.chat_messages:
+            self.load_messages(friend)
+            return
+        def on_response(response):
+            if response['status'] != 'success' or not self.is_chat_open(friend):
+                return
+            # Pushed messages or another refresh may have arrived meanwhile
+            last_id = self.chat_messages[-1]['id'] if self.chat_messages else -1
+            messages = [m for m in response['messages'] if m['id'] > last_id]
+            if messages:
+                self.append_messages(messages)
+        
+        self.request_async('get_messages', friend, after=self.chat_messages[-1]['id'], callback=on_response)
+
+    def load_earlier_messages(self, friend):
+        """
+        Fetch the page of messages before the oldest one shown.
+        
+        Args:
+            friend (str): The username of the friend in the open chat
+        """
+        def on_response(response):
+            if response['status'] != 'success' or not self.is_chat_open(friend):
+                return
+            first_id = self.chat_messages[0]['id'] if self.chat_messages else float('inf')
+            messages = [m for m in response['messages'] if m['id'] < first_id]
+            self.prepend_messages(friend, messages, response.get('has_more', False))
+        
+        self.request_async('get_messages', friend, before=self.chat_messages[0]['id'], limit=MESSAGES_PAGE_SIZE,
+                           callback=on_response)
+
+    def is_chat_open(self, friend):
+        """
+        Check whether the chat with friend is still on screen, so a late
+        response for a chat the user has left is dropped.
+        
+        Args:
+            friend (str): The username of the friend
+        """
+        return self.current_chat_friend == friend and self.messages_area.winfo_exists()
+
+    def render_messages(self, friend):
+        """
+        Display the messages of the open chat, replacing anything shown.
+        
+        This is only done when a chat is opened; later messages are added
+        with `append_messages` and `prepend_messages`, which keep the
+        bubbles already on screen.
+        
+        Args:
+            friend (str): The username of the friend in the open chat
+        """
+        # Clear existing messages
+        for widget in self.messages_area.winfo_children():
+            widget.destroy()
+        self.load_earlier_button = None
+        self.first_message_widget = None
+        self.update_load_earlier_button(friend)
+        
+        # Add messages
+        for message in self.chat_messages:
+            widget = self.add_chat_message(message)
+            if self.first_message_widget is None:
+                self.first_message_widget = widget
+        
+        # Scroll to bottom
+        self.messages_area._parent_canvas.yview_moveto(1.0)
+
+    def add_chat_message(self, message, before=None):
+        """
+        Add a bubble for one message of the open chat.
+        
+        Args:
+            message (dict): The message as returned by the server
+            before (optional): Insert the bubble above this widget instead of at the bottom
             
-            # Scroll to bottom
-            self.messages_area._parent_canvas.yview_moveto(1.0)
+        Returns:
+            The frame holding the message
+        """
+        sent_by_me = message['sender'] == self.current_user
+        time_str = datetime.fromisoformat(message['timestamp']).strftime("%H:%M")
+        return self.add_message_bubble(
+            self.messages_area,
+            message['sender'],
+            message['message'],
+            time_str,
+            sent_by_me,
+            message.get('is_image', False),
+            message.get('image_path'),
+            before=before
+        )
+
+    def append_messages(self, messages):
+        """
+        Add newer messages below the ones shown.
+        
+        The view follows the new messages only if it was scrolled to the
+        bottom, so reading older messages is not interrupted.
+        
+        Args:
+            messages (list): The new messages, oldest first
+        """
+        canvas = self.messages_area._parent_canvas
+        at_end = canvas.yview()[1] >= 1.0
+        self.chat_messages.extend(messages)
+        for message in messages:
+            widget = self.add_chat_message(message)
+            if self.first_message_widget is None:
+                self.first_message_widget = widget
+        if at_end:
+            self.messages_area.update_idletasks()
+            canvas.yview_moveto(1.0)
+        self.save_chat_to_cache(self.current_chat_friend)
+
+    def prepend_messages(self, friend, messages, has_more):
+        """
+        Add older messages above the ones shown, keeping the message that
+        was at the top in view.
+        
+        Args:
+            friend (str): The username of the friend in the open chat
+            messages (list): The older messages, oldest first
+            has_more (bool): Whether even older messages exist on the server
+        """
+        anchor = self.first_message_widget
+        self.chat_messages = messages + self.chat_messages
+        self.chat_has_more = has_more
+        for i, message in enumerate(messages):
+            widget = self.add_chat_message(message, before=anchor)
+            if i == 0:
+                self.first_message_widget = widget
+        self.update_load_earlier_button(friend)
+        if anchor is not None:
+            self.messages_area.update_idletasks()
+            self.messages_area._parent_canvas.yview_moveto(
+                anchor.winfo_y() / max(self.messages_area.winfo_height(), 1)
+            )
+
+    def update_load_earlier_button(self, friend):
+        """
+        Show the "Load earlier messages" button above the messages while older ones exist.
+        
+        Args:
+            friend (str): The username of the friend in the open chat
+        """
+        if self.chat_has_more and self.load_earlier_button is None:
+            self.load_earlier_button = ctk.CTkButton(
+                self.messages_area,
+                text="Load earlier messages",
+                height=30,
+                fg_color="transparent",
+                hover_color=INSTAGRAM_COLORS["hover_gray"],
+                text_color=INSTAGRAM_COLORS["primary"],
+                command=lambda: self.load_earlier_messages(friend)
+            )
+            self.load_earlier_button.pack(pady=5, before=self.first_message_widget)
+        elif not self.chat_has_more and self.load_earlier_button is not None:
+            self.load_earlier_button.destroy()
+            self.load_earlier_button = None
 
     def auto_refresh_chat(self):
         """
-        Set up automatic refresh of the chat messages.
+        Poll for new chat messages while server push is unavailable.
         
         This method:
         1. Checks for new messages periodically
         2. Updates the chat display
-        3. Maintains scroll position
+        3. Stops once the chat is closed or push updates resume
         """
-        if hasattr(self, 'current_chat_friend'):
-            self.load_messages(self.current_chat_friend)
-            self.root.after(5000, self.auto_refresh_chat)  # Refresh every 5 seconds
+        self.chat_refresh_job = None
+        if self.current_chat_friend is None or not self.messages_area.winfo_exists():
+            return
+        self.refresh_messages(self.current_chat_friend)
+        if self.push_client is None:
+            self.chat_refresh_job = self.root.after(CHAT_POLL_INTERVAL, self.auto_refresh_chat)
 
     def show_profile(self):
         """
@@ -1082,26 +1440,12 @@ class InstagramClient:
         ).pack(pady=10)
         
         # Get user's posts
-        request = {'action': 'get_feed'}
-        send_json_message(self.socket, request)
-        response = receive_json_message(self.socket)
-        
-        if response['status'] == 'success':
-            user_posts = [post for post in response['posts'] if post['username'] == self.current_user]
-            
-            if user_posts:
-                posts_frame = ctk.CTkScrollableFrame(profile_frame, fg_color="transparent")
-                posts_frame.pack(fill="both", expand=True)
-                
-                for post in reversed(user_posts):
-                    self.create_post_widget(post, parent=posts_frame)
-            else:
-                ctk.CTkLabel(
-                    profile_frame,
-                    text="No posts yet",
-                    font=("Helvetica", 14),
-                    text_color="#000000"
-                ).pack(pady=20)
+        posts_feed = FeedView(
+            profile_frame,
+            fetch_page=lambda before, done: self.fetch_feed_page(before, done, author=self.current_user),
+            fetch_image=lambda image_path, done: self.load_photo(image_path, 'feed', done)
+        )
+        posts_feed.pack(fill="both", expand=True)
         
         # Logout button
         logout_button = ctk.CTkButton(
@@ -1124,17 +1468,17 @@ class InstagramClient:
         2. Resets user state
         3. Returns to login screen
         """
-        if self.socket:
-            self.socket.close()
         self.current_user = None
-        self.connected = False
+        self.current_chat_friend = None
+        self.stop_push_listener()
+        self.image_cache.clear()
         self.clear_content()
         self.top_bar.pack_forget()
         self.nav_bar.pack_forget()
         self.upload_btn.place_forget()
         self.back_btn.place_forget()
         self.login_frame.place(relx=0.5, rely=0.5, anchor="center")
-        self.connect_to_server()  # Reconnect for next login
+        self.reconnect()  # Reconnect for next login
 
     def clear_content(self):
         """
@@ -1181,14 +1525,27 @@ class InstagramClient:
         2. Handles application shutdown
         """
         self.root.mainloop()
-        if self.socket:
-            self.socket.close()
+        self.stop_push_listener()
+        self.worker.stop()
+        self.cache.close()
+        if self.api:
+            self.api.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Instagram Client')
     parser.add_argument('--port', type=int, default=5000, help='Port number to connect to')
     parser.add_argument('--host', type=str, default='localhost', help='Host to connect to')
+    parser.add_argument('--legacy-protocol', action='store_true',
+                        help='Use unframed JSON messages (for servers without framing support)')
+    parser.add_argument('--image-cache-mb', type=int, default=IMAGE_CACHE_BUDGET // (1024 * 1024),
+                        help='Memory for decoded images kept across pages, in MB')
+    parser.add_argument('--cache-dir', type=str, default=CLIENT_CACHE_DIR,
+                        help='Directory of the on-disk cache of images, feeds and messages')
+    parser.add_argument('--cache-mb', type=int, default=CLIENT_CACHE_SIZE // (1024 * 1024),
+                        help='Disk space the cache may use, in MB')
     args = parser.parse_args()
     
-    client = InstagramClient(host=args.host, port=args.port)
+    client = InstagramClient(host=args.host, port=args.port, legacy_protocol=args.legacy_protocol,
+                             image_cache_budget=args.image_cache_mb * 1024 * 1024,
+                             cache_dir=args.cache_dir, cache_size=args.cache_mb * 1024 * 1024)
     client.run() 
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+This module implements the client's persistent cache of images and server responses.
+
+The cache lives in a directory holding a SQLite index (``cache.db``) and the
+image files, stored under their content hash (the ETag the server sends) in
+``blobs/``, so an image shown under several paths or sizes is kept once.
+Responses such as the first page of the feed or the latest messages of a
+conversation are kept as JSON, so the client can show them as soon as a
+page opens and then update them from the server in the background.
+
+The cache is capped in size: once images and responses exceed the limit,
+the least recently used entries are evicted. It may be used from any thread.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Tuple
+from constants import CLIENT_CACHE_SIZE
+
+
+def is_immutable(image_path: str) -> bool:
+    """
+    Check whether an image path names a content-addressed blob, whose data
+    (and so every derivative of it) can never change.
+    """
+    name = os.path.basename(str(image_path).replace('\\', '/'))
+    return len(name) == 64 and not name.strip('0123456789abcdef')
+
+
+class ClientCache:
+    """
+    Size-capped, LRU-evicted cache of images and JSON responses on disk.
+
+    Args:
+        directory (str): Directory holding the cache
+        max_bytes (int): Size limit of the cached images and responses
+    """
+
+    def __init__(self, directory: str, max_bytes: int = CLIENT_CACHE_SIZE):
+        self.directory = directory
+        self.blobs_dir = os.path.join(directory, 'blobs')
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, 'cache.db'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                etag TEXT PRIMARY KEY,
+                bytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS images (
+                image_path TEXT NOT NULL,
+                size TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                PRIMARY KEY (image_path, size)
+            );
+            CREATE INDEX IF NOT EXISTS images_by_etag ON images (etag);
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self._total = self._db.execute(
+            "SELECT (SELECT COALESCE(SUM(bytes), 0) FROM blobs)"
+            " + (SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses)"
+        ).fetchone()[0]
+
+    def _blob_path(self, etag: str) -> str:
+        """
+        Return where an image with the given content hash is stored.
+        """
+        return os.path.join(self.blobs_dir, etag[:2], etag)
+
+    def get_image(self, image_path: str, size: Optional[str]) -> Optional[Tuple[str, bytes]]:
+        """
+        Look up a cached image.
+
+        Args:
+            image_path (str): The image path stored with a post or message
+            size (str, optional): The derivative, or None for the original
+
+        Returns:
+            tuple: (etag, image bytes), or None if the image is not cached
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag FROM images WHERE image_path = ? AND size = ?",
+                (image_path, size or '')
+            ).fetchone()
+            if row is None:
+                return None
+            etag = row[0]
+            try:
+                with open(self._blob_path(etag), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                self._remove_blob(etag)
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE blobs SET last_used = ? WHERE etag = ?", (time.time(), etag))
+            self._db.commit()
+        return etag, data
+
+    def put_image(self, image_path: str, size: Optional[str], etag: str, data: bytes) -> None:
+        """
+        Cache an image under its content hash.
+
+        Args:
+            image_path (str): The image path stored with a post or message
+            size (str, optional): The derivative, or None for the original
+            etag (str): The image's content hash, as sent by the server
+            data (bytes): The image file
+        """
+        if len(data) > self.max_bytes or not etag.isalnum():
+            return
+        path = self._blob_path(etag)
+        with self._lock:
+            known = self._db.execute("SELECT 1 FROM blobs WHERE etag = ?", (etag,)).fetchone()
+            if known is None or not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                if known is None:
+                    self._total += len(data)
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (etag, bytes, last_used) VALUES (?, ?, ?)",
+                (etag, len(data), time.time())
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO images (image_path, size, etag) VALUES (?, ?, ?)",
+                (image_path, size or '', etag)
+            )
+            self._evict()
+            self._db.commit()
+
+    def get_response(self, key: str) -> Any:
+        """
+        Look up a cached response.
+
+        Args:
+            key (str): The key the response was cached under
+
+        Returns:
+            The cached value, or None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put_response(self, key: str, value: Any) -> None:
+        """
+        Cache a JSON-serializable value, replacing any value under the same key.
+
+        Args:
+            key (str): The key to cache the value under
+            value: The value
+        """
+        body = json.dumps(value)
+        with self._lock:
+            row = self._db.execute("SELECT LENGTH(body) FROM responses WHERE key = ?", (key,)).fetchone()
+            self._total += len(body) - (row[0] if row else 0)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, last_used) VALUES (?, ?, ?)",
+                (key, body, time.time())
+            )
+            self._evict()
+            self._db.commit()
+
+    def _remove_blob(self, etag: str) -> None:
+        """
+        Forget a cached image file and every path mapped to it. Must be called with the lock held.
+        """
+        row = self._db.execute("SELECT bytes FROM blobs WHERE etag = ?", (etag,)).fetchone()
+        if row is not None:
+            self._total -= row[0]
+        self._db.execute("DELETE FROM blobs WHERE etag = ?", (etag,))
+        self._db.execute("DELETE FROM images WHERE etag = ?", (etag,))
+        try:
+            os.remove(self._blob_path(etag))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache fits its limit.
+        Must be called with the lock held.
+        """
+        while self._total > self.max_bytes:
+            oldest = self._db.execute(
+                "SELECT 'blob', etag, last_used FROM blobs"
+                " UNION ALL SELECT 'response', key, last_used FROM responses"
+                " ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                self._total = 0
+                return
+            for kind, key, _ in oldest:
+                if self._total <= self.max_bytes:
+                    return
+                if kind == 'blob':
+                    self._remove_blob(key)
+                else:
+                    row = self._db.execute("SELECT LENGTH(body) FROM responses WHERE key = ?", (key,)).fetchone()
+                    self._total -= row[0]
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        """
+        Close the index.
+        """
+        with self._lock:
+            self._db.close()
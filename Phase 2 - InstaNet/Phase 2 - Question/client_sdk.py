@@ -0,0 +1,548 @@
+"""
+This module implements a GUI-free client library for the InstaNet server.
+
+It offers one method per server action (login, feed, posts, comments,
+images, friend requests, messages and event subscription) in two flavors:
+
+- `InstaNetClient`, a blocking client for scripts and tools
+- `AsyncInstaNetClient`, an asyncio client whose actions are awaited
+
+Both keep one connection open for all requests. The server answers the
+requests of a connection in order, so requests can be pipelined: several
+are sent before their responses are read. `InstaNetClient.pipeline` sends a
+batch that way, and concurrent calls on an `AsyncInstaNetClient` share the
+connection automatically. Events pushed by the server after `subscribe`
+are set aside and returned by `next_event`.
+
+Every action returns the server's response dict. Failures reported by the
+server come back as responses with status 'error'; connection failures
+raise RuntimeError. Requests a loaded server answers with status 'busy'
+are sent again after the delay it asks for, up to `busy_retries` times.
+Images downloaded with `get_image` are returned as bytes under the
+response's 'image_bytes' key.
+
+Example:
+    with InstaNetClient('localhost', 5000) as client:
+        client.login('user1', 'pass1')
+        feed = client.get_feed()
+"""
+
+import asyncio
+import base64
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Union
+from socket_utils import create_client_socket, MessageConnection, AsyncMessageConnection
+from constants import (
+    DEFAULT_HOST, DEFAULT_PORT, MAX_RETRIES, RETRY_DELAY, PIPELINE_DEPTH, FEED_PAGE_SIZE, BUSY_RETRIES,
+    BUSY_RETRY_AFTER
+)
+
+Image = Union[bytes, bytearray, memoryview, str, os.PathLike]  # Image bytes or the path of an image file
+
+
+def _is_event(message: Dict[str, Any]) -> bool:
+    """
+    Tell a pushed event from the response to a request.
+    """
+    return 'event' in message and 'status' not in message
+
+
+def _retry_delay(response: Dict[str, Any], attempt: int, retries: int) -> Optional[float]:
+    """
+    Return how long to wait before resending a request, or None to keep its response.
+    """
+    if response.get('status') != 'busy' or attempt >= retries:
+        return None
+    return float(response.get('retry_after', BUSY_RETRY_AFTER))
+
+
+def _read_image(image: Image) -> bytes:
+    """
+    Return the bytes of an image given as bytes or as a file path.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    with open(image, 'rb') as f:
+        return f.read()
+
+
+class _Actions(ABC):
+    """
+    The server's actions, shared by the sync and async clients.
+
+    Each action builds a request and hands it to `request`, so on the async
+    client every action returns an awaitable.
+    """
+
+    username: Optional[str] = None  # Set once a login succeeds
+
+    @abstractmethod
+    def request(self, message: Dict[str, Any], image: Optional[Image] = None):
+        """
+        Send a request, with an image if given, and return the server's response.
+        """
+
+    def _record(self, message: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """
+        Remember the user once a login succeeds.
+        """
+        if message.get('action') == 'login' and response.get('status') == 'success':
+            self.username = message['username'].lower()
+
+    def login(self, username: str, password: str):
+        """
+        Log in; later actions default to acting as this user.
+        """
+        return self.request({'action': 'login', 'username': username, 'password': password})
+
+    def subscribe(self):
+        """
+        Ask the server to push events (such as new messages) for the logged-in user.
+        """
+        return self.request({'action': 'subscribe'})
+
+    def get_feed(self, limit: int = FEED_PAGE_SIZE, before: Optional[int] = None,
+                 author: Optional[str] = None):
+        """
+        Fetch a page of the logged-in user's feed, newest first.
+
+        Args:
+            limit (int): Number of posts per page
+            before (int, optional): Only posts older than this post id
+            author (str, optional): Only this user's posts
+        """
+        request = {'action': 'get_feed', 'username': self.username, 'limit': limit}
+        if before is not None:
+            request['before'] = before
+        if author is not None:
+            request['author'] = author
+        return self.request(request)
+
+    def upload_post(self, image: Image, caption: str = '', timestamp: Optional[str] = None):
+        """
+        Publish a post.
+
+        Args:
+            image: The image's bytes or file path
+            caption (str): The post's caption
+            timestamp (str, optional): Defaults to now
+        """
+        return self.request({
+            'action': 'upload_post',
+            'username': self.username,
+            'caption': caption,
+            'timestamp': timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }, image)
+
+    def add_comment(self, post_id: int, text: str):
+        """
+        Comment on a post as the logged-in user.
+        """
+        return self.request({'action': 'add_comment', 'post_id': post_id, 'user': self.username, 'text': text})
+
+    def get_image(self, image_path: str, size: Optional[str] = None, etag: Optional[str] = None):
+        """
+        Download an image.
+
+        Args:
+            image_path (str): The image path stored with a post or message
+            size (str, optional): A derivative such as 'feed' or 'chat'
+            etag (str, optional): Content hash of a cached copy; if it is
+                still current the response has status 'not_modified' and no image
+
+        Returns:
+            dict: The response, with the image's bytes under 'image_bytes'
+        """
+        request = {'action': 'get_image', 'image_path': image_path}
+        if size is not None:
+            request['size'] = size
+        if etag is not None:
+            request['etag'] = etag
+        return self.request(request)
+
+    def send_friend_request(self, receiver: str):
+        """
+        Send a friend request from the logged-in user.
+        """
+        return self.request({'action': 'send_friend_request', 'sender': self.username, 'receiver': receiver})
+
+    def accept_friend_request(self, friend: str):
+        """
+        Accept a friend request sent to the logged-in user.
+        """
+        return self.request({'action': 'accept_friend_request', 'user': self.username, 'friend': friend})
+
+    def reject_friend_request(self, friend: str):
+        """
+        Reject a friend request sent to the logged-in user.
+        """
+        return self.request({'action': 'reject_friend_request', 'user': self.username, 'friend': friend})
+
+    def send_message(self, receiver: str, message: str, timestamp: Optional[str] = None):
+        """
+        Send a text message from the logged-in user.
+        """
+        return self.request({
+            'action': 'send_message',
+            'sender': self.username,
+            'receiver': receiver,
+            'message': message,
+            'timestamp': timestamp or datetime.now().isoformat(),
+            'is_image': False
+        })
+
+    def send_image(self, receiver: str, image: Image, timestamp: Optional[str] = None):
+        """
+        Send an image message from the logged-in user.
+
+        Args:
+            receiver (str): The friend to send the image to
+            image: The image's bytes or file path
+            timestamp (str, optional): Defaults to now
+        """
+        return self.request({
+            'action': 'send_message',
+            'sender': self.username,
+            'receiver': receiver,
+            'message': "Image",
+            'timestamp': timestamp or datetime.now().isoformat(),
+            'is_image': True
+        }, image)
+
+    def get_messages(self, friend: str, limit: Optional[int] = None,
+                     before: Optional[int] = None, after: Optional[int] = None):
+        """
+        Fetch messages between the logged-in user and a friend, oldest first.
+
+        Args:
+            friend (str): The other user
+            limit (int, optional): Number of messages; without a limit or
+                cursor the whole conversation is returned
+            before (int, optional): Only messages older than this message id
+            after (int, optional): Only messages newer than this message id
+        """
+        request = {'action': 'get_messages', 'user1': self.username, 'user2': friend}
+        for key, value in (('limit', limit), ('before', before), ('after', after)):
+            if value is not None:
+                request[key] = value
+        return self.request(request)
+
+    def get_user_data(self):
+        """
+        Fetch the logged-in user's friends and pending friend requests.
+        """
+        return self.request({'action': 'get_user_data', 'username': self.username})
+
+    def get_all_users(self):
+        """
+        Fetch the names of all users.
+        """
+        return self.request({'action': 'get_all_users'})
+
+
+class InstaNetClient(_Actions):
+    """
+    A blocking client holding one connection to the server.
+
+    Args:
+        host (str): The server host address
+        port (int): The server port number
+        framed (bool): False to speak bare JSON to servers without framing support
+        max_retries (int): Connection attempts before giving up
+        retry_delay (int): Delay between attempts in seconds
+        pipeline_depth (int): Most requests `pipeline` keeps in flight
+        busy_retries (int): Times a request answered with 'busy' is sent again
+
+    Raises:
+        RuntimeError: If the connection cannot be established
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, framed: bool = True,
+                 max_retries: int = MAX_RETRIES, retry_delay: int = RETRY_DELAY,
+                 pipeline_depth: int = PIPELINE_DEPTH, busy_retries: int = BUSY_RETRIES):
+        self.connection = MessageConnection(create_client_socket(host, port, max_retries, retry_delay), framed=framed)
+        self.pipeline_depth = pipeline_depth
+        self.busy_retries = busy_retries
+        self.username = None
+        self.events = deque()  # Pushed events not yet returned by next_event
+
+    def __enter__(self) -> 'InstaNetClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _receive(self) -> Dict[str, Any]:
+        """
+        Receive the next message, with any attached image under 'image_bytes'.
+        """
+        message = self.connection.receive_message()
+        if self.connection.image_attached:
+            message['image_bytes'] = bytes(self.connection.receive_image())
+        elif 'image_data' in message:
+            # Legacy servers embed downloads as base64
+            message['image_bytes'] = base64.b64decode(message.pop('image_data'))
+        return message
+
+    def _receive_response(self) -> Dict[str, Any]:
+        """
+        Receive the next response, setting aside any events pushed before it.
+        """
+        while True:
+            message = self._receive()
+            if not _is_event(message):
+                return message
+            self.events.append(message)
+
+    def request(self, message: Dict[str, Any], image: Optional[Image] = None) -> Dict[str, Any]:
+        """
+        Send a request, with an optional image, and wait for its response.
+
+        Args:
+            message (dict): The request
+            image (optional): Image bytes or file path to upload with the request
+
+        Returns:
+            dict: The response
+        """
+        attempt = 0
+        while True:
+            if image is None:
+                self.connection.send_message(message)
+            elif isinstance(image, (bytes, bytearray, memoryview)):
+                self.connection.send_message_with_image(message, image)
+            else:
+                self.connection.send_message_with_image_file(message, os.fspath(image))
+            response = self._receive_response()
+            delay = _retry_delay(response, attempt, self.busy_retries)
+            if delay is None:
+                break
+            time.sleep(delay)
+            attempt += 1
+        self._record(message, response)
+        return response
+
+    def pipeline(self, messages: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send several requests without waiting for each response.
+
+        At most `pipeline_depth` requests are in flight at once, so neither
+        side can stall on a full socket buffer. Requests carrying images
+        cannot be pipelined; use `request` for them. Requests answered with
+        'busy' are sent again one by one once the batch is done.
+
+        Args:
+            messages (iterable): The requests
+
+        Returns:
+            list: The responses, in request order
+        """
+        messages = list(messages)
+        responses = []
+        sent = 0
+        for message in messages:
+            if sent - len(responses) >= self.pipeline_depth:
+                responses.append(self._receive_response())
+            self.connection.send_message(message)
+            sent += 1
+        while len(responses) < sent:
+            responses.append(self._receive_response())
+        for index, (message, response) in enumerate(zip(messages, responses)):
+            delay = _retry_delay(response, 0, self.busy_retries)
+            if delay is None:
+                self._record(message, response)
+            else:
+                time.sleep(delay)
+                responses[index] = self.request(message)
+        return responses
+
+    def next_event(self) -> Dict[str, Any]:
+        """
+        Wait for the next event pushed by the server (see `subscribe`).
+
+        Only call this while no request is in flight.
+        """
+        while not self.events:
+            message = self._receive()
+            if not _is_event(message):
+                raise RuntimeError("Received a response to no request")
+            self.events.append(message)
+        return self.events.popleft()
+
+    def close(self) -> None:
+        """
+        Close the connection.
+        """
+        self.connection.close()
+
+
+class AsyncInstaNetClient(_Actions):
+    """
+    An asyncio client holding one connection to the server. Create it with `connect`.
+
+    Requests made concurrently (e.g. with `asyncio.gather`) are pipelined on
+    the connection: they are written as soon as they are made, and a single
+    reader task hands each response to the request it answers.
+
+    Args:
+        connection (AsyncMessageConnection): The connection to the server
+        pipeline_depth (int): Most requests kept in flight at once
+        busy_retries (int): Times a request answered with 'busy' is sent again
+    """
+
+    def __init__(self, connection: AsyncMessageConnection, pipeline_depth: int = PIPELINE_DEPTH,
+                 busy_retries: int = BUSY_RETRIES):
+        self.connection = connection
+        self.busy_retries = busy_retries
+        self.username = None
+        self.events: asyncio.Queue = asyncio.Queue()  # Pushed events not yet returned by next_event
+        self._loop = asyncio.get_running_loop()
+        self._pending = deque()  # Futures of the requests in flight, in request order
+        self._send_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(pipeline_depth)
+        self._error: Optional[RuntimeError] = None  # Set once the connection has failed
+        self._reader = asyncio.create_task(self._read_responses())
+
+    @classmethod
+    async def connect(cls, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, framed: bool = True,
+                      pipeline_depth: int = PIPELINE_DEPTH,
+                      busy_retries: int = BUSY_RETRIES) -> 'AsyncInstaNetClient':
+        """
+        Connect to the server.
+
+        Raises:
+            RuntimeError: If the connection cannot be established
+        """
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            raise RuntimeError(f"Could not connect to server at {host}:{port}: {e}")
+        return cls(AsyncMessageConnection(reader, writer, framed=framed), pipeline_depth, busy_retries)
+
+    async def __aenter__(self) -> 'AsyncInstaNetClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _read_responses(self) -> None:
+        """
+        Hand each response to the oldest request in flight, and queue pushed events.
+        """
+        try:
+            while True:
+                message = await self.connection.receive_message()
+                if self.connection.image_attached:
+                    message['image_bytes'] = await self.connection.receive_image()
+                elif 'image_data' in message:
+                    # Legacy servers embed downloads as base64
+                    message['image_bytes'] = base64.b64decode(message.pop('image_data'))
+                if _is_event(message):
+                    self.events.put_nowait(message)
+                elif not self._pending:
+                    raise RuntimeError("Received a response to no request")
+                else:
+                    future = self._pending.popleft()
+                    if not future.done():
+                        future.set_result(message)
+        except RuntimeError as e:
+            self._fail(e)
+        except asyncio.CancelledError:
+            self._fail(RuntimeError("Connection closed"))
+            raise
+
+    def _fail(self, error: RuntimeError) -> None:
+        """
+        Fail every request in flight once the connection is unusable.
+        """
+        self._error = error
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    def _expect(self) -> asyncio.Future:
+        """
+        Register a response the reader task should deliver. Must be called with the send lock held.
+        """
+        if self._error is not None:
+            raise self._error
+        future = self._loop.create_future()
+        self._pending.append(future)
+        return future
+
+    async def request(self, message: Dict[str, Any], image: Optional[Image] = None) -> Dict[str, Any]:
+        """
+        Send a request, with an optional image, and wait for its response.
+
+        Args:
+            message (dict): The request
+            image (optional): Image bytes or file path to upload with the request
+
+        Returns:
+            dict: The response
+        """
+        if image is not None:
+            image = await self._loop.run_in_executor(None, _read_image, image)
+        attempt = 0
+        while True:
+            response = await self._send_request(message, image)
+            delay = _retry_delay(response, attempt, self.busy_retries)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+            attempt += 1
+        self._record(message, response)
+        return response
+
+    async def _send_request(self, message: Dict[str, Any], image: Optional[bytes]) -> Dict[str, Any]:
+        """
+        Send a request once and wait for its response.
+        """
+        async with self._slots:
+            async with self._send_lock:
+                try:
+                    if image is None:
+                        future = self._expect()
+                        await self.connection.send_message(message)
+                    elif self.connection.framed is not False:
+                        future = self._expect()
+                        await self.connection.send_message_with_image(message, image)
+                    else:
+                        # Legacy upload handshake: ready -> image bytes -> success
+                        ready = self._expect()
+                        await self.connection.send_message(message)
+                        if (await ready).get('status') != 'ready':
+                            raise RuntimeError("Did not receive 'ready' acknowledgment")
+                        acknowledged = self._expect()
+                        future = self._expect()
+                        await self.connection.send_image(image)
+                        if (await acknowledged).get('status') != 'success':
+                            raise RuntimeError("Did not receive 'success' acknowledgment")
+                except RuntimeError as e:
+                    # Responses can no longer be matched to requests
+                    self._fail(e)
+                    self.connection.close()
+                    raise
+            return await future
+
+    async def next_event(self) -> Dict[str, Any]:
+        """
+        Wait for the next event pushed by the server (see `subscribe`).
+        """
+        return await self.events.get()
+
+    async def close(self) -> None:
+        """
+        Close the connection.
+        """
+        self._reader.cancel()
+        self.connection.close()
+        try:
+            await self.connection.writer.wait_closed()
+        except ConnectionError:
+            pass
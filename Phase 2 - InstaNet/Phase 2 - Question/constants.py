@@ -36,16 +36,55 @@ DEFAULT_PORT = 5000           # Default port for socket connections
 MAX_RETRIES = 3               # Maximum number of connection retries
 RETRY_DELAY = 2               # Delay between retries in seconds
 BUFFER_SIZE = 4096            # Size of socket buffer for data transfer
+RECV_BUFFER_SIZE = 65536      # Size of each read into a connection's receive buffer
+MAX_SEND_CHUNK = 1024 * 1024  # Largest chunk handed to a single send call
+
+# Wire protocol configuration
+FRAME_MAGIC = b'IN'           # Marks a framed message (legacy messages start with '{')
+PROTOCOL_VERSION = 1          # Version byte carried in every frame header
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024  # Largest JSON payload accepted in one message
+MAX_IMAGE_SIZE = 20 * 1024 * 1024    # Largest image upload the server accepts by default
+MAX_IMAGE_DRAIN = 1024 * 1024        # Bytes over the limit drained from a rejected upload; larger ones close the connection
+PIPELINE_DEPTH = 32           # Requests a client keeps in flight on one connection
+BUSY_RETRIES = 3              # Times a client resends a request the server was too busy to accept
+
+# Server engine configuration
+SERVER_MODES = ('threaded', 'asyncio', 'pool')  # Available connection handling engines
+DEFAULT_SERVER_MODE = 'threaded'        # Thread-per-connection engine
+ASYNC_BACKLOG = 4096          # Listen backlog used by the asyncio engine
+STORAGE_WORKERS = 16          # Executor threads running storage work in asyncio mode
+POOL_WORKERS = 16             # Worker threads running requests in pool mode
+POOL_QUEUE_SIZE = 256         # Requests that may wait for a worker in pool mode before load is shed
+BUSY_RETRY_AFTER = 0.1        # Seconds a client is asked to wait before retrying a 'busy' request
+
+# Metrics configuration
+METRICS_HOST = '127.0.0.1'    # Metrics are only served locally unless configured otherwise
+METRICS_LATENCY_BUCKETS = (   # Upper bounds (seconds) of the latency histogram buckets
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+# Request routing configuration
+RATE_LIMIT_BURST = 20         # Mutating requests a connection may send at once when rate limited
 
 # File paths
 DATA_DIRECTORIES = [          # List of directories needed for data storage
     'data/users',            # User data and profiles
     'data/posts',            # Post data and images
     'data/messages',         # Message history
-    'data/images'            # Image storage
+    'data/images',           # Image storage
+    'data/blobs'             # Content-addressed image blobs
 ]
 USERS_FILE = 'data/users/users.json'    # Path to users data file
 POSTS_FILE = 'data/posts/posts.json'    # Path to posts data file
+MESSAGES_DIR = 'data/messages'          # Directory of per-conversation message logs
+IMAGES_DIR = 'data/images'              # Directory of images uploaded before the blob store
+BLOBS_DIR = 'data/blobs'                # Content-addressed store of uploaded images
+SQLITE_DB_FILE = 'data/instanet.db'     # Database used by the SQLite storage backend
+STORAGE_BACKENDS = ('json', 'sqlite')   # Available storage backends
+DEFAULT_STORAGE = 'json'                # JSON files suit small installs
+CLIENT_CACHE_DIR = '~/.instanet/cache'  # Client cache of images and responses, one subdirectory per server
+CLIENT_CACHE_SIZE = 256 * 1024 * 1024   # Bytes of images and responses the client cache keeps on disk
+USERS_FLUSH_INTERVAL = 0.5    # Seconds to batch user changes before writing users.json
 
 # Default users configuration
 DEFAULT_USERS_COUNT = 10      # Number of default users to create
@@ -57,6 +96,26 @@ MESSAGE_BUBBLE_RADIUS = 16    # Corner radius for message bubbles
 MESSAGE_WRAP_LENGTH = 220     # Maximum width for message text before wrapping
 MESSAGE_PADDING = 8           # Horizontal padding for messages
 MESSAGE_VERTICAL_PADDING = 4  # Vertical padding for messages
+MESSAGES_PAGE_SIZE = 50       # Messages fetched when a chat is opened
+MAX_MESSAGES_PAGE = 500       # Largest page of messages the server returns
+CHAT_POLL_INTERVAL = 5000     # Chat refresh interval (ms) when server push is unavailable
+NETWORK_POLL_INTERVAL = 20    # Interval (ms) at which the GUI picks up finished network requests
+
+# Image configuration
+IMAGE_VARIANTS = {            # Image derivatives, fitted into a square of this many pixels
+    'feed': 400,              # Posts in the feed and on profiles
+    'chat': 300,              # Images in chat bubbles
+    'preview': 64             # Tiny previews
+}
+THUMBNAIL_WORKERS = 2         # Processes rendering image derivatives after uploads
+IMAGE_CACHE_BUDGET = 64 * 1024 * 1024  # Bytes of decoded images the client keeps in memory
+
+# Feed configuration
+FEED_PAGE_SIZE = 10           # Posts fetched per feed page
+MAX_FEED_PAGE = 50            # Largest page of posts the server returns
+FEED_POST_HEIGHT = 520        # Height (px) of one post in the feed
+FEED_OVERSCAN = 1             # Posts kept built above and below the visible ones
+FEED_PREFETCH = 3             # Fetch the next page once this close to the last loaded post
 
 # UI configuration
 WINDOW_TITLE = "InstaNet"     # Application window title
@@ -0,0 +1,307 @@
+"""
+This module implements the virtualized feed shown on the client's home and profile pages.
+
+Every post occupies a slot of fixed height on a canvas, so the posts in view
+follow from the scroll offset alone. Only the posts in or near the viewport
+have widgets: when a post scrolls out of range its widget goes back to a pool
+and is reused for the next post scrolling in. Further pages are requested as
+the user nears the end of the loaded posts, and a post's image is requested
+only when its widget is bound, i.e. when the post is about to become visible.
+"""
+
+import tkinter as tk
+import customtkinter as ctk
+from constants import INSTAGRAM_COLORS, IMAGE_VARIANTS, FEED_POST_HEIGHT, FEED_OVERSCAN, FEED_PREFETCH
+
+POST_MARGIN = 20  # Horizontal space (px) between the posts and the canvas edges
+POST_SPACING = 20  # Vertical space (px) between consecutive posts
+
+
+class PostView:
+    """
+    A reusable widget showing one post on the feed canvas.
+
+    Args:
+        canvas (tk.Canvas): The feed canvas the widget is placed on
+    """
+
+    def __init__(self, canvas):
+        self.post = None
+        self.frame = ctk.CTkFrame(canvas, fg_color="transparent", corner_radius=10)
+
+        # Username and timestamp
+        header_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
+        header_frame.pack(fill="x", padx=10, pady=(10, 5))
+        self.username_label = ctk.CTkLabel(
+            header_frame,
+            text="",
+            font=("Helvetica", 14, "bold"),
+            text_color="#000000"
+        )
+        self.username_label.pack(side="left")
+        self.timestamp_label = ctk.CTkLabel(header_frame, text="", font=("Helvetica", 10))
+        self.timestamp_label.pack(side="right")
+
+        # Image, sized for the feed derivative so the post height does not change when it arrives
+        size = IMAGE_VARIANTS['feed']
+        self.image_label = ctk.CTkLabel(self.frame, text="", font=("Helvetica", 12), width=size, height=size)
+        self.image_label.pack(pady=5)
+
+        # Caption
+        self.caption_label = ctk.CTkLabel(
+            self.frame,
+            text="",
+            font=("Helvetica", 12),
+            text_color="#000000",
+            wraplength=400
+        )
+        self.caption_label.pack(padx=10, pady=5)
+
+        self.window = canvas.create_window(
+            0, 0, window=self.frame, anchor="nw", height=FEED_POST_HEIGHT - POST_SPACING, state="hidden"
+        )
+
+    def bind_post(self, post):
+        """
+        Show a post in the widget, with a placeholder until its image arrives.
+
+        Args:
+            post (dict): The post as returned by the server
+        """
+        self.post = post
+        self.username_label.configure(text=post['username'])
+        self.timestamp_label.configure(text=post['timestamp'])
+        self.image_label.configure(image="", text="Loading image...")
+        self.image_label.image = None
+        self.caption_label.configure(text=post.get('caption') or "")
+
+    def set_image(self, photo):
+        """
+        Show the post's image.
+
+        Args:
+            photo (ImageTk.PhotoImage): The image, or None if it could not be loaded
+        """
+        if photo is None:
+            self.image_label.configure(text="Image not found")
+            return
+        self.image_label.configure(image=photo, text="")
+        self.image_label.image = photo  # Keep a reference
+
+    def unbind_post(self):
+        """
+        Release the post shown so the widget can be reused.
+        """
+        self.post = None
+        self.image_label.configure(image="")
+        self.image_label.image = None
+
+
+class FeedView(ctk.CTkFrame):
+    """
+    A scrollable list of posts that only builds widgets for the posts near the viewport.
+
+    Args:
+        master: The parent widget
+        fetch_page (callable): fetch_page(before, done) requests the page of
+            posts older than the post id `before` (None for the newest page)
+            and later calls done(posts, has_more) on the Tk thread; posts is
+            None if the request failed. For the newest page, done may be
+            called first with cached posts and then again with
+            replace=True once the server's answer arrives
+        fetch_image (callable): fetch_image(image_path, done) requests a
+            post's image and calls done(photo) on the Tk thread, right away
+            if it is cached, with None if the image could not be loaded
+        empty_text (str): Text shown when there are no posts
+    """
+
+    def __init__(self, master, fetch_page, fetch_image, empty_text="No posts yet", **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.fetch_page = fetch_page
+        self.fetch_image = fetch_image
+        self.empty_text = empty_text
+        self.posts = []
+        self.has_more = True
+        self.loading = False
+        self._bound = {}  # Post index -> PostView showing it
+        self._pool = []  # PostViews not showing any post
+        self._refresh_job = None
+        self._generation = 0  # Changes when the posts are replaced, to drop pages fetched for the old ones
+
+        self.canvas = tk.Canvas(
+            self,
+            bg=INSTAGRAM_COLORS["background"],
+            highlightthickness=0,
+            yscrollincrement=20
+        )
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.status_text = self.canvas.create_text(
+            0, 0, text="Loading...", font=("Helvetica", 12),
+            fill=INSTAGRAM_COLORS["text_subtle"], anchor="n"
+        )
+
+        self.canvas.bind("<Configure>", self._on_resize)
+        self._bind_mouse_wheel(self.canvas)
+        self._load_next_page()
+
+    def _bind_mouse_wheel(self, widget):
+        """
+        Scroll the feed with the mouse wheel over widget and all its descendants.
+        """
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tk.Misc.bind(widget, sequence, self._on_mouse_wheel, add=True)
+        # Include the canvases and labels customtkinter widgets draw themselves with
+        for child in tk.Misc.winfo_children(widget):
+            self._bind_mouse_wheel(child)
+
+    def _on_mouse_wheel(self, event):
+        """
+        Scroll by a few units per wheel step.
+        """
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.canvas.yview_scroll(-3, "units")
+        else:
+            self.canvas.yview_scroll(3, "units")
+
+    def _on_scroll(self, first, last):
+        """
+        Update the scrollbar and the posts in view whenever the view moves.
+        """
+        self.scrollbar.set(first, last)
+        self._schedule_refresh()
+
+    def _on_resize(self, event):
+        """
+        Stretch the posts to the new width and fill a taller viewport.
+        """
+        width = max(event.width - 2 * POST_MARGIN, 1)
+        for view in list(self._bound.values()) + self._pool:
+            self.canvas.itemconfigure(view.window, width=width)
+        self._update_layout()
+
+    def _schedule_refresh(self):
+        """
+        Refresh the posts in view once the current burst of scroll events has been handled.
+        """
+        if self._refresh_job is None:
+            self._refresh_job = self.after_idle(self._refresh)
+
+    def _update_layout(self):
+        """
+        Size the scroll region for the loaded posts and place the status text below them.
+        """
+        width = self.canvas.winfo_width()
+        height = len(self.posts) * FEED_POST_HEIGHT
+        if self.loading:
+            status = "Loading..."
+        elif not self.posts:
+            status = self.empty_text
+        else:
+            status = ""
+        self.canvas.itemconfigure(self.status_text, text=status)
+        self.canvas.coords(self.status_text, width / 2, height + 10)
+        self.canvas.configure(scrollregion=(0, 0, width, height + (40 if status else 0)))
+        self._schedule_refresh()
+
+    def _visible_range(self):
+        """
+        Return the indexes of the first and one past the last post to build widgets for.
+        """
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(int(top // FEED_POST_HEIGHT) - FEED_OVERSCAN, 0)
+        last = min(int(bottom // FEED_POST_HEIGHT) + 1 + FEED_OVERSCAN, len(self.posts))
+        return first, last
+
+    def _refresh(self):
+        """
+        Recycle the widgets of posts that left the viewport, bind the posts
+        that entered it and fetch the next page when close to the end.
+        """
+        self._refresh_job = None
+        if not self.winfo_exists():
+            return
+        first, last = self._visible_range()
+        for index in [i for i in self._bound if not first <= i < last]:
+            view = self._bound.pop(index)
+            view.unbind_post()
+            self.canvas.itemconfigure(view.window, state="hidden")
+            self._pool.append(view)
+        for index in range(first, last):
+            if index not in self._bound:
+                self._bind(index)
+        if self.has_more and not self.loading and last >= len(self.posts) - FEED_PREFETCH:
+            self._load_next_page()
+
+    def _bind(self, index):
+        """
+        Show the post at index, reusing a pooled widget if there is one.
+        """
+        if self._pool:
+            view = self._pool.pop()
+        else:
+            view = PostView(self.canvas)
+            self.canvas.itemconfigure(view.window, width=max(self.canvas.winfo_width() - 2 * POST_MARGIN, 1))
+            self._bind_mouse_wheel(view.frame)
+        post = self.posts[index]
+        view.bind_post(post)
+        self.canvas.coords(view.window, POST_MARGIN, index * FEED_POST_HEIGHT + POST_SPACING // 2)
+        self.canvas.itemconfigure(view.window, state="normal")
+        self._bound[index] = view
+
+        def on_image(image):
+            if view.post is post:  # Still showing the same post
+                view.set_image(image)
+
+        self.fetch_image(post['image_path'], on_image)
+
+    def _load_next_page(self):
+        """
+        Request the page of posts after the last one loaded.
+        """
+        self.loading = True
+        generation = self._generation
+        before = self.posts[-1]['id'] if self.posts else None
+        self.fetch_page(before, lambda posts, has_more, replace=False:
+                        self._on_page(generation, posts, has_more, replace))
+
+    def _on_page(self, generation, posts, has_more, replace=False):
+        """
+        Append a fetched page to the feed, or replace the posts shown with
+        the server's newest page.
+        """
+        if not self.winfo_exists():
+            return
+        if replace:
+            if posts is not None and [p['id'] for p in posts] != [p['id'] for p in self.posts[:len(posts)]]:
+                self._replace_posts(posts, has_more)
+            return
+        if generation != self._generation:
+            return
+        self.loading = False
+        if posts is None:
+            self.has_more = False
+            self.empty_text = "Failed to load posts"
+        else:
+            self.posts.extend(posts)
+            self.has_more = bool(posts) and has_more
+        self._update_layout()
+
+    def _replace_posts(self, posts, has_more):
+        """
+        Show a fresh first page instead of the posts loaded so far.
+        """
+        self._generation += 1
+        for view in self._bound.values():
+            view.unbind_post()
+            self.canvas.itemconfigure(view.window, state="hidden")
+            self._pool.append(view)
+        self._bound.clear()
+        self.posts = list(posts)
+        self.has_more = bool(posts) and has_more
+        self.loading = False
+        self.canvas.yview_moveto(0.0)
+        self._update_layout()
@@ -0,0 +1,76 @@
+"""
+This module implements the client's cache of decoded images.
+
+Pages are rebuilt from scratch on every navigation, so without a cache each
+visit would download, decode and resize the same images again. The cache
+keeps ready-to-show `PhotoImage` objects keyed by image identity and target
+size, and evicts the least recently used ones once the decoded pixels
+exceed a memory budget. Tk images may only be used on the Tk thread, and so
+may the cache.
+"""
+
+from collections import OrderedDict
+from typing import Hashable
+from constants import IMAGE_CACHE_BUDGET
+
+BYTES_PER_PIXEL = 4  # Tk keeps photo images as 32-bit RGBA
+
+
+class ImageCache:
+    """
+    LRU cache of decoded images with a memory budget.
+
+    Args:
+        budget (int): Bytes of decoded pixels to keep; 0 disables the cache
+    """
+
+    def __init__(self, budget: int = IMAGE_CACHE_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self._images: OrderedDict = OrderedDict()  # Key -> (image, cost), least recently used first
+
+    def get(self, key: Hashable):
+        """
+        Look up an image and mark it as recently used.
+
+        Args:
+            key: The image's identity and target size
+
+        Returns:
+            The cached image, or None
+        """
+        entry = self._images.get(key)
+        if entry is None:
+            return None
+        self._images.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, image) -> None:
+        """
+        Add an image, evicting the least recently used ones to stay within the budget.
+
+        Args:
+            key: The image's identity and target size
+            image: A `PhotoImage` (or anything with width() and height())
+        """
+        cost = image.width() * image.height() * BYTES_PER_PIXEL
+        if cost > self.budget:
+            return  # Would evict everything else and still not fit
+        old = self._images.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self._images[key] = (image, cost)
+        self.size += cost
+        while self.size > self.budget:
+            _, (_, evicted_cost) = self._images.popitem(last=False)
+            self.size -= evicted_cost
+
+    def clear(self) -> None:
+        """
+        Drop all cached images.
+        """
+        self._images.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._images)
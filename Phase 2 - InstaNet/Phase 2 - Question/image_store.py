@@ -0,0 +1,213 @@
+"""
+This module implements the image files served by the `get_image` action.
+
+New images are kept in the content-addressed blob store; images uploaded
+before it existed live flat in the images directory. When an image is saved, its
+resized derivatives (see IMAGE_VARIANTS) are rendered on a process pool and
+stored under ``variants/`` in the images directory, so clients download an image
+already sized for where it is shown and the upload itself is never held up
+by decoding or resizing. Images stored before a derivative existed get it
+rendered the first time it is requested.
+
+Every file is identified by a content hash (its ETag). A blob's name already
+is its hash; for other files hashes are cached by path, modification time and
+size, so repeated requests for an unchanged image do not read it again. A
+client that already holds the current version can skip the transfer entirely.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from PIL import Image
+from blob_store import BlobStore
+from constants import IMAGES_DIR, IMAGE_VARIANTS, THUMBNAIL_WORKERS, BUFFER_SIZE
+
+
+def _render_variants(path: str, variant_paths: Dict[str, str]) -> None:
+    """
+    Render derivatives of one image. Runs in a worker process.
+
+    The image is decoded once, at the smallest scale that still covers the
+    largest derivative, then shrunk step by step from the largest to the
+    smallest derivative.
+
+    Args:
+        path (str): The original image
+        variant_paths (dict): Variant name -> file to write
+    """
+    names = sorted(variant_paths, key=lambda name: IMAGE_VARIANTS[name], reverse=True)
+    largest = IMAGE_VARIANTS[names[0]]
+    with Image.open(path) as image:
+        image.draft('RGB', (largest, largest))
+        image = image.convert('RGB')
+    for name in names:
+        size = IMAGE_VARIANTS[name]
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        tmp_path = f"{variant_paths[name]}.tmp"
+        image.save(tmp_path, 'JPEG', quality=85)
+        os.replace(tmp_path, variant_paths[name])
+
+
+class ImageStore:
+    """
+    Thread-safe access to stored images, their derivatives and content hashes.
+
+    Args:
+        blobs (BlobStore): The blob store holding uploaded images
+        directory (str): Directory holding images stored before the blob store
+        workers (int, optional): Processes rendering derivatives; None uses one per CPU
+    """
+
+    def __init__(self, blobs: BlobStore, directory: str = IMAGES_DIR,
+                 workers: Optional[int] = THUMBNAIL_WORKERS):
+        self.blobs = blobs
+        self.directory = directory
+        self.variants_dir = os.path.join(directory, 'variants')
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._etags: Dict[str, Tuple[int, int, str]] = {}
+
+    def resolve(self, image_path: str) -> Optional[str]:
+        """
+        Map an image path from a post or message to a blob or a file in the images directory.
+
+        Only the file name is used, so a path can never point outside the
+        store. Stored paths may use either separator.
+
+        Returns:
+            str: The file's path, or None if no such image exists
+        """
+        digest = self.blobs.digest_of(image_path)
+        if digest is not None:
+            return self.blobs.path(digest) if self.blobs.exists(digest) else None
+        name = os.path.basename(str(image_path).replace('\\', '/'))
+        if not name or name.startswith('.'):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def _variant_path(self, path: str, variant: str) -> str:
+        """
+        Return where a derivative of an original image is stored.
+        """
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.variants_dir, f"{stem}_{variant}.jpg")
+
+    def _executor(self) -> ProcessPoolExecutor:
+        """
+        Return the worker pool, starting it on first use. Must be called with the lock held.
+
+        Workers are spawned rather than forked, since the server is already
+        running threads when the first image arrives.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def render_variants(self, path: str) -> Future:
+        """
+        Render any missing or outdated derivatives of an image in the background.
+
+        Args:
+            path (str): The original image
+
+        Returns:
+            Future: Completes once every derivative is up to date
+        """
+        with self._lock:
+            future = self._pending.get(path)
+            if future is not None:
+                return future
+            mtime = os.path.getmtime(path)
+            stale = {}
+            for variant in IMAGE_VARIANTS:
+                variant_path = self._variant_path(path, variant)
+                if not os.path.exists(variant_path) or os.path.getmtime(variant_path) < mtime:
+                    stale[variant] = variant_path
+            if not stale:
+                future = Future()
+                future.set_result(None)
+                return future
+            os.makedirs(self.variants_dir, exist_ok=True)
+            future = self._executor().submit(_render_variants, path, stale)
+            self._pending[path] = future
+        future.add_done_callback(lambda done: self._finish(path, done))
+        return future
+
+    def _finish(self, path: str, future: Future) -> None:
+        """
+        Forget a completed render so later changes to the image are picked up.
+        """
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+        if future.exception() is not None:
+            print(f"[ERROR] Failed to render derivatives of {path}: {future.exception()}")
+
+    def variant(self, path: str, variant: Optional[str]) -> str:
+        """
+        Return the file to serve for a derivative, waiting for it to be rendered if needed.
+
+        Args:
+            path (str): The original image, as returned by `resolve`
+            variant (str, optional): A key of IMAGE_VARIANTS, or None for the original
+
+        Returns:
+            str: The path of the derivative's file
+        """
+        if variant is None or variant == 'original':
+            return path
+        if variant not in IMAGE_VARIANTS:
+            raise ValueError(f"Unknown image size: {variant}")
+        self.render_variants(path).result()
+        return self._variant_path(path, variant)
+
+    def etag(self, path: str) -> str:
+        """
+        Return the content hash of a file, reusing the cached value while it is unchanged.
+        """
+        digest = self.blobs.digest_of(path)
+        if digest is not None and path == self.blobs.path(digest):
+            return digest
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._etags.get(path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(BUFFER_SIZE * 16), b''):
+                digest.update(chunk)
+        etag = digest.hexdigest()
+        with self._lock:
+            self._etags[path] = (stat.st_mtime_ns, stat.st_size, etag)
+        return etag
+
+    def collect_garbage(self) -> int:
+        """
+        Remove unreferenced blobs together with their derivatives.
+
+        Returns:
+            int: Number of blobs removed
+        """
+        removed = self.blobs.collect_garbage()
+        for digest in removed:
+            for variant in IMAGE_VARIANTS:
+                variant_path = os.path.join(self.variants_dir, f"{digest}_{variant}.jpg")
+                if os.path.exists(variant_path):
+                    os.remove(variant_path)
+        return len(removed)
+
+    def close(self) -> None:
+        """
+        Wait for pending renders and stop the worker processes.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
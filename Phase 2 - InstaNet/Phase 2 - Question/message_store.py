@@ -0,0 +1,325 @@
+"""
+This module implements the append-only message log used by the server.
+
+Each conversation is stored as two files in the messages directory:
+- ``<user1>_<user2>.jsonl``: one JSON message per line, only ever appended to
+- ``<user1>_<user2>.idx``: the byte offset of every line as an 8-byte integer
+
+Sending a message appends one line and one index entry, so its cost does not
+depend on the length of the conversation. A message's id is its position in
+the log, and the index turns any id into a byte offset with a single seek, so
+a page of messages before or after a cursor is read without scanning the
+conversation. Conversations stored in the older single-array
+``.json`` format are converted the first time they are touched.
+
+The users an image was sent between are looked up in an index of image
+paths, built by reading every conversation once the first time it is needed
+and kept up to date by each append afterwards.
+"""
+
+import json
+import os
+import struct
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from constants import MESSAGES_DIR
+
+OFFSET = struct.Struct('!Q')
+
+
+class MessageLog:
+    """
+    Thread-safe store of per-conversation append-only message logs.
+
+    Args:
+        directory (str): Directory holding the conversation files
+    """
+
+    def __init__(self, directory: str = MESSAGES_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._conversation_locks: Dict[str, threading.Lock] = {}
+        self._counts: Dict[str, int] = {}
+        self._image_lock = threading.Lock()
+        self._image_users: Optional[Dict[str, Set[str]]] = None  # Image path -> sender and receiver
+
+    @staticmethod
+    def conversation_key(user1: str, user2: str) -> str:
+        """
+        Return the file name stem shared by both participants of a conversation.
+        """
+        usernames = sorted([user1, user2])
+        return f"{usernames[0]}_{usernames[1]}"
+
+    def _path(self, key: str, extension: str) -> str:
+        """
+        Return the path of one of a conversation's files.
+        """
+        return os.path.join(self.directory, f"{key}{extension}")
+
+    def _open_conversation(self, key: str) -> threading.Lock:
+        """
+        Return the conversation's lock, preparing its files on first touch.
+        """
+        with self._lock:
+            lock = self._conversation_locks.get(key)
+            if lock is None:
+                lock = self._conversation_locks[key] = threading.Lock()
+        with lock:
+            if key not in self._counts:
+                self._migrate_legacy(key)
+                self._counts[key] = self._check_index(key)
+        return lock
+
+    def _migrate_legacy(self, key: str) -> None:
+        """
+        Convert a ``.json`` array conversation into log and index files.
+        """
+        legacy_path = self._path(key, '.json')
+        log_path = self._path(key, '.jsonl')
+        if not os.path.exists(legacy_path) or os.path.exists(log_path):
+            return
+        with open(legacy_path, 'r') as f:
+            try:
+                messages = json.load(f)
+            except json.JSONDecodeError:
+                messages = []
+        offsets = bytearray()
+        with open(f"{log_path}.tmp", 'wb') as log:
+            for message in messages:
+                offsets += OFFSET.pack(log.tell())
+                log.write(_encode_line(message))
+        with open(f"{self._path(key, '.idx')}.tmp", 'wb') as index:
+            index.write(offsets)
+        os.replace(f"{self._path(key, '.idx')}.tmp", self._path(key, '.idx'))
+        os.replace(f"{log_path}.tmp", log_path)
+        os.remove(legacy_path)
+
+    def _check_index(self, key: str) -> int:
+        """
+        Make sure the index matches the log and return the message count.
+
+        A crash between appending a line and its index entry leaves the two
+        out of step; the index is then rebuilt from the log.
+        """
+        log_path = self._path(key, '.jsonl')
+        index_path = self._path(key, '.idx')
+        if not os.path.exists(log_path):
+            return 0
+        log_size = os.path.getsize(log_path)
+        index_size = os.path.getsize(index_path) if os.path.exists(index_path) else -1
+        if index_size >= 0 and index_size % OFFSET.size == 0:
+            count = index_size // OFFSET.size
+            if count == 0 and log_size == 0:
+                return 0
+            if count:
+                with open(index_path, 'rb') as index:
+                    index.seek(-OFFSET.size, os.SEEK_END)
+                    last_offset = OFFSET.unpack(index.read(OFFSET.size))[0]
+                with open(log_path, 'rb') as log:
+                    log.seek(last_offset)
+                    last_line = log.readline()
+                if last_line.endswith(b'\n') and last_offset + len(last_line) == log_size:
+                    return count
+        return self._rebuild_index(key)
+
+    def _rebuild_index(self, key: str) -> int:
+        """
+        Rewrite the index from the log, dropping a torn final line.
+        """
+        log_path = self._path(key, '.jsonl')
+        offsets = bytearray()
+        with open(log_path, 'rb+') as log:
+            offset = 0
+            for line in log:
+                if not line.endswith(b'\n'):
+                    log.truncate(offset)
+                    break
+                offsets += OFFSET.pack(offset)
+                offset += len(line)
+        index_path = self._path(key, '.idx')
+        with open(f"{index_path}.tmp", 'wb') as index:
+            index.write(offsets)
+        os.replace(f"{index_path}.tmp", index_path)
+        return len(offsets) // OFFSET.size
+
+    def append(self, user1: str, user2: str, message: Dict[str, Any]) -> int:
+        """
+        Append a message to a conversation.
+
+        Returns:
+            int: The message's position in the conversation
+        """
+        key = self.conversation_key(user1, user2)
+        lock = self._open_conversation(key)
+        with lock:
+            with open(self._path(key, '.jsonl'), 'ab') as log:
+                offset = log.tell()
+                log.write(_encode_line(message))
+            with open(self._path(key, '.idx'), 'ab') as index:
+                index.write(OFFSET.pack(offset))
+            message_id = self._counts[key]
+            self._counts[key] = message_id + 1
+            if message.get('image_path'):
+                self._index_image(message)
+        return message_id
+
+    def _index_image(self, message: Dict[str, Any]) -> None:
+        """
+        Record the users of an image message, once the image index exists.
+        """
+        with self._lock:
+            if self._image_users is not None:
+                users = self._image_users.setdefault(message['image_path'], set())
+                users.update((message.get('sender'), message.get('receiver')))
+
+    def image_users(self, image_path: str) -> Set[str]:
+        """
+        Return the users who sent or received an image in any conversation.
+        """
+        with self._image_lock:
+            if self._image_users is None:
+                # Publish the index first so that appends made while the logs
+                # are read are recorded too
+                with self._lock:
+                    self._image_users = {}
+                for key in self._conversation_keys():
+                    lock = self._open_conversation(key)
+                    with lock:
+                        if not os.path.exists(self._path(key, '.jsonl')):
+                            continue
+                        with open(self._path(key, '.jsonl'), 'rb') as log:
+                            for line in log:
+                                message = json.loads(line)
+                                if message.get('image_path'):
+                                    self._index_image(message)
+            with self._lock:
+                return set(self._image_users.get(image_path, ()))
+
+    def rewrite_image_paths(self, rename: Callable[[str], Optional[str]]) -> int:
+        """
+        Replace the image path of every message for which `rename` returns a new one.
+
+        Each changed conversation's log is rewritten and swapped in
+        atomically, and its index rebuilt.
+
+        Args:
+            rename (callable): Called once per image message with its image
+                path; returns the new path, or None to keep it
+
+        Returns:
+            int: The number of messages changed
+        """
+        changed = 0
+        for key in sorted(self._conversation_keys()):
+            lock = self._open_conversation(key)
+            with lock:
+                log_path = self._path(key, '.jsonl')
+                if not os.path.exists(log_path):
+                    continue
+                conversation_changed = 0
+                with open(log_path, 'rb') as log, open(f"{log_path}.tmp", 'wb') as out:
+                    for line in log:
+                        message = json.loads(line)
+                        new_path = rename(message['image_path']) if message.get('image_path') else None
+                        if new_path is not None:
+                            message['image_path'] = new_path
+                            line = _encode_line(message)
+                            conversation_changed += 1
+                        out.write(line)
+                if conversation_changed:
+                    os.replace(f"{log_path}.tmp", log_path)
+                    self._rebuild_index(key)
+                    changed += conversation_changed
+                else:
+                    os.remove(f"{log_path}.tmp")
+        with self._image_lock, self._lock:
+            self._image_users = None  # Rebuilt with the new paths on next use
+        return changed
+
+    def _conversation_keys(self) -> Set[str]:
+        """
+        Return the keys of all stored conversations, in either format.
+        """
+        if not os.path.isdir(self.directory):
+            return set()
+        return {
+            os.path.splitext(name)[0] for name in os.listdir(self.directory)
+            if name.endswith(('.jsonl', '.json'))
+        }
+
+    def count(self, user1: str, user2: str) -> int:
+        """
+        Return the number of messages in a conversation.
+        """
+        key = self.conversation_key(user1, user2)
+        self._open_conversation(key)
+        return self._counts[key]
+
+    def get_messages(self, user1: str, user2: str, limit: Optional[int] = None,
+                     before: Optional[int] = None, after: Optional[int] = None
+                     ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Return a page of a conversation in the order it was sent.
+
+        Args:
+            user1 (str): One participant of the conversation
+            user2 (str): The other participant
+            limit (int, optional): Maximum number of messages to return
+            before (int, optional): Only return messages with a smaller id
+            after (int, optional): Only return messages with a larger id
+
+        With `after`, the page starts right after the cursor; otherwise it
+        ends right before `before` (or at the newest message). Every message
+        carries its `id` for use as the next cursor.
+
+        Returns:
+            tuple: The messages and whether more exist beyond the page
+        """
+        key = self.conversation_key(user1, user2)
+        lock = self._open_conversation(key)
+        with lock:
+            count = self._counts[key]
+            low = 0 if after is None else max(after + 1, 0)
+            high = count if before is None else min(max(before, 0), count)
+            if low >= high:
+                return [], False
+            if limit is not None and high - low > limit:
+                if after is not None:
+                    start, end = low, low + limit
+                else:
+                    start, end = high - limit, high
+            else:
+                start, end = low, high
+            lines = self._read_lines(key, start, end, count)
+        messages = []
+        for message_id, line in enumerate(lines, start):
+            message = json.loads(line)
+            message['id'] = message_id
+            messages.append(message)
+        has_more = end < high if after is not None else start > low
+        return messages, has_more
+
+    def _read_lines(self, key: str, start: int, end: int, count: int) -> List[bytes]:
+        """
+        Read the log lines of messages `start` up to (not including) `end`.
+        """
+        with open(self._path(key, '.idx'), 'rb') as index:
+            index.seek(start * OFFSET.size)
+            start_offset = OFFSET.unpack(index.read(OFFSET.size))[0]
+            if end < count:
+                index.seek(end * OFFSET.size)
+                end_offset = OFFSET.unpack(index.read(OFFSET.size))[0]
+            else:
+                end_offset = None
+        with open(self._path(key, '.jsonl'), 'rb') as log:
+            log.seek(start_offset)
+            data = log.read() if end_offset is None else log.read(end_offset - start_offset)
+        return data.splitlines()
+
+
+def _encode_line(message: Dict[str, Any]) -> bytes:
+    """
+    Encode a message as a single newline-terminated JSON line.
+    """
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
@@ -0,0 +1,332 @@
+"""
+This module implements the server's metrics registry and its HTTP exposition.
+
+Metrics are counters, gauges and histograms, optionally split by labels,
+and are rendered in the Prometheus text format (version 0.0.4). The server
+records:
+
+- requests per action and status, and their latency
+- bytes received and sent per action
+- open connections
+- requests waiting for a worker, and requests shed because too many were waiting
+- bytes of images in the blob store
+- time spent in each storage operation, split into reads and writes
+
+`serve_metrics` publishes a registry on a local HTTP port, where a
+Prometheus server (or curl) can scrape ``/metrics``.
+"""
+
+import bisect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from constants import METRICS_HOST, METRICS_LATENCY_BUCKETS
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class _Metric(ABC):
+    """
+    Base of all metric types: a name, help text and label names.
+    """
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labelvalues: Tuple) -> Tuple:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labelvalues}")
+        return tuple(str(value) for value in labelvalues)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """
+        Return (name suffix, label names, label values, value) for every sample.
+        """
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, such as a number of requests.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        """
+        Add to the counter of the given label values.
+        """
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, *labelvalues) -> float:
+        with self._lock:
+            return self._values.get(self._key(labelvalues), 0)
+
+    def samples(self):
+        with self._lock:
+            return [('', self.labelnames, key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, set directly or read from a function when scraped.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._function = function
+
+    def set(self, value: float, *labelvalues) -> None:
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def get(self, *labelvalues) -> float:
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return self._values.get(self._key(labelvalues), 0)
+
+    def samples(self):
+        if self._function is not None:
+            return [('', (), (), self._function())]
+        with self._lock:
+            return [('', self.labelnames, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """
+    Counts of observed values (such as latencies in seconds) in cumulative buckets.
+
+    Args:
+        buckets (sequence): Upper bounds of the buckets, in increasing order
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = METRICS_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, List] = {}  # Label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labelvalues) -> None:
+        key = self._key(labelvalues)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def count(self, *labelvalues) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labelvalues))
+            return sum(entry[:-1]) if entry else 0
+
+    def samples(self):
+        names = self.labelnames + ('le',)
+        samples = []
+        with self._lock:
+            entries = sorted((key, list(entry)) for key, entry in self._values.items())
+        for key, entry in entries:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), entry[:-1]):
+                cumulative += count
+                samples.append(('_bucket', names, key + (_format_value(bound),), cumulative))
+            samples.append(('_sum', self.labelnames, key, entry[-1]))
+            samples.append(('_count', self.labelnames, key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    A set of metrics rendered together.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if any(existing.name == metric.name for existing in self._metrics):
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = METRICS_LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text format.
+        """
+        return ''.join(metric.render() for metric in self._metrics)
+
+
+class ServerMetrics:
+    """
+    The metrics recorded by `InstagramServer`.
+
+    Args:
+        connections (callable): Returns the number of open connections
+        stored_image_bytes (callable): Returns the bytes of images in the blob store
+        queued_requests (callable): Returns the number of requests waiting for a worker
+    """
+
+    def __init__(self, connections: Callable[[], int], stored_image_bytes: Callable[[], int],
+                 queued_requests: Callable[[], int]):
+        self.registry = MetricsRegistry()
+        self.requests = self.registry.counter(
+            'instanet_requests_total', 'Requests processed, by action and response status.', ('action', 'status'))
+        self.latency = self.registry.histogram(
+            'instanet_request_duration_seconds', 'Time spent processing requests, by action.', ('action',))
+        self.received_bytes = self.registry.counter(
+            'instanet_received_bytes_total', 'Bytes of requests and uploads received, by action.', ('action',))
+        self.sent_bytes = self.registry.counter(
+            'instanet_sent_bytes_total', 'Bytes of responses and images sent, by action.', ('action',))
+        self.registry.gauge('instanet_connections', 'Open client connections.', function=connections)
+        self.registry.gauge('instanet_image_stored_bytes', 'Bytes of images in the blob store.',
+                            function=stored_image_bytes)
+        self.registry.gauge('instanet_queued_requests', 'Requests waiting for a worker in pool mode.',
+                            function=queued_requests)
+        self.rejected = self.registry.counter(
+            'instanet_rejected_requests_total', 'Requests shed with a busy status, by action.', ('action',))
+        self.storage_latency = self.registry.histogram(
+            'instanet_storage_duration_seconds', 'Time spent in storage operations, by operation and kind.',
+            ('operation', 'kind'))
+
+    def observe_request(self, action: str, status: str, seconds: float) -> None:
+        self.requests.inc(action, status)
+        self.latency.observe(seconds, action)
+
+    def observe_traffic(self, action: str, received: int, sent: int) -> None:
+        self.received_bytes.inc(action, amount=received)
+        self.sent_bytes.inc(action, amount=sent)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+class TimedStorage:
+    """
+    Wraps a storage backend, recording the duration of every call.
+
+    Args:
+        storage (Storage): The backend to wrap
+        histogram (Histogram): Receives durations labelled by operation and kind
+        writes (set): Names of the operations that modify data
+    """
+
+    def __init__(self, storage, histogram: Histogram, writes: frozenset):
+        self._storage = storage
+        self._histogram = histogram
+        self._writes = writes
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._storage, name)
+        if name.startswith('_') or name == 'close' or not callable(attribute):
+            return attribute
+        kind = 'write' if name in self._writes else 'read'
+        histogram = self._histogram
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, name, kind)
+
+        setattr(self, name, timed)  # Later calls skip __getattr__
+        return timed
+
+
+def serve_metrics(render: Callable[[], str], port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """
+    Serve metrics over HTTP from a background thread.
+
+    Args:
+        render (callable): Returns the metrics in the Prometheus text format
+        port (int): Port to listen on
+        host (str): Address to listen on; local only by default
+
+    Returns:
+        ThreadingHTTPServer: The running server; call `shutdown` to stop it
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes are too frequent to print
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name='metrics-http', daemon=True).start()
+    return httpd
@@ -0,0 +1,115 @@
+"""
+This module implements the background network worker used by the client GUI.
+
+Tk widgets may only be touched from the thread running the main loop, and
+any blocking call on that thread freezes the whole window. The worker owns a
+single I/O thread that runs queued jobs (socket requests, uploads, image
+downloads) one at a time, in submission order, so request/response pairs on
+the shared connection never interleave. Each job returns a future; completed
+futures are handed back to the Tk thread, which polls for them with
+`root.after`, and their callbacks run there.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+from constants import NETWORK_POLL_INTERVAL
+
+
+class NetworkWorker:
+    """
+    Runs blocking jobs on one background thread and delivers results to the Tk thread.
+
+    Args:
+        root: The Tk root window whose main loop receives the results
+        poll_interval (int): Milliseconds between checks for completed jobs
+    """
+
+    def __init__(self, root, poll_interval: int = NETWORK_POLL_INTERVAL):
+        self.root = root
+        self.poll_interval = poll_interval
+        self._jobs: queue.Queue = queue.Queue()
+        self._completed: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="network-worker", daemon=True)
+        self._thread.start()
+        self._poll_job = self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, fn: Callable[..., Any], *args, callback: Optional[Callable[[Any], None]] = None,
+               errback: Optional[Callable[[Exception], None]] = None) -> Future:
+        """
+        Queue a job for the I/O thread.
+
+        Args:
+            fn (callable): The blocking function to run
+            *args: Arguments for fn
+            callback (callable, optional): Called on the Tk thread with fn's result
+            errback (callable, optional): Called on the Tk thread with the exception
+                if fn raised; without one the error is printed
+
+        Returns:
+            Future: The job's future
+        """
+        future = Future()
+        self._jobs.put((fn, args, future))
+        if callback is not None or errback is not None:
+            future.add_done_callback(lambda done: self._completed.put((done, callback, errback)))
+        return future
+
+    def call_soon(self, fn: Callable[..., Any], *args) -> None:
+        """
+        Run fn(*args) on the Tk thread. Safe to call from any thread.
+        """
+        done = Future()
+        done.set_result(None)
+        self._completed.put((done, lambda _: fn(*args), None))
+
+    def _run(self) -> None:
+        """
+        Run queued jobs until `stop` is called.
+        """
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            fn, args, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _poll(self) -> None:
+        """
+        Run the callbacks of completed jobs on the Tk thread.
+        """
+        while True:
+            try:
+                future, callback, errback = self._completed.get_nowait()
+            except queue.Empty:
+                break
+            error = future.exception()
+            try:
+                if error is None:
+                    if callback is not None:
+                        callback(future.result())
+                elif errback is not None:
+                    errback(error)
+                else:
+                    print(f"Network error: {error}")
+            except Exception as e:
+                print(f"Error in network callback: {e}")
+        self._poll_job = self.root.after(self.poll_interval, self._poll)
+
+    def stop(self) -> None:
+        """
+        Stop the I/O thread once the jobs already queued have run.
+        """
+        self._jobs.put(None)
+        if self._poll_job is not None:
+            try:
+                self.root.after_cancel(self._poll_job)
+            except Exception:
+                pass  # The window is already gone
+            self._poll_job = None
@@ -0,0 +1,294 @@
+"""
+This module implements the in-memory post store used by the JSON storage backend.
+
+Posts are persisted in ``posts.jsonl``, an append-only log next to the
+configured posts file with one JSON record per line: ``{"post": {...}}``
+for a new post and ``{"comment": {...}, "post_id": n}`` for a comment.
+Adding a post or a comment appends one line, so its cost does not depend on
+the number of posts. A ``posts.json`` array from older releases is converted
+into the log the first time the store is opened.
+
+The log is replayed once at startup and kept in memory together with three
+indexes:
+- the ids of each author's posts, in posting order
+- the id of the post owning each image path
+- the authors of the posts showing each image, which decides who may
+  download it
+
+A post's id is its position among the post records. Feed pages are built
+from the authors' id lists, so the cost of a page depends on the page size
+and the number of authors rather than on the total number of posts.
+"""
+
+import bisect
+import heapq
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from constants import POSTS_FILE
+
+
+class PostStore:
+    """
+    Thread-safe post store indexed by author and image path.
+
+    Args:
+        path (str): Path to the posts JSON file; the log is kept beside it
+            with a ``.jsonl`` extension
+    """
+
+    def __init__(self, path: str = POSTS_FILE):
+        self.path = path
+        self.log_path = _log_path(path)
+        self._lock = threading.Lock()
+        self._posts: List[Dict[str, Any]] = []
+        self._by_author: Dict[str, List[int]] = {}
+        self._by_image: Dict[str, int] = {}
+        self._image_authors: Dict[str, Set[str]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        """
+        Replay the log into memory, converting a legacy posts.json first.
+
+        A crash while appending can leave a torn final line; it is dropped.
+        Comments on posts the log does not hold are skipped with a warning.
+        """
+        self._migrate_legacy()
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb+') as log:
+            end = 0
+            for end, record in _records(log):
+                if 'post' in record:
+                    self._index(record['post'])
+                else:
+                    _replay_comment(self._posts, record, self.log_path)
+            log.truncate(end)
+
+    def _migrate_legacy(self) -> None:
+        """
+        Convert a posts.json array into the log, treating a corrupt file as empty.
+        """
+        if not os.path.exists(self.path) or os.path.exists(self.log_path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                posts = json.load(f)
+        except json.JSONDecodeError:
+            posts = []
+        with open(f"{self.log_path}.tmp", 'wb') as log:
+            for post in posts:
+                log.write(_encode_line({'post': post}))
+        os.replace(f"{self.log_path}.tmp", self.log_path)
+        os.remove(self.path)
+
+    def _index(self, post: Dict[str, Any]) -> int:
+        """
+        Add a post to memory and the indexes. Must be called with the lock held.
+        """
+        post_id = len(self._posts)
+        self._posts.append(post)
+        self._by_author.setdefault(post.get('username'), []).append(post_id)
+        self._by_image.setdefault(post.get('image_path'), post_id)
+        self._image_authors.setdefault(post.get('image_path'), set()).add(post.get('username'))
+        return post_id
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        """
+        Append a record to the log. Must be called with the lock held.
+        """
+        with open(self.log_path, 'ab') as log:
+            log.write(_encode_line(record))
+
+    def add(self, post: Dict[str, Any]) -> int:
+        """
+        Store a new post.
+
+        Returns:
+            int: The post's id
+        """
+        post = dict(post)
+        with self._lock:
+            self._append({'post': post})
+            post_id = self._index(post)
+        return post_id
+
+    def add_comment(self, image_path: str, user: str, text: str, post_id: Optional[int] = None) -> bool:
+        """
+        Add a comment to the post with the given id, or else the first post
+        with the given image; False if not found.
+        """
+        with self._lock:
+            if post_id is None:
+                post_id = self._by_image.get(image_path)
+            elif not isinstance(post_id, int) or not 0 <= post_id < len(self._posts):
+                return False
+            if post_id is None:
+                return False
+            comment = {'user': user, 'text': text}
+            self._append({'comment': comment, 'post_id': post_id})
+            self._posts[post_id].setdefault('comments', []).append(comment)
+        return True
+
+    def rewrite_image_paths(self, rename: Callable[[str], Optional[str]]) -> int:
+        """
+        Replace the image path of every post for which `rename` returns a new one.
+
+        The log is rewritten in one pass and swapped in atomically.
+
+        Args:
+            rename (callable): Called once per post with its image path;
+                returns the new path, or None to keep it
+
+        Returns:
+            int: The number of posts changed
+        """
+        with self._lock:
+            if not os.path.exists(self.log_path):
+                return 0
+            changed = 0
+            tmp_path = f"{self.log_path}.tmp"
+            with open(self.log_path, 'rb') as log, open(tmp_path, 'wb') as out:
+                post_id = 0
+                for _, record in _records(log):
+                    if 'post' in record:
+                        image_path = record['post'].get('image_path')
+                        new_path = rename(image_path) if image_path else None
+                        if new_path is not None:
+                            record['post']['image_path'] = new_path
+                            self._posts[post_id]['image_path'] = new_path
+                            changed += 1
+                        post_id += 1
+                    out.write(_encode_line(record))
+            if not changed:
+                os.remove(tmp_path)
+                return 0
+            os.replace(tmp_path, self.log_path)
+            self._by_image = {}
+            self._image_authors = {}
+            for post_id, post in enumerate(self._posts):
+                self._by_image.setdefault(post.get('image_path'), post_id)
+                self._image_authors.setdefault(post.get('image_path'), set()).add(post.get('username'))
+        return changed
+
+    def image_authors(self, image_path: str) -> Set[str]:
+        """
+        Return the authors of the posts showing an image.
+        """
+        with self._lock:
+            return set(self._image_authors.get(image_path, ()))
+
+    def list_posts(self) -> List[Dict[str, Any]]:
+        """
+        Return copies of all posts, oldest first.
+        """
+        with self._lock:
+            posts = [self._copy(post_id) for post_id in range(len(self._posts))]
+        for post in posts:
+            del post['id']
+        return posts
+
+    def get_feed(self, authors: Iterable[str], limit: int,
+                 before: Optional[int] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Return the newest posts by any of the given authors.
+
+        Args:
+            authors (iterable): Usernames whose posts make up the feed
+            limit (int): Maximum number of posts to return
+            before (int, optional): Only return posts with a smaller id
+
+        Returns:
+            tuple: The posts, newest first and each carrying its `id`, and
+                whether older posts exist beyond the page
+        """
+        with self._lock:
+            candidates = []
+            for author in set(authors):
+                ids = self._by_author.get(author)
+                if not ids:
+                    continue
+                end = len(ids) if before is None else bisect.bisect_left(ids, before)
+                # Only an author's newest limit + 1 posts can reach the page
+                candidates.extend(ids[max(0, end - limit - 1):end])
+            newest = heapq.nlargest(limit + 1, candidates)
+            return [self._copy(post_id) for post_id in newest[:limit]], len(newest) > limit
+
+    def _copy(self, post_id: int) -> Dict[str, Any]:
+        """
+        Copy a post for returning to a caller. Must be called with the lock held.
+        """
+        post = dict(self._posts[post_id])
+        if 'comments' in post:
+            post['comments'] = list(post['comments'])
+        post['id'] = post_id
+        return post
+
+
+def _encode_line(record: Dict[str, Any]) -> bytes:
+    """
+    Encode a log record as a single newline-terminated JSON line.
+    """
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def read_posts(path: str = POSTS_FILE) -> List[Dict[str, Any]]:
+    """
+    Read the posts of a data tree, oldest first, without changing its files.
+
+    Args:
+        path (str): Path to the posts JSON file, as given to `PostStore`
+
+    Returns:
+        list: The posts, each with its comments
+    """
+    log_path = _log_path(path)
+    if not os.path.exists(log_path):
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return json.load(f)
+    posts = []
+    with open(log_path, 'rb') as log:
+        for _, record in _records(log):
+            if 'post' in record:
+                posts.append(record['post'])
+            else:
+                _replay_comment(posts, record, log_path)
+    return posts
+
+
+def _replay_comment(posts: List[Dict[str, Any]], record: Dict[str, Any], log_path: str) -> None:
+    """
+    Attach a logged comment to its post, skipping it if the post is unknown.
+    """
+    post_id = record.get('post_id')
+    if not isinstance(post_id, int) or not 0 <= post_id < len(posts):
+        print(f"[WARNING] Skipping comment on unknown post {post_id!r} in {log_path}")
+        return
+    posts[post_id].setdefault('comments', []).append(record['comment'])
+
+
+def _log_path(path: str) -> str:
+    """
+    Return the path of the log kept beside a posts JSON file.
+    """
+    return f"{os.path.splitext(path)[0]}.jsonl"
+
+
+def _records(log) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yield each complete record of a log with the offset just past it, stopping at a torn line.
+    """
+    offset = 0
+    for line in log:
+        if not line.endswith(b'\n'):
+            return
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            return
+        offset += len(line)
+        yield offset, record
@@ -0,0 +1,285 @@
+"""
+This module implements the table mapping request actions to their handlers.
+
+Every action is registered once, with its handler and metadata describing it:
+
+- whether the connection must be logged in, and which request field names
+  the user the action is performed as
+- whether the action changes stored data
+- whether an image upload follows the request
+- whether the handler needs the client's connection
+
+Dispatching a request is a single dictionary lookup. Middleware wrap every
+dispatch, so authorization, timing, tracing and rate limiting are written
+once instead of in each handler. A middleware is a callable
+``middleware(call, proceed)`` that receives the `Call` being dispatched and
+returns the response, usually by returning ``proceed(call)``.
+"""
+
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Union
+
+INVALID_ACTION = 'invalid'  # Label of requests naming no registered action
+
+
+class Route:
+    """
+    A registered action.
+
+    Args:
+        action (str): The action's name in requests
+        handler (callable): Called with the request, plus `upload` and `conn`
+            keyword arguments when the route expects them
+        auth_required (bool): Whether the connection must be logged in;
+            enforced by the `authorize` middleware
+        actor (str, optional): The request field naming the user the action is
+            performed as, which must be the logged-in user
+        mutating (bool): Whether the action changes stored data
+        expects_image (bool or callable): Whether an image upload follows the
+            request, or a function deciding it from the request
+        uses_connection (bool): Whether the handler receives the connection
+    """
+
+    def __init__(self, action: str, handler: Callable, auth_required: bool = False, actor: Optional[str] = None,
+                 mutating: bool = False, expects_image: Union[bool, Callable[[dict], bool]] = False,
+                 uses_connection: bool = False):
+        self.action = action
+        self.handler = handler
+        self.auth_required = auth_required or actor is not None
+        self.actor = actor
+        self.mutating = mutating
+        self.expects_image = expects_image
+        self.uses_connection = uses_connection or auth_required
+
+    def has_image(self, request: dict) -> bool:
+        """
+        Check whether an image upload follows a request for this action.
+        """
+        if callable(self.expects_image):
+            return bool(self.expects_image(request))
+        return self.expects_image
+
+    def __call__(self, call: 'Call') -> dict:
+        kwargs = {}
+        if self.expects_image:
+            kwargs['upload'] = call.upload
+        if self.uses_connection:
+            kwargs['conn'] = call.conn
+        return self.handler(call.request, **kwargs)
+
+
+class Call:
+    """
+    A request being dispatched, as seen by middleware.
+
+    Args:
+        request (dict): The client's request
+        route (Route): The request's route, or None for an unknown action
+        upload (BlobWriter, optional): The image uploaded with the request
+        conn (optional): The client's connection
+    """
+
+    __slots__ = ('request', 'route', 'upload', 'conn')
+
+    def __init__(self, request: dict, route: Optional[Route], upload=None, conn=None):
+        self.request = request
+        self.route = route
+        self.upload = upload
+        self.conn = conn
+
+    @property
+    def action(self) -> str:
+        """
+        The action's name, or `INVALID_ACTION` for unknown actions.
+        """
+        return self.route.action if self.route is not None else INVALID_ACTION
+
+
+Middleware = Callable[[Call, Callable[[Call], dict]], dict]
+
+
+class Router:
+    """
+    Dispatches requests to the handler registered for their action.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+        self.middleware: List[Middleware] = []
+        self._pipeline = self._invoke
+
+    def add(self, action: str, handler: Callable, **metadata: Any) -> Route:
+        """
+        Register the handler of an action.
+
+        Args:
+            action (str): The action's name in requests
+            handler (callable): The handler
+            **metadata: The route's metadata, see `Route`
+
+        Returns:
+            Route: The registered route
+        """
+        if action in self.routes:
+            raise ValueError(f"Action {action} is already registered")
+        route = self.routes[action] = Route(action, handler, **metadata)
+        return route
+
+    def use(self, middleware: Middleware) -> None:
+        """
+        Add a middleware around every dispatch.
+
+        Middleware run in the order they were added; the first one added is
+        the outermost.
+        """
+        self.middleware.append(middleware)
+        pipeline = self._invoke
+        for outer in reversed(self.middleware):
+            pipeline = _chain(outer, pipeline)
+        self._pipeline = pipeline
+
+    def lookup(self, request: dict) -> Optional[Route]:
+        """
+        Return the route of a request's action, or None if it is unknown.
+        """
+        action = request.get('action')
+        return self.routes.get(action) if isinstance(action, str) else None
+
+    def label(self, request: dict) -> str:
+        """
+        Return a request's action, or `INVALID_ACTION` if it is unknown.
+        """
+        route = self.lookup(request)
+        return route.action if route is not None else INVALID_ACTION
+
+    def has_image(self, request: dict) -> bool:
+        """
+        Check whether an image upload follows a request.
+        """
+        route = self.lookup(request)
+        return route is not None and route.has_image(request)
+
+    def dispatch(self, request: dict, upload=None, conn=None) -> dict:
+        """
+        Pass a request through the middleware to its handler.
+
+        Args:
+            request (dict): The client's request
+            upload (BlobWriter, optional): The image uploaded with the request
+            conn (optional): The client's connection
+
+        Returns:
+            dict: The response to send back to the client
+        """
+        return self._pipeline(Call(request, self.lookup(request), upload, conn))
+
+    @staticmethod
+    def _invoke(call: Call) -> dict:
+        route = call.route
+        if route is None:
+            return {'status': 'error', 'message': 'Invalid action'}
+        return route(call)
+
+
+def _chain(middleware: Middleware, proceed: Callable[[Call], dict]) -> Callable[[Call], dict]:
+    return lambda call: middleware(call, proceed)
+
+
+def authorize(call: Call, proceed: Callable[[Call], dict]) -> dict:
+    """
+    Middleware refusing requests their connection may not make.
+
+    Routes with `auth_required` need a logged-in connection, and the user
+    named in a route's `actor` field must be the one logged in, so no
+    connection can act on another user's behalf.
+    """
+    route = call.route
+    if route is None or not route.auth_required:
+        return proceed(call)
+    username = getattr(call.conn, 'username', None)
+    if username is None:
+        return {'status': 'error', 'message': 'Login required'}
+    if route.actor is not None and call.request.get(route.actor) != username:
+        return {'status': 'error', 'message': 'Permission denied'}
+    return proceed(call)
+
+
+def timing(observe: Callable[[str, str, float], None]) -> Middleware:
+    """
+    Build a middleware reporting every request's duration.
+
+    Args:
+        observe (callable): Called with the action, the response status and
+            the duration in seconds
+
+    Returns:
+        callable: The middleware
+    """
+    def middleware(call, proceed):
+        start = time.perf_counter()
+        response = proceed(call)
+        observe(call.action, response.get('status', 'unknown'), time.perf_counter() - start)
+        return response
+    return middleware
+
+
+def trace_slow(threshold: float) -> Middleware:
+    """
+    Build a middleware printing requests slower than a threshold.
+
+    Args:
+        threshold (float): Duration, in seconds, above which a request is printed
+
+    Returns:
+        callable: The middleware
+    """
+    def middleware(call, proceed):
+        start = time.perf_counter()
+        response = proceed(call)
+        elapsed = time.perf_counter() - start
+        if elapsed >= threshold:
+            user = getattr(call.conn, 'username', None) or '-'
+            print(f"[TRACE] {call.action} by {user} took {elapsed * 1000:.1f} ms "
+                  f"({response.get('status', 'unknown')})")
+        return response
+    return middleware
+
+
+def rate_limit(rate: float, burst: int) -> Middleware:
+    """
+    Build a middleware limiting how fast each connection may change data.
+
+    Every connection has a bucket of `burst` tokens, refilled at `rate`
+    tokens per second; each mutating request takes one. Requests finding
+    the bucket empty are refused without reaching their handler. Reads and
+    requests without a connection are never limited.
+
+    Args:
+        rate (float): Mutating requests allowed per second, per connection
+        burst (int): Mutating requests a connection may send at once
+
+    Returns:
+        callable: The middleware
+    """
+    buckets = weakref.WeakKeyDictionary()  # Connection -> [tokens, time of last refill]
+    lock = threading.Lock()
+
+    def middleware(call, proceed):
+        if call.conn is None or call.route is None or not call.route.mutating:
+            return proceed(call)
+        now = time.monotonic()
+        with lock:
+            bucket = buckets.get(call.conn)
+            if bucket is None:
+                bucket = buckets[call.conn] = [burst, now]
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+        if not allowed:
+            return {'status': 'error', 'message': 'Rate limit exceeded'}
+        return proceed(call)
+    return middleware
@@ -11,22 +11,41 @@ The module provides:
 - Real-time updates
 - Image message handling
 
-The server handles client connections using sockets and maintains the application's
-state through JSON file storage.
+The server handles client connections using sockets. Application state is
+kept in a pluggable storage backend, JSON files or SQLite (see ``--storage``).
+
+Connections are served by one of three engines (see ``--mode``):
+- threaded: one thread per client
+- asyncio: a single event loop for every client
+- pool: the event loop, running requests on a bounded worker pool that sheds
+  excess load
+
+Request, traffic and storage metrics can be scraped in the Prometheus format
+(see ``--metrics-port``). Actions are dispatched through the table in
+``router.py``, whose middleware can rate limit changes (see ``--rate-limit``)
+and trace slow requests (see ``--trace-slow``).
 """
 
+import asyncio
 import threading
-import json
+from concurrent.futures import ThreadPoolExecutor
 import os
 from pathlib import Path
-import base64
-import sys
+import signal
 import argparse
-from socket_utils import create_server_socket, send_json_message, receive_json_message, send_json_message_with_image, receive_json_message_with_image, receive_image
+from socket_utils import create_server_socket, MessageConnection, AsyncMessageConnection
+from storage import create_storage, WRITE_OPERATIONS
+from metrics import ServerMetrics, TimedStorage, serve_metrics
+from router import Router, authorize, timing, trace_slow, rate_limit
+from admission import AdmissionControl
+from blob_store import BlobStore
+from image_store import ImageStore
 from constants import (
     DEFAULT_HOST, DEFAULT_PORT, DATA_DIRECTORIES,
-    USERS_FILE, DEFAULT_USERS_COUNT, DEFAULT_USER_PREFIX,
-    DEFAULT_PASS_PREFIX
+    DEFAULT_USERS_COUNT, DEFAULT_USER_PREFIX,
+    DEFAULT_PASS_PREFIX, MAX_MESSAGES_PAGE, FEED_PAGE_SIZE, MAX_FEED_PAGE, SERVER_MODES, DEFAULT_SERVER_MODE,
+    ASYNC_BACKLOG, STORAGE_WORKERS, STORAGE_BACKENDS, DEFAULT_STORAGE, SQLITE_DB_FILE,
+    MAX_IMAGE_SIZE, MAX_IMAGE_DRAIN, METRICS_HOST, RATE_LIMIT_BURST, POOL_WORKERS, POOL_QUEUE_SIZE, BUSY_RETRY_AFTER
 )
 
 class InstagramServer:
@@ -41,23 +60,52 @@ class InstagramServer:
     - Message handling
     """
     
-    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, storage=DEFAULT_STORAGE, db_path=SQLITE_DB_FILE,
+                 max_image_size=MAX_IMAGE_SIZE, metrics_port=None, rate_limit=None, trace_slow=None):
         """
         Initialize the Instagram server.
         
         Args:
             host (str): The host address to bind to
             port (int): The port number to bind to
+            storage (str): The storage backend, 'json' or 'sqlite'
+            db_path (str): Database path for the SQLite backend
+            max_image_size (int): Largest image upload accepted, in bytes
+            metrics_port (int, optional): Local port serving metrics over HTTP
+            rate_limit (float, optional): Mutating requests allowed per second on each connection
+            trace_slow (float, optional): Print requests taking longer than this many seconds
         """
         self.host = host
+        self.max_image_size = max_image_size
         self.server_socket, self.port = create_server_socket(host, port)
         print(f"Server started on {self.host}:{self.port}")
             
         self.clients = {}
+        self.subscribers = {}  # Username -> connections receiving pushed events
+        self.subscribers_lock = threading.Lock()
+        self.executor = None  # Storage executor used by the asyncio engine
+        self.admission = None  # Bounds the requests queued for the executor in pool mode
+        self.metrics = ServerMetrics(
+            connections=lambda: len(self.clients),
+            stored_image_bytes=lambda: self.blobs.stored_bytes,
+            queued_requests=lambda: self.admission.queue_depth if self.admission is not None else 0
+        )
         self.setup_data_directories()
+        self.storage = create_storage(storage, db_path)
+        if metrics_port is not None:
+            # Storage calls are only timed when the metrics are served, as timing every call has a cost
+            self.storage = TimedStorage(self.storage, self.metrics.storage_latency, WRITE_OPERATIONS)
         self.load_default_users()
-        self.images = {}  # Store images in memory
-        self.posts = []   # Store posts in memory
+        self.blobs = BlobStore()
+        self.images = ImageStore(self.blobs)
+        self.router = self.create_router(rate_limit, trace_slow)
+        removed = self.images.collect_garbage()
+        if removed:
+            print(f"Removed {removed} unreferenced images")
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = serve_metrics(self.metrics.render, metrics_port)
+            print(f"Metrics available at http://{METRICS_HOST}:{metrics_port}/metrics")
 
     def setup_data_directories(self):
         """
@@ -80,13 +128,9 @@ class InstagramServer:
         If no users exist, this method creates a set of default users
         with predictable usernames and passwords for testing purposes.
         """
-        if not os.path.exists(USERS_FILE):
-            default_users = {
-                f"{DEFAULT_USER_PREFIX}{i}": {"password": f"{DEFAULT_PASS_PREFIX}{i}", "friends": [], "requests": []}
-                for i in range(1, DEFAULT_USERS_COUNT + 1)
-            }
-            with open(USERS_FILE, 'w') as f:
-                json.dump(default_users, f, indent=4)
+        if not self.storage.list_usernames():
+            for i in range(1, DEFAULT_USERS_COUNT + 1):
+                self.storage.create_user(f"{DEFAULT_USER_PREFIX}{i}", f"{DEFAULT_PASS_PREFIX}{i}")
 
     def handle_client(self, client_socket, address):
         """
@@ -100,65 +144,252 @@ class InstagramServer:
         1. Receives and processes client requests
         2. Sends appropriate responses
         3. Handles connection cleanup
+        
+        The wire protocol (framed or legacy bare JSON) is detected from the
+        first message and used for every response on the connection.
         """
+        conn = MessageConnection(client_socket, framed=None)
         try:
             while True:
-                request = receive_json_message(client_socket)
+                received, sent = conn.bytes_received, conn.bytes_sent
+                request = conn.receive_message()
                 if not request:
                     break
-                response = self.process_request(request, client_socket)
-                send_json_message(client_socket, response)
+                upload = None
+                response = None
+                hang_up = False
+                try:
+                    if conn.image_attached or self.request_has_image(request):
+                        if not conn.image_attached:
+                            # Legacy upload handshake: ready -> image bytes -> success
+                            conn.send_message({'status': 'ready'})
+                        size = conn.receive_image_size()
+                        if size > self.max_image_size:
+                            response = self.image_too_large_response(request)
+                            if size - self.max_image_size > MAX_IMAGE_DRAIN:
+                                # Too far over the limit to drain; answer and hang up
+                                hang_up = True
+                            else:
+                                # Drain the rejected bytes so the connection stays usable
+                                conn.skip_image(size)
+                        else:
+                            upload = self.blobs.writer()
+                            conn.receive_image_into(upload, size)
+                        if not conn.image_attached and not hang_up:
+                            conn.send_message({'status': 'success'})
+                    if response is None:
+                        response = self.process_request(request, upload, conn)
+                finally:
+                    if upload is not None:
+                        upload.discard()
+                image_file = response.pop('_image_file', None)
+                if image_file:
+                    conn.send_message_with_file(response, image_file)
+                else:
+                    conn.send_message(response)
+                self.metrics.observe_traffic(self.action_label(request), conn.bytes_received - received,
+                                             conn.bytes_sent - sent)
+                if hang_up:
+                    break
 
         except Exception as e:
             print(f"Error handling client {address}: {e}")
         finally:
+            self.unsubscribe(conn)
             if address in self.clients:
                 del self.clients[address]
             client_socket.close()
 
-    def process_request(self, request, client_socket):
+    async def handle_client_async(self, reader, writer):
+        """
+        Handle an individual client connection on the asyncio event loop.
+        
+        Args:
+            reader: The asyncio stream reader for the connection
+            writer: The asyncio stream writer for the connection
+            
+        Socket I/O runs on the event loop, while `process_request` (which
+        touches the JSON storage files) runs on the storage executor so a
+        slow disk never stalls other connections. In pool mode, requests the
+        executor has no room for are answered with a 'busy' status instead.
+        """
+        address = writer.get_extra_info('peername')
+        self.clients[address] = writer
+        loop = asyncio.get_running_loop()
+        conn = AsyncMessageConnection(reader, writer, framed=None)
+        try:
+            while True:
+                received, sent = conn.bytes_received, conn.bytes_sent
+                request = await conn.receive_message()
+                if not request:
+                    break
+                upload = None
+                response = None
+                hang_up = False
+                admitted = False
+                try:
+                    if conn.image_attached or self.request_has_image(request):
+                        if not conn.image_attached:
+                            # Legacy upload handshake: ready -> image bytes -> success
+                            await conn.send_message({'status': 'ready'})
+                        size = await conn.receive_image_size()
+                        if size > self.max_image_size:
+                            response = self.image_too_large_response(request)
+                            if size - self.max_image_size > MAX_IMAGE_DRAIN:
+                                # Too far over the limit to drain; answer and hang up
+                                hang_up = True
+                            else:
+                                # Drain the rejected bytes so the connection stays usable
+                                await conn.skip_image(size)
+                        else:
+                            upload = self.blobs.writer()
+                            await conn.receive_image_into(upload, size)
+                        if not conn.image_attached and not hang_up:
+                            await conn.send_message({'status': 'success'})
+                    if response is None and self.admission is not None:
+                        # Admit only once any upload is in, so slow uploaders hold no slot
+                        admitted = self.admission.try_admit()
+                        if not admitted:
+                            response = self.busy_response(request)
+                    if response is None:
+                        response = await loop.run_in_executor(self.executor, self.process_request, request, upload, conn)
+                finally:
+                    if upload is not None:
+                        upload.discard()  # A shed upload is never committed
+                    if admitted:
+                        self.admission.release()
+                image_file = response.pop('_image_file', None)
+                if image_file:
+                    await conn.send_message_with_file(response, image_file)
+                else:
+                    await conn.send_message(response)
+                self.metrics.observe_traffic(self.action_label(request), conn.bytes_received - received,
+                                             conn.bytes_sent - sent)
+                if hang_up:
+                    break
+
+        except asyncio.CancelledError:
+            pass  # The event loop is shutting down
+        except Exception as e:
+            print(f"Error handling client {address}: {e}")
+        finally:
+            self.unsubscribe(conn)
+            self.clients.pop(address, None)
+            conn.close()
+
+    def create_router(self, rate=None, trace_threshold=None):
+        """
+        Build the table of actions and the middleware around their handlers.
+        
+        Args:
+            rate (float, optional): Mutating requests allowed per second on each connection
+            trace_threshold (float, optional): Print requests taking longer than this many seconds
+            
+        Returns:
+            Router: The server's router
+        """
+        router = Router()
+        router.add('login', self.handle_login, uses_connection=True)
+        router.add('subscribe', self.handle_subscribe, auth_required=True)
+        router.add('upload_post', self.handle_upload_post, actor='username', mutating=True, expects_image=True)
+        router.add('get_feed', self.handle_get_feed, actor='username')
+        router.add('get_image', self.handle_get_image, auth_required=True)
+        router.add('add_comment', self.handle_add_comment, actor='user', mutating=True)
+        router.add('send_friend_request', self.handle_friend_request, actor='sender', mutating=True)
+        router.add('accept_friend_request', self.handle_accept_friend_request, actor='user', mutating=True)
+        router.add('reject_friend_request', self.handle_reject_friend_request, actor='user', mutating=True)
+        router.add('send_message', self.handle_send_message, actor='sender', mutating=True,
+                   expects_image=lambda request: bool(request.get('is_image', False)))
+        router.add('get_messages', self.handle_get_messages, actor='user1')
+        router.add('get_user_data', self.handle_get_user_data, actor='username')
+        router.add('get_all_users', self.handle_get_all_users)
+        
+        router.use(timing(self.metrics.observe_request))
+        router.use(authorize)
+        if trace_threshold is not None:
+            router.use(trace_slow(trace_threshold))
+        if rate is not None:
+            router.use(rate_limit(rate, RATE_LIMIT_BURST))
+        return router
+
+    def request_has_image(self, request):
+        """
+        Check whether a request is followed by an image upload.
+        
+        Args:
+            request (dict): The client's request
+            
+        Returns:
+            bool: True if the client will send image bytes after the request
+        """
+        return self.router.has_image(request)
+
+    def image_too_large_response(self, request):
+        """
+        Build the response rejecting an image over the size limit.
+        
+        The image's bytes are never stored. Uploads at most `MAX_IMAGE_DRAIN`
+        bytes over the limit are drained so the connection stays usable;
+        the connection is closed after rejecting larger ones.
+        
+        Args:
+            request (dict): The rejected request, counted as an error
+            
+        Returns:
+            dict: The error response
+        """
+        self.metrics.requests.inc(self.action_label(request), 'error')
+        return {'status': 'error', 'message': f'Image exceeds the {self.max_image_size} byte limit'}
+
+    def busy_response(self, request):
+        """
+        Build the response shedding a request the worker pool has no room for.
+        
+        Args:
+            request (dict): The shed request, counted as rejected
+            
+        Returns:
+            dict: The busy response; the client may send the request again
+                after `retry_after` seconds
+        """
+        action = self.action_label(request)
+        self.metrics.rejected.inc(action)
+        self.metrics.requests.inc(action, 'busy')
+        return {'status': 'busy', 'message': 'Server is busy, try again shortly', 'retry_after': BUSY_RETRY_AFTER}
+
+    def action_label(self, request):
+        """
+        Return the action a request is counted under in the metrics.
+        
+        Unknown actions share one label, so clients cannot create unbounded label sets.
+        """
+        return self.router.label(request)
+
+    def process_request(self, request, upload=None, conn=None):
         """
         Process client requests and return appropriate responses.
         
+        The request passes through the router's middleware, which count and
+        time it in the metrics, before reaching its action's handler.
+        
         Args:
             request (dict): The client's request
-            client_socket: The socket connected to the client
+            upload (BlobWriter, optional): The image uploaded with the request,
+                already on disk but not yet committed to the blob store
+            conn (optional): The client's connection, used for session state
             
         Returns:
             dict: The response to send back to the client
         """
-        action = request.get('action')
-        if action == 'login':
-            return self.handle_login(request)
-        elif action == 'upload_post':
-            return self.handle_upload_post(request, client_socket)
-        elif action == 'get_feed':
-            return self.handle_get_feed(request)
-        elif action == 'send_friend_request':
-            return self.handle_friend_request(request)
-        elif action == 'accept_friend_request':
-            return self.handle_accept_friend_request(request)
-        elif action == 'reject_friend_request':
-            return self.handle_reject_friend_request(request)
-        elif action == 'send_message':
-            return self.handle_send_message(request, client_socket)
-        elif action == 'get_messages':
-            return self.handle_get_messages(request)
-        elif action == 'get_user_data':
-            return self.handle_get_user_data(request)
-        elif action == 'get_all_users':
-            return self.handle_get_all_users(request)
-        elif action == 'add_comment':
-            return self.handle_add_comment(request)
-        
-        return {'status': 'error', 'message': 'Invalid action'}
-
-    def handle_login(self, request):
+        return self.router.dispatch(request, upload, conn)
+
+    def handle_login(self, request, conn=None):
         """
         Handle user login requests.
         
         Args:
             request (dict): The login request containing username and password
+            conn (optional): The client's connection, which remembers the user
             
         Returns:
             dict: Login success/failure response
@@ -166,56 +397,92 @@ class InstagramServer:
         username = request.get('username', '').lower()
         password = request.get('password')
         
-        with open('data/users/users.json', 'r') as f:
-            users = json.load(f)
-        
-        if username in users and users[username]['password'] == password:
+        if self.storage.authenticate(username, password):
+            if conn is not None:
+                conn.username = username
             return {'status': 'success', 'message': 'Login successful'}
         return {'status': 'error', 'message': 'Invalid credentials'}
+
+    def handle_subscribe(self, request, conn):
+        """
+        Handle subscription requests for pushed events.
+        
+        Args:
+            request (dict): The subscription request
+            conn: The logged-in connection that should receive events
+            
+        Returns:
+            dict: Subscription success/failure response
+            
+        After subscribing, the connection receives messages of the form
+        {'event': 'new_message', 'message': {...}} whenever a message is sent
+        to or by the logged-in user. The router only lets logged-in
+        connections subscribe.
+        """
+        with self.subscribers_lock:
+            self.subscribers.setdefault(conn.username, set()).add(conn)
+        return {'status': 'success', 'message': 'Subscribed'}
+
+    def unsubscribe(self, conn):
+        """
+        Stop pushing events to a connection.
+        
+        Args:
+            conn: The connection to remove from the subscriber registry
+        """
+        with self.subscribers_lock:
+            connections = self.subscribers.get(conn.username)
+            if connections is not None:
+                connections.discard(conn)
+                if not connections:
+                    del self.subscribers[conn.username]
+
+    def publish(self, username, event):
+        """
+        Push an event to every subscribed connection of a user.
+        
+        Args:
+            username (str): The user to notify
+            event (dict): The event message to push
+        """
+        with self.subscribers_lock:
+            connections = list(self.subscribers.get(username, ()))
+        for conn in connections:
+            try:
+                self.metrics.sent_bytes.inc('event', amount=conn.push(event))
+            except Exception as e:
+                print(f"Error pushing event to {username}: {e}")
+                self.unsubscribe(conn)
     
     def handle_add_comment(self, request):
         """
         Handle adding comments to posts.
         
         Args:
-            request (dict): The comment request containing post info and comment text
+            request (dict): The comment request containing the post's `post_id`
+                (or, from older clients, its `post_image_path`) and comment text
             
         Returns:
             dict: Comment addition success/failure response
         """
+        post_id = request.get('post_id')
         post_image_path = request.get('post_image_path')
         user = request.get('user')
         text = request.get('text')
 
-        posts_file = 'data/posts/posts.json'
-        if not os.path.exists(posts_file):
-            return {'status': 'error', 'message': 'No posts found'}
-
-        with open(posts_file, 'r') as f:
-            posts = json.load(f)
-
-        # Find the post by image_path
-        for post in posts:
-            if post['image_path'] == post_image_path:
-                if 'comments' not in post:
-                    post['comments'] = []
-                post['comments'].append({'user': user, 'text': text})
-                break
-        else:
+        # Posts sharing an identical image share its path, so prefer the id
+        if not self.storage.add_comment(post_image_path, user, text, post_id=post_id):
             return {'status': 'error', 'message': 'Post not found'}
 
-        with open(posts_file, 'w') as f:
-            json.dump(posts, f, indent=4)
-
         return {'status': 'success'}
 
-    def handle_upload_post(self, request, client_socket):
+    def handle_upload_post(self, request, upload):
         """
         Handle post upload requests.
         
         Args:
             request (dict): The upload request containing image data and caption
-            client_socket: The socket connected to the client
+            upload (BlobWriter): The uploaded image
             
         Returns:
             dict: Upload success/failure response
@@ -225,78 +492,105 @@ class InstagramServer:
             caption = request.get('caption', '')
             timestamp = request.get('timestamp')
             
-            # Create images directory if it doesn't exist
-            images_dir = Path('data/images')
-            images_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Generate unique filename
-            image_filename = f"{username}_{timestamp.replace(':', '-')}.jpg"
-            image_path = images_dir / image_filename
+            if not self.storage.exists(username):
+                return {'status': 'error', 'message': 'Unknown user'}
             
-            # Send acknowledgment that we're ready for the image
-            send_json_message(client_socket, {'status': 'ready'})
-            
-            # Receive and save the image data
+            # Save the image data; identical images share one blob
             try:
-                image_data = receive_image(client_socket)
-                with open(image_path, 'wb') as f:
-                    f.write(image_data)
-                
-                # Send success acknowledgment
-                send_json_message(client_socket, {'status': 'success'})
+                digest = upload.commit()
             except Exception as e:
                 print(f"Error saving image: {e}")
-                send_json_message(client_socket, {'status': 'error', 'message': 'Failed to save image'})
                 return {'status': 'error', 'message': 'Failed to save image'}
+            image_path = self.blobs.path(digest)
+            self.images.render_variants(image_path)
             
             # Create new post entry
             new_post = {
                 'username': username,
-                'image_path': str(image_path),
+                'image_path': image_path,
                 'caption': caption,
                 'timestamp': timestamp
             }
             
-            # Update posts.json
-            posts_file = 'data/posts/posts.json'
             try:
-                with open(posts_file, 'r') as f:
-                    posts = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                posts = []
-            
-            posts.append(new_post)
-            
-            with open(posts_file, 'w') as f:
-                json.dump(posts, f, indent=4)
+                self.storage.add_post(new_post)
+            except Exception:
+                self.blobs.release(digest)
+                raise
             
             return {'status': 'success', 'message': 'Post uploaded successfully'}
         except Exception as e:
             print(f"[ERROR] Exception in handle_upload_post: {e}")
-            return {'status': 'error', 'message': str(e)}
+            return {'status': 'error', 'message': 'Failed to upload post'}
 
     def handle_get_feed(self, request):
         """
         Handle feed retrieval requests.
         
         Args:
-            request (dict): The feed request
+            request (dict): The feed request containing the requesting `username`,
+                optionally an `author` to only show that user's posts, a `limit`
+                and a `before` post id cursor
             
         Returns:
-            dict: Feed data response with image data
+            dict: A page of posts, newest first, from the user and their friends
         """
+        username = request.get('username')
+        author = request.get('author')
+        
+        if not self.storage.exists(username):
+            return {'status': 'error', 'message': 'Unknown user'}
         try:
-            # Get posts with image data
-            feed_posts = []
-            for post in self.posts:
-                post_data = post.copy()
-                post_data['image_data'] = self.images.get(post['image_id'], '')
-                feed_posts.append(post_data)
-            
-            return {'status': 'success', 'posts': feed_posts}
+            limit = int(request.get('limit') or FEED_PAGE_SIZE)
+            before = None if request.get('before') is None else int(request['before'])
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid cursor'}
+        limit = max(1, min(limit, MAX_FEED_PAGE))
+        
+        authors = [username] + self.storage.get_friends(username)
+        if author is not None:
+            authors = [author] if author in authors else []
+        try:
+            posts, has_more = self.storage.get_feed(authors, limit, before=before)
+            return {'status': 'success', 'posts': posts, 'has_more': has_more}
         except Exception as e:
             print(f"[ERROR] Exception in handle_get_feed: {e}")
+            return {'status': 'error', 'message': 'Failed to load feed'}
+
+    def handle_get_image(self, request, conn):
+        """
+        Handle image download requests.
+        
+        Args:
+            request (dict): The image request containing the `image_path` of a post
+                or message, optionally a `size` variant and the `etag` of a copy
+                the client already holds
+            conn: The connection of the logged-in user downloading the image
+            
+        Returns:
+            dict: The image's metadata. The `_image_file` entry is not sent; it
+                tells the connection which file to stream after the response.
+                If the client's `etag` is current, no file is attached. Images
+                the user may not see are reported as not found.
+        """
+        image_path = request.get('image_path', '')
+        if not isinstance(image_path, str) or not self.storage.can_view_image(conn.username, image_path):
+            return {'status': 'error', 'message': 'Image not found'}
+        path = self.images.resolve(image_path)
+        if path is None:
+            return {'status': 'error', 'message': 'Image not found'}
+        try:
+            path = self.images.variant(path, request.get('size'))
+            etag = self.images.etag(path)
+        except ValueError as e:
             return {'status': 'error', 'message': str(e)}
+        except Exception as e:
+            print(f"[ERROR] Exception in handle_get_image: {e}")
+            return {'status': 'error', 'message': 'Failed to read image'}
+        
+        if request.get('etag') == etag:
+            return {'status': 'not_modified', 'etag': etag}
+        return {'status': 'success', 'etag': etag, 'size': os.path.getsize(path), '_image_file': path}
 
     def handle_friend_request(self, request):
         """
@@ -311,13 +605,7 @@ class InstagramServer:
         sender = request.get('sender')
         receiver = request.get('receiver')
         
-        with open('data/users/users.json', 'r') as f:
-            users = json.load(f)
-        
-        if receiver in users and receiver not in users[sender]['friends']:
-            users[receiver]['requests'].append(sender)
-            with open('data/users/users.json', 'w') as f:
-                json.dump(users, f, indent=4)
+        if self.storage.send_friend_request(sender, receiver):
             return {'status': 'success', 'message': 'Friend request sent'}
         return {'status': 'error', 'message': 'Invalid request'}
 
@@ -334,16 +622,7 @@ class InstagramServer:
         user = request.get('user')
         friend = request.get('friend')
         
-        with open('data/users/users.json', 'r') as f:
-            users = json.load(f)
-        
-        if friend in users[user]['requests']:
-            users[user]['friends'].append(friend)
-            users[friend]['friends'].append(user)
-            users[user]['requests'].remove(friend)
-            
-            with open('data/users/users.json', 'w') as f:
-                json.dump(users, f, indent=4)
+        if self.storage.accept_friend_request(user, friend):
             return {'status': 'success', 'message': 'Friend request accepted'}
         return {'status': 'error', 'message': 'Invalid request'}
 
@@ -360,23 +639,17 @@ class InstagramServer:
         user = request.get('user')
         friend = request.get('friend')
         
-        with open('data/users/users.json', 'r') as f:
-            users = json.load(f)
-        
-        if friend in users[user]['requests']:
-            users[user]['requests'].remove(friend)
-            with open('data/users/users.json', 'w') as f:
-                json.dump(users, f, indent=4)
+        if self.storage.reject_friend_request(user, friend):
             return {'status': 'success', 'message': 'Friend request rejected'}
         return {'status': 'error', 'message': 'Invalid request'}
 
-    def handle_send_message(self, request, client_socket):
+    def handle_send_message(self, request, upload=None):
         """
         Handle message sending.
         
         Args:
             request (dict): The message request containing sender, receiver, and message
-            client_socket: The socket connected to the client
+            upload (BlobWriter, optional): The uploaded image for image messages
             
         Returns:
             dict: Message sending success/failure response
@@ -387,15 +660,8 @@ class InstagramServer:
             message = request.get('message')
             is_image = request.get('is_image', False)
             
-            # Create message file name (sorted usernames)
-            usernames = sorted([sender, receiver])
-            message_file = f'data/messages/{usernames[0]}_{usernames[1]}.json'
-            
-            if os.path.exists(message_file):
-                with open(message_file, 'r') as f:
-                    messages = json.load(f)
-            else:
-                messages = []
+            if not (self.storage.exists(sender) and self.storage.exists(receiver)):
+                return {'status': 'error', 'message': 'Unknown user'}
             
             message_data = {
                 'sender': sender,
@@ -405,66 +671,63 @@ class InstagramServer:
                 'is_image': is_image
             }
             
+            digest = None
             if is_image:
-                # Create images directory if it doesn't exist
-                images_dir = Path('data/images')
-                images_dir.mkdir(parents=True, exist_ok=True)
-                
-                # Generate unique filename for the image
-                timestamp = request.get('timestamp').replace(':', '-')
-                image_filename = f"{sender}_{receiver}_{timestamp}.jpg"
-                image_path = images_dir / image_filename
-                
-                # Send acknowledgment that we're ready for the image
-                send_json_message(client_socket, {'status': 'ready'})
-                
-                # Receive and save the image data
+                # Save the image data; a forwarded image reuses its blob
                 try:
-                    image_data = receive_image(client_socket)
-                    with open(image_path, 'wb') as f:
-                        f.write(image_data)
-                    
-                    message_data['image_path'] = str(image_path)
-                    
-                    # Send success acknowledgment
-                    send_json_message(client_socket, {'status': 'success'})
+                    digest = upload.commit()
+                    message_data['image_path'] = self.blobs.path(digest)
+                    self.images.render_variants(message_data['image_path'])
                 except Exception as e:
                     print(f"Error saving image: {e}")
-                    send_json_message(client_socket, {'status': 'error', 'message': 'Failed to save image'})
                     return {'status': 'error', 'message': 'Failed to save image'}
             
-            messages.append(message_data)
-            
-            with open(message_file, 'w') as f:
-                json.dump(messages, f, indent=4)
-            
-            return {'status': 'success', 'message': 'Message sent'}
+            try:
+                message_data['id'] = self.storage.append_message(sender, receiver, message_data)
+            except Exception:
+                if digest is not None:
+                    self.blobs.release(digest)
+                raise
+            
+            # Deliver the message to both participants' live connections
+            event = {'event': 'new_message', 'message': message_data}
+            self.publish(receiver, event)
+            if sender != receiver:
+                self.publish(sender, event)
+            
+            return {'status': 'success', 'message': 'Message sent', 'id': message_data['id']}
         except Exception as e:
             print(f"Error in handle_send_message: {e}")
-            return {'status': 'error', 'message': str(e)}
+            return {'status': 'error', 'message': 'Failed to send message'}
 
     def handle_get_messages(self, request):
         """
         Handle message retrieval requests.
         
         Args:
-            request (dict): The message retrieval request containing user1 and user2
+            request (dict): The message retrieval request containing user1 and user2,
+                and optionally `limit` plus a `before` or `after` message id cursor
             
         Returns:
-            dict: Message data response
+            dict: Message data response. Without any cursor or limit the whole
+                conversation is returned, as older clients expect.
         """
         user1 = request.get('user1')
         user2 = request.get('user2')
         
-        # Create message file name (sorted usernames)
-        usernames = sorted([user1, user2])
-        message_file = f'data/messages/{usernames[0]}_{usernames[1]}.json'
-        
-        if os.path.exists(message_file):
-            with open(message_file, 'r') as f:
-                messages = json.load(f)
-            return {'status': 'success', 'messages': messages}
-        return {'status': 'success', 'messages': []}
+        if not (self.storage.exists(user1) and self.storage.exists(user2)):
+            return {'status': 'error', 'message': 'Unknown user'}
+        try:
+            limit, before, after = (
+                None if request.get(key) is None else int(request[key])
+                for key in ('limit', 'before', 'after')
+            )
+        except (TypeError, ValueError):
+            return {'status': 'error', 'message': 'Invalid cursor'}
+        if limit is not None:
+            limit = max(1, min(limit, MAX_MESSAGES_PAGE))
+        messages, has_more = self.storage.get_messages(user1, user2, limit=limit, before=before, after=after)
+        return {'status': 'success', 'messages': messages, 'has_more': has_more}
 
     def handle_get_user_data(self, request):
         """
@@ -478,11 +741,9 @@ class InstagramServer:
         """
         username = request.get('username')
         
-        with open('data/users/users.json', 'r') as f:
-            users = json.load(f)
-        
-        if username in users:
-            return {'status': 'success', 'user_data': users[username]}
+        user_data = self.storage.get_user(username)
+        if user_data is not None:
+            return {'status': 'success', 'user_data': user_data}
         return {'status': 'error', 'message': 'User not found'}
 
     def handle_get_all_users(self, request):
@@ -495,10 +756,7 @@ class InstagramServer:
         Returns:
             dict: All users data response
         """
-        with open('data/users/users.json', 'r') as f:
-            users = json.load(f)
-        
-        return {'status': 'success', 'users': list(users.keys())}
+        return {'status': 'success', 'users': self.storage.list_usernames()}
 
     def start(self):
         """
@@ -514,13 +772,109 @@ class InstagramServer:
             client_socket, address = self.server_socket.accept()
             print(f"New connection from {address}")
             self.clients[address] = client_socket
-            client_thread = threading.Thread(target=self.handle_client, args=(client_socket, address))
+            client_thread = threading.Thread(target=self.handle_client, args=(client_socket, address), daemon=True)
             client_thread.start()
 
+    def shutdown(self):
+        """
+        Stop accepting connections and persist any pending state.
+        """
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+        self.server_socket.close()
+        self.images.close()
+        self.blobs.close()
+        self.storage.close()
+
+    async def serve_async(self):
+        """
+        Accept and serve all client connections on the running event loop.
+        """
+        server = await asyncio.start_server(
+            self.handle_client_async, sock=self.server_socket, backlog=ASYNC_BACKLOG
+        )
+        async with server:
+            await server.serve_forever()
+
+    def start_async(self):
+        """
+        Start the server using the asyncio engine.
+        
+        This method:
+        1. Runs a single event loop for every connection
+        2. Offloads storage work to a bounded thread pool
+        3. Keeps idle connections down to a few kilobytes each
+        """
+        print(f"Server listening on {self.host}:{self.port} (asyncio)")
+        self.executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS)
+        try:
+            asyncio.run(self.serve_async())
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def start_pool(self, workers=POOL_WORKERS, queue_size=POOL_QUEUE_SIZE):
+        """
+        Start the server with a fixed worker pool and admission control.
+        
+        Args:
+            workers (int): Worker threads running requests
+            queue_size (int): Requests that may wait for a free worker
+            
+        Connections are served on one event loop as with the asyncio engine,
+        so they cost no thread each. Requests run on exactly `workers`
+        threads; once `queue_size` more are waiting, further requests are
+        answered with a retryable 'busy' status until the queue drains.
+        """
+        print(f"Server listening on {self.host}:{self.port} (pool of {workers} workers)")
+        self.admission = AdmissionControl(workers, queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')
+        try:
+            asyncio.run(self.serve_async())
+        finally:
+            self.executor.shutdown(wait=False)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Instagram Clone Server')
     parser.add_argument('--port', type=int, help='Port number to use (optional)')
+    parser.add_argument('--mode', choices=SERVER_MODES, default=DEFAULT_SERVER_MODE,
+                        help='Connection handling engine (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=POOL_WORKERS,
+                        help='Worker threads running requests in pool mode (default: %(default)s)')
+    parser.add_argument('--queue-size', type=int, default=POOL_QUEUE_SIZE,
+                        help='Requests that may wait for a worker in pool mode before load is shed '
+                             '(default: %(default)s)')
+    parser.add_argument('--storage', choices=STORAGE_BACKENDS, default=DEFAULT_STORAGE,
+                        help='Storage backend (default: %(default)s)')
+    parser.add_argument('--db', default=SQLITE_DB_FILE,
+                        help='Database path for the SQLite backend (default: %(default)s)')
+    parser.add_argument('--max-image-size', type=int, default=MAX_IMAGE_SIZE,
+                        help='Largest image upload accepted, in bytes (default: %(default)s)')
+    parser.add_argument('--metrics-port', type=int,
+                        help=f'Serve Prometheus metrics on this port of {METRICS_HOST} (optional)')
+    parser.add_argument('--rate-limit', type=float,
+                        help='Mutating requests allowed per second on each connection (optional)')
+    parser.add_argument('--trace-slow', type=float, metavar='MS',
+                        help='Print requests taking longer than this many milliseconds (optional)')
     args = parser.parse_args()
     
-    server = InstagramServer(port=args.port)
-    server.start() 
\ No newline at end of file
+    server = InstagramServer(port=args.port, storage=args.storage, db_path=args.db,
+                             max_image_size=args.max_image_size, metrics_port=args.metrics_port,
+                             rate_limit=args.rate_limit,
+                             trace_slow=None if args.trace_slow is None else args.trace_slow / 1000)
+    
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+    
+    # Shut down the same way when terminated, so the image worker processes are stopped too
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        if args.mode == 'asyncio':
+            server.start_async()
+        elif args.mode == 'pool':
+            server.start_pool(args.workers, args.queue_size)
+        else:
+            server.start()
+    except KeyboardInterrupt:
+        print("Shutting down server")
+    finally:
+        server.shutdown() 
\ No newline at end of file
@@ -1,66 +1,73 @@
+import asyncio
+import os
 import socket
 import json
+import struct
+import threading
 import time
 import base64
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List
 from constants import (
     DEFAULT_HOST, DEFAULT_PORT, MAX_RETRIES, RETRY_DELAY,
-    BUFFER_SIZE
+    BUFFER_SIZE, RECV_BUFFER_SIZE, MAX_SEND_CHUNK, FRAME_MAGIC, PROTOCOL_VERSION,
+    MAX_MESSAGE_SIZE
 )
+
+# Frame header: magic (2 bytes), protocol version (1 byte), frame type (1 byte),
+# payload length (4 bytes, big endian). The JSON payload follows immediately.
+# A FRAME_JSON_WITH_IMAGE payload is followed by an 8-byte image size and the
+# image bytes, so an upload needs no 'ready'/'success' round trips. Image
+# downloads use the same frame type in the other direction.
+FRAME_HEADER = struct.Struct('!2sBBI')
+FRAME_JSON = 0
+FRAME_JSON_WITH_IMAGE = 1
+FRAME_TYPES = (FRAME_JSON, FRAME_JSON_WITH_IMAGE)
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = b' \t\r\n'
+
 def find_available_port(host: str = DEFAULT_HOST, start_port: int = DEFAULT_PORT, max_port: int = 6000) -> int:
     """
     Find an available port in the given range.
     """
     if not (1 <= start_port <= 65535 and 1 <= max_port <= 65535):
         raise ValueError("Port range must be between 1 and 65535.")
-    # TODO: Loop through the port range and use `is_port_available` to find a free port.
     for port in range(start_port, max_port+1):
         if is_port_available(port, host):
             return port
 
-    # TODO: Raise RuntimeError if no available port is found in the given range.
     raise RuntimeError("no available port is found in the given range.")
-    pass
 
 def is_port_available(port: int, host: str = DEFAULT_HOST) -> bool:
     """
     Check if a port is available for use.
     """
-    # TODO: Attempt to bind a socket to the given host and port.
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-    # TODO: If binding succeeds, close the socket and return True.
         sock.bind((host, port))
-        sock.close()
         return True
-    # TODO: If binding fails due to OSError, return False.
     except OSError:
         return False
-    pass
+    finally:
+        sock.close()
 
 def create_server_socket(host: str = DEFAULT_HOST, port: Optional[int] = None) -> Tuple[socket.socket, int]:
     """
     Create and bind a server socket.
     """
-
+    server_socket = None
     try:
-    # TODO: If port is None, find an available port using `find_available_port`.
         if port is None:
             port = find_available_port()
-    # TODO: Create a TCP socket and allow reuse of the address.
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    # TODO: Bind the socket and start listening.
         server_socket.bind((host, port))
         server_socket.listen(10)
-    # TODO: Return the socket and the port.
         return server_socket, port
-    # TODO: On error, close the socket and raise RuntimeError with details.
     except Exception as e:
         if server_socket:
             server_socket.close()
         raise RuntimeError(f"Error creating server socket: {e}")
-    pass
 
 def create_client_socket(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, 
                         max_retries: int = MAX_RETRIES, retry_delay: int = RETRY_DELAY) -> socket.socket:
@@ -68,89 +75,95 @@ def create_client_socket(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
     Create and connect a client socket with retry logic.
     """
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # TODO: Attempt to connect to the server in a loop, retrying on failure.
     for attempt in range(max_retries):
         try:
             client_socket.connect((host, port))
-    # TODO: On successful connection, return the socket.
             return client_socket
-    # TODO: Print retry attempts and wait between retries.
         except socket.error as e:
             print(f"retry attempt: {attempt + 1} Error: {e}")
             if attempt == max_retries - 1:  # Raise error only after all retries fail
                 raise RuntimeError(f"Error creating client socket: {e}")
             time.sleep(retry_delay)
-    # TODO: Raise RuntimeError if all retries fail or if unexpected error occurs.
-    pass
+    client_socket.close()
+    raise RuntimeError("Error creating client socket: no connection attempts allowed")
 
 def send_json_message(sock: socket.socket, message: Dict[str, Any]) -> None:
     """
     Send a JSON message over a socket.
     """
-    # TODO: Convert the message dictionary to a JSON string and encode to bytes.
     try:
         json_str = json.dumps(message)
         encoded_message = json_str.encode('utf-8')
-    # TODO: Send the encoded message using `sock.send`.
-        sock.send(encoded_message)
-    # TODO: Raise RuntimeError on any sending error.
-    except (socket.error, json.JSONEncodeError) as e:
+        sock.sendall(encoded_message)
+    except (socket.error, TypeError, ValueError) as e:
         raise RuntimeError(f"Error sending JSON message: {e}")
-    pass
 
 def receive_json_message(sock: socket.socket, buffer_size: int = BUFFER_SIZE) -> Dict[str, Any]:
     """
     Receive a JSON message from a socket.
     """
-    # TODO: Initialize empty bytes object for data.
-    data = b''
-    # TODO: Receive chunks of data in a loop and append to data buffer.
+    data = bytearray()
     while True:
         try:
             chunk = sock.recv(buffer_size)
             if not chunk:
                 raise RuntimeError("Connection closed while receiving data")
-            data += chunk
-    # TODO: Try to decode and parse as JSON.
+            data += chunk  # Grows in place; bytes would be copied whole on every chunk
+            # A JSON object can only be complete once the data ends with '}'
+            if not _ends_with_closing_brace(data):
+                continue
             try:
                 message = json.loads(data.decode('utf-8'))
-    # TODO: Continue until a valid JSON message is received.
                 return message
-            except json.JSONDecodeError:
+            except (json.JSONDecodeError, UnicodeDecodeError):
                 continue
-    # TODO: Raise RuntimeError on decode failure or closed connection.
         except socket.error as e:
             raise RuntimeError(f"Error receiving JSON message: {e}")
-    pass
 
 def send_image(sock: socket.socket, image_data: bytes) -> None:
     """
     Send image data over a socket.
     """
-    # TODO: Send the length of the image as an 8-byte integer.
     try:
         # Send image size first
         image_size = len(image_data)
         sock.sendall(image_size.to_bytes(8, byteorder='big'))
-    # TODO: Send the image data in chunks using a loop.
-        # Send image data in chunks
+        # Send image data in chunks, sliced from a memoryview so no chunk is copied
+        view = memoryview(image_data)
+        chunk_size = send_chunk_size(image_size)
         total_sent = 0
         while total_sent < image_size:
-            sent = sock.send(image_data[total_sent:total_sent + BUFFER_SIZE])
-    # TODO: Handle partial sends and connection issues.
+            sent = sock.send(view[total_sent:total_sent + chunk_size])
             if sent == 0:
                 raise RuntimeError("Socket connection broken")
             total_sent += sent
-    # TODO: Raise RuntimeError if any step fails.
     except socket.error as e:
         raise RuntimeError(f"Error sending image: {e}")
-    pass
+
+def send_chunk_size(total_size: int) -> int:
+    """
+    Pick the chunk size for sending `total_size` bytes.
+
+    Small transfers go out in one call; larger ones use chunks of a sixteenth
+    of the transfer, between BUFFER_SIZE and MAX_SEND_CHUNK bytes.
+    """
+    return max(BUFFER_SIZE, min(total_size // 16, MAX_SEND_CHUNK), min(total_size, RECV_BUFFER_SIZE))
+
+def send_image_file(sock: socket.socket, f) -> None:
+    """
+    Send an open file as length-prefixed image data using `socket.sendfile`.
+    """
+    try:
+        image_size = os.fstat(f.fileno()).st_size
+        sock.sendall(image_size.to_bytes(8, byteorder='big'))
+        sock.sendfile(f, 0, image_size)
+    except socket.error as e:
+        raise RuntimeError(f"Error sending image: {e}")
 
 def receive_image(sock: socket.socket) -> bytes:
     """
     Receive image data from a socket.
     """
-    # TODO: Receive 8 bytes for image size and convert to integer.
     try:
         # Receive image size first
         size_data = sock.recv(8)
@@ -158,59 +171,607 @@ def receive_image(sock: socket.socket) -> bytes:
             raise RuntimeError("Incomplete image size received")
         image_size = int.from_bytes(size_data, byteorder='big')
         received_data = bytearray()
-    # TODO: Receive the expected number of bytes in chunks.
         while len(received_data) < image_size:
             chunk = sock.recv(min(BUFFER_SIZE, image_size - len(received_data)))
-    # TODO: Handle closed connections and incomplete data.
             if not chunk:
                 raise RuntimeError("Connection closed before receiving complete image")
             received_data.extend(chunk)
         return bytes(received_data)
-    # TODO: Raise RuntimeError on any error or incomplete data.
     except socket.error as e:
         raise RuntimeError(f"Error receiving image: {e}")
-    pass
 
 def send_json_message_with_image(sock: socket.socket, message: Dict[str, Any], image_data: bytes) -> None:
     """
     Send a JSON message with image data over a socket.
     """
-    # TODO: Send the JSON message using `send_json_message`.
     try:
         send_json_message(sock, message)
-    # TODO: Wait for 'ready' acknowledgment from receiver.
         ack = receive_json_message(sock)
         if ack.get('status') != 'ready':
             raise RuntimeError("Did not receive 'ready' acknowledgment")
 
-    # TODO: Send the image data using `send_image`.
         send_image(sock, image_data)
 
-    # TODO: Wait for 'success' acknowledgment after image is received.
         ack = receive_json_message(sock)
-    # TODO: Raise RuntimeError on any failure in these steps.
         if ack.get('status') != 'success':
             raise RuntimeError("Did not receive 'success' acknowledgment")
     except Exception as e:
         raise RuntimeError(f"Error in send_json_message_with_image: {e}")
-    pass
 
 def receive_json_message_with_image(sock: socket.socket) -> Tuple[Dict[str, Any], bytes]:
     """
     Receive a JSON message with image data from a socket.
     """
-    # TODO: Receive JSON message using `receive_json_message`.
     try:
         message = receive_json_message(sock)
-    # TODO: Send a 'ready' acknowledgment to the sender.
         send_json_message(sock, {'status': 'ready'})
-    # TODO: Receive the image using `receive_image`.
         image_data = receive_image(sock)
-    # TODO: Send a 'success' acknowledgment after successful reception.
         send_json_message(sock, {'status': 'success'})
-    # TODO: Return the received message and image data.
         return message, image_data
-    # TODO: Raise RuntimeError on failure in any of the steps.
     except Exception as e:
         raise RuntimeError(f"Error in receive_json_message_with_image: {e}")
-    pass
+
+def _ends_with_closing_brace(data) -> bool:
+    """
+    Check whether buffered data could hold a complete JSON object.
+    """
+    end = len(data)
+    while end and data[end - 1] in _JSON_WHITESPACE:
+        end -= 1
+    return end > 0 and data[end - 1] == ord('}')
+
+def _pop_legacy_message(buffer: bytearray) -> Optional[Dict[str, Any]]:
+    """
+    Remove and return the first bare JSON object from a receive buffer.
+
+    Returns None while the buffer does not yet hold a complete object. Any bytes
+    after the object (e.g. a second back-to-back message) stay in the buffer.
+    """
+    if not _ends_with_closing_brace(buffer):
+        return None
+    try:
+        text = buffer.decode('utf-8')
+        start = len(text) - len(text.lstrip())
+        message, end = _JSON_DECODER.raw_decode(text, start)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    del buffer[:len(text[:end].encode('utf-8'))]
+    return message
+
+def _parse_frame_header(header: bytes, max_message_size: int) -> Tuple[int, int]:
+    """
+    Validate a frame header and return its frame type and payload length.
+    """
+    magic, version, frame_type, length = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC:
+        raise RuntimeError("Invalid frame header")
+    if version != PROTOCOL_VERSION:
+        raise RuntimeError(f"Unsupported protocol version: {version}")
+    if frame_type not in FRAME_TYPES:
+        raise RuntimeError(f"Unsupported frame type: {frame_type}")
+    if length > max_message_size:
+        raise RuntimeError(f"Message of {length} bytes exceeds limit of {max_message_size}")
+    return frame_type, length
+
+def _decode_payload(payload) -> Dict[str, Any]:
+    """
+    Parse a complete JSON payload.
+    """
+    try:
+        return json.loads(payload)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise RuntimeError(f"Error decoding JSON message: {e}")
+
+def _encode_file_message(message: Dict[str, Any], framed: bool, f) -> Tuple[bytes, int]:
+    """
+    Encode the part of a file download sent before the file's bytes.
+
+    Returns the bytes to send and the number of file bytes that must follow.
+    Legacy peers cannot receive raw bytes after a bare JSON message, so the
+    file is embedded in the message as base64 and nothing follows.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if not framed:
+        message = dict(message, image_data=base64.b64encode(f.read()).decode('ascii'))
+        return encode_message(message, framed=False), 0
+    header = encode_message(message, frame_type=FRAME_JSON_WITH_IMAGE)
+    return header + size.to_bytes(8, byteorder='big'), size
+
+class _DiscardSink:
+    """
+    A sink that drops everything written to it.
+    """
+
+    def write(self, data) -> None:
+        pass
+
+def encode_message(message: Dict[str, Any], framed: bool = True, frame_type: int = FRAME_JSON) -> bytes:
+    """
+    Encode a message as a framed (header + payload) or bare legacy JSON message.
+    """
+    try:
+        payload = json.dumps(message).encode('utf-8')
+    except (TypeError, ValueError) as e:
+        raise RuntimeError(f"Error encoding JSON message: {e}")
+    if not framed:
+        return payload
+    return FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, frame_type, len(payload)) + payload
+
+class MessageConnection:
+    """
+    A buffered, message-oriented wrapper around a connected socket.
+
+    Each connection owns a single receive buffer, so bytes read past the end of
+    one message are kept for the next read instead of being lost. Framed
+    messages are parsed exactly once, after their full payload has arrived.
+
+    `bytes_received` and `bytes_sent` count the bytes of the messages and
+    images received and sent so far, excluding pushed messages.
+
+    Args:
+        sock (socket.socket): The connected socket
+        framed (bool, optional): True for the framed protocol, False for bare
+            legacy JSON, or None to detect the peer's protocol from its first byte
+        max_message_size (int): Largest JSON payload accepted
+    """
+
+    def __init__(self, sock: socket.socket, framed: Optional[bool] = True,
+                 max_message_size: int = MAX_MESSAGE_SIZE):
+        self.sock = sock
+        self.framed = framed
+        self.max_message_size = max_message_size
+        self._buffer = bytearray()
+        self._chunk = memoryview(bytearray(RECV_BUFFER_SIZE))  # Reused by every streamed receive
+        self._send_lock = threading.Lock()
+        self.image_attached = False  # True when the last message carries image data
+        self.username = None  # Set by the server once the peer has logged in
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def _fill(self) -> None:
+        """
+        Read the next available chunk from the socket into the buffer.
+        """
+        try:
+            chunk = self.sock.recv(RECV_BUFFER_SIZE)
+        except socket.error as e:
+            raise RuntimeError(f"Error receiving data: {e}")
+        if not chunk:
+            raise RuntimeError("Connection closed while receiving data")
+        self._buffer.extend(chunk)
+
+    def _read_exact(self, size: int) -> bytearray:
+        """
+        Read exactly `size` bytes, starting with anything already buffered.
+        """
+        if len(self._buffer) >= size:
+            data = self._buffer[:size]
+            del self._buffer[:size]
+            return data
+        data = bytearray(size)
+        view = memoryview(data)
+        received = len(self._buffer)
+        view[:received] = self._buffer
+        self._buffer.clear()
+        try:
+            while received < size:
+                count = self.sock.recv_into(view[received:], size - received)
+                if count == 0:
+                    raise RuntimeError("Connection closed while receiving data")
+                received += count
+        except socket.error as e:
+            raise RuntimeError(f"Error receiving data: {e}")
+        return data
+
+    def receive_message(self) -> Dict[str, Any]:
+        """
+        Receive the next JSON message from the peer.
+        """
+        if self.framed is None:
+            if not self._buffer:
+                self._fill()
+            self.framed = self._buffer[:1] == FRAME_MAGIC[:1]
+        self.image_attached = False
+        if self.framed:
+            frame_type, length = _parse_frame_header(self._read_exact(FRAME_HEADER.size), self.max_message_size)
+            self.image_attached = frame_type == FRAME_JSON_WITH_IMAGE
+            self.bytes_received += FRAME_HEADER.size + length
+            return _decode_payload(self._read_exact(length))
+        while True:
+            buffered = len(self._buffer)
+            message = _pop_legacy_message(self._buffer)
+            if message is not None:
+                self.bytes_received += buffered - len(self._buffer)
+                return message
+            if len(self._buffer) > self.max_message_size:
+                raise RuntimeError("Message exceeds size limit")
+            self._fill()
+
+    def _send_encoded(self, message: Dict[str, Any]) -> int:
+        """
+        Encode and send a JSON message, returning its size in bytes.
+        """
+        data = encode_message(message, framed=self.framed is not False)
+        try:
+            with self._send_lock:
+                self.sock.sendall(data)
+        except socket.error as e:
+            raise RuntimeError(f"Error sending JSON message: {e}")
+        return len(data)
+
+    def send_message(self, message: Dict[str, Any]) -> None:
+        """
+        Send a JSON message to the peer using the connection's protocol.
+        """
+        self.bytes_sent += self._send_encoded(message)
+
+    def push(self, message: Dict[str, Any]) -> int:
+        """
+        Send an unsolicited message (e.g. a server event) from any thread.
+
+        Returns:
+            int: Bytes sent
+        """
+        return self._send_encoded(message)
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a request and wait for its response.
+        """
+        self.send_message(message)
+        return self.receive_message()
+
+    def receive_image(self) -> bytes:
+        """
+        Receive length-prefixed image data from the peer.
+        """
+        image_size = self.receive_image_size()
+        self.bytes_received += image_size
+        return self._read_exact(image_size)
+
+    def receive_image_size(self) -> int:
+        """
+        Receive the 8-byte size that precedes image data.
+        """
+        self.bytes_received += 8
+        return int.from_bytes(self._read_exact(8), byteorder='big')
+
+    def receive_image_into(self, sink, size: int) -> None:
+        """
+        Stream `size` bytes of image data into `sink.write`.
+
+        The data passes through one reusable buffer, so memory use does not
+        depend on the size of the image. Each chunk is only valid during its
+        `write` call.
+        """
+        self.bytes_received += size
+        if self._buffer:
+            head = self._buffer[:size]
+            del self._buffer[:len(head)]
+            sink.write(head)
+            size -= len(head)
+        try:
+            while size:
+                count = self.sock.recv_into(self._chunk, min(size, len(self._chunk)))
+                if count == 0:
+                    raise RuntimeError("Connection closed while receiving data")
+                sink.write(self._chunk[:count])
+                size -= count
+        except socket.error as e:
+            raise RuntimeError(f"Error receiving data: {e}")
+
+    def skip_image(self, size: int) -> None:
+        """
+        Read and drop `size` bytes of image data, e.g. from a rejected upload.
+        """
+        self.receive_image_into(_DiscardSink(), size)
+
+    def send_image(self, image_data: bytes) -> None:
+        """
+        Send length-prefixed image data to the peer.
+        """
+        with self._send_lock:
+            send_image(self.sock, image_data)
+        self.bytes_sent += 8 + len(image_data)
+
+    def send_message_with_image(self, message: Dict[str, Any], image_data: bytes) -> None:
+        """
+        Send a JSON message together with image data.
+
+        Framed connections send a single FRAME_JSON_WITH_IMAGE frame and the
+        peer replies only with its final response. Legacy connections fall back
+        to the 'ready' / image / 'success' handshake.
+        """
+        if self.framed is not False:
+            header = encode_message(message, frame_type=FRAME_JSON_WITH_IMAGE)
+            try:
+                with self._send_lock:
+                    self.sock.sendall(header + len(image_data).to_bytes(8, byteorder='big'))
+                    self.sock.sendall(image_data)
+            except socket.error as e:
+                raise RuntimeError(f"Error sending image: {e}")
+            self.bytes_sent += len(header) + 8 + len(image_data)
+            return
+        self.send_message(message)
+        if self.receive_message().get('status') != 'ready':
+            raise RuntimeError("Did not receive 'ready' acknowledgment")
+        self.send_image(image_data)
+        if self.receive_message().get('status') != 'success':
+            raise RuntimeError("Did not receive 'success' acknowledgment")
+
+    def send_message_with_image_file(self, message: Dict[str, Any], path: str) -> None:
+        """
+        Like `send_message_with_image`, but streams the image from a file with
+        `socket.sendfile` instead of reading it into memory first.
+        """
+        if self.framed is not False:
+            self.send_message_with_file(message, path)
+            return
+        self.send_message(message)
+        if self.receive_message().get('status') != 'ready':
+            raise RuntimeError("Did not receive 'ready' acknowledgment")
+        with open(path, 'rb') as f:
+            with self._send_lock:
+                send_image_file(self.sock, f)
+            self.bytes_sent += 8 + os.fstat(f.fileno()).st_size
+        if self.receive_message().get('status') != 'success':
+            raise RuntimeError("Did not receive 'success' acknowledgment")
+
+    def send_message_with_file(self, message: Dict[str, Any], path: str) -> None:
+        """
+        Send a JSON message followed by the contents of a file.
+
+        On framed connections the file is streamed with `socket.sendfile`, which
+        copies it straight from the page cache to the socket where the
+        platform supports it.
+        """
+        with open(path, 'rb') as f:
+            head, size = _encode_file_message(message, self.framed is not False, f)
+            try:
+                with self._send_lock:
+                    self.sock.sendall(head)
+                    if size:
+                        self.sock.sendfile(f, 0, size)
+            except socket.error as e:
+                raise RuntimeError(f"Error sending file: {e}")
+            self.bytes_sent += len(head) + size
+
+    def request_file(self, message: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        """
+        Send a request answered by `send_message_with_file` on the peer.
+
+        Returns:
+            tuple: The response and the file's bytes, or None if the response
+                carried no file (e.g. an error)
+        """
+        response = self.request(message)
+        if self.image_attached:
+            return response, bytes(self.receive_image())
+        if 'image_data' in response:
+            return response, base64.b64decode(response.pop('image_data'))
+        return response, None
+
+    def close(self) -> None:
+        """
+        Close the underlying socket.
+        """
+        self.sock.close()
+
+class AsyncMessageConnection:
+    """
+    The asyncio counterpart of `MessageConnection`, built on stream objects.
+
+    Args:
+        reader (asyncio.StreamReader): The stream to read messages from
+        writer (asyncio.StreamWriter): The stream to write messages to
+        framed (bool, optional): Same meaning as for `MessageConnection`
+        max_message_size (int): Largest JSON payload accepted
+
+    It counts `bytes_received` and `bytes_sent` like `MessageConnection`.
+    """
+
+    def __init__(self, reader, writer, framed: Optional[bool] = True,
+                 max_message_size: int = MAX_MESSAGE_SIZE):
+        self.reader = reader
+        self.writer = writer
+        self.framed = framed
+        self.max_message_size = max_message_size
+        self._buffer = bytearray()
+        self.image_attached = False  # True when the last message carries image data
+        self.username = None  # Set by the server once the peer has logged in
+        self._loop = asyncio.get_running_loop()
+        self._pending_pushes: Optional[List[bytes]] = None  # Held back while a file is sent
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    async def _fill(self) -> None:
+        """
+        Read the next available chunk from the stream into the buffer.
+        """
+        try:
+            chunk = await self.reader.read(RECV_BUFFER_SIZE)
+        except ConnectionError as e:
+            raise RuntimeError(f"Error receiving data: {e}")
+        if not chunk:
+            raise RuntimeError("Connection closed while receiving data")
+        self._buffer.extend(chunk)
+
+    async def _read_exact(self, size: int) -> bytes:
+        """
+        Read exactly `size` bytes, starting with anything already buffered.
+        """
+        if len(self._buffer) >= size:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+        head = bytes(self._buffer)
+        self._buffer.clear()
+        try:
+            return head + await self.reader.readexactly(size - len(head))
+        except asyncio.IncompleteReadError:
+            raise RuntimeError("Connection closed while receiving data")
+        except ConnectionError as e:
+            raise RuntimeError(f"Error receiving data: {e}")
+
+    async def receive_message(self) -> Dict[str, Any]:
+        """
+        Receive the next JSON message from the peer.
+        """
+        if self.framed is None:
+            if not self._buffer:
+                await self._fill()
+            self.framed = self._buffer[:1] == FRAME_MAGIC[:1]
+        self.image_attached = False
+        if self.framed:
+            header = await self._read_exact(FRAME_HEADER.size)
+            frame_type, length = _parse_frame_header(header, self.max_message_size)
+            self.image_attached = frame_type == FRAME_JSON_WITH_IMAGE
+            self.bytes_received += FRAME_HEADER.size + length
+            return _decode_payload(await self._read_exact(length))
+        while True:
+            buffered = len(self._buffer)
+            message = _pop_legacy_message(self._buffer)
+            if message is not None:
+                self.bytes_received += buffered - len(self._buffer)
+                return message
+            if len(self._buffer) > self.max_message_size:
+                raise RuntimeError("Message exceeds size limit")
+            await self._fill()
+
+    async def send_message(self, message: Dict[str, Any]) -> None:
+        """
+        Send a JSON message to the peer using the connection's protocol.
+        """
+        data = encode_message(message, framed=self.framed is not False)
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            raise RuntimeError(f"Error sending JSON message: {e}")
+
+    def push(self, message: Dict[str, Any]) -> int:
+        """
+        Queue an unsolicited message (e.g. a server event) from any thread.
+
+        The write is scheduled on the connection's event loop and not awaited,
+        so a slow subscriber never blocks the caller.
+
+        Returns:
+            int: Bytes queued
+        """
+        data = encode_message(message, framed=self.framed is not False)
+        self._loop.call_soon_threadsafe(self._write_pushed, data)
+        return len(data)
+
+    def _write_pushed(self, data: bytes) -> None:
+        """
+        Write pushed data unless the connection has already been closed.
+        """
+        if self._pending_pushes is not None:
+            self._pending_pushes.append(data)
+        elif not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def send_message_with_file(self, message: Dict[str, Any], path: str) -> None:
+        """
+        Send a JSON message followed by the contents of a file.
+
+        The file is streamed with `loop.sendfile`, which uses `os.sendfile` where
+        the platform supports it. The transport cannot accept other writes
+        until it completes, so pushed events are held back meanwhile.
+        """
+        with open(path, 'rb') as f:
+            head, size = _encode_file_message(message, self.framed is not False, f)
+            self.writer.write(head)
+            self.bytes_sent += len(head) + size
+            self._pending_pushes = []
+            try:
+                if size:
+                    await self._loop.sendfile(self.writer.transport, f, 0, size)
+                else:
+                    await self.writer.drain()
+            except ConnectionError as e:
+                raise RuntimeError(f"Error sending file: {e}")
+            finally:
+                pending, self._pending_pushes = self._pending_pushes, None
+                for data in pending:
+                    self._write_pushed(data)
+
+    async def send_image(self, image_data: bytes) -> None:
+        """
+        Send length-prefixed image data to the peer.
+        """
+        self.writer.write(len(image_data).to_bytes(8, byteorder='big'))
+        self.writer.write(image_data)
+        self.bytes_sent += 8 + len(image_data)
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            raise RuntimeError(f"Error sending image: {e}")
+
+    async def send_message_with_image(self, message: Dict[str, Any], image_data: bytes) -> None:
+        """
+        Send a JSON message together with image data in one FRAME_JSON_WITH_IMAGE frame.
+
+        Legacy connections cannot carry both in one message; they need the
+        'ready' / `send_image` / 'success' handshake, which the caller must
+        drive since it owns the receiving side.
+        """
+        if self.framed is False:
+            raise RuntimeError("Legacy connections need the upload handshake")
+        header = encode_message(message, frame_type=FRAME_JSON_WITH_IMAGE)
+        self.writer.write(header + len(image_data).to_bytes(8, byteorder='big'))
+        self.writer.write(image_data)
+        self.bytes_sent += len(header) + 8 + len(image_data)
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            raise RuntimeError(f"Error sending image: {e}")
+
+    async def receive_image(self) -> bytes:
+        """
+        Receive length-prefixed image data from the peer.
+        """
+        image_size = await self.receive_image_size()
+        self.bytes_received += image_size
+        return await self._read_exact(image_size)
+
+    async def receive_image_size(self) -> int:
+        """
+        Receive the 8-byte size that precedes image data.
+        """
+        self.bytes_received += 8
+        return int.from_bytes(await self._read_exact(8), byteorder='big')
+
+    async def receive_image_into(self, sink, size: int) -> None:
+        """
+        Stream `size` bytes of image data into `sink.write`, one chunk at a time.
+        """
+        self.bytes_received += size
+        if self._buffer:
+            head = bytes(self._buffer[:size])
+            del self._buffer[:len(head)]
+            sink.write(head)
+            size -= len(head)
+        try:
+            while size:
+                chunk = await self.reader.read(min(size, RECV_BUFFER_SIZE))
+                if not chunk:
+                    raise RuntimeError("Connection closed while receiving data")
+                sink.write(chunk)
+                size -= len(chunk)
+        except ConnectionError as e:
+            raise RuntimeError(f"Error receiving data: {e}")
+
+    async def skip_image(self, size: int) -> None:
+        """
+        Read and drop `size` bytes of image data, e.g. from a rejected upload.
+        """
+        await self.receive_image_into(_DiscardSink(), size)
+
+    def close(self) -> None:
+        """
+        Close the underlying stream.
+        """
+        self.writer.close()
@@ -0,0 +1,721 @@
+"""
+This module implements the storage layer behind the server's request handlers.
+
+Two interchangeable backends are provided:
+- JsonStorage: the files under ``data/`` (users.json, the posts log and the
+  per-conversation message logs). Suitable for small installs and the default.
+- SqliteStorage: a single SQLite database in WAL mode, with indexes on
+  conversation and timestamp, post author, comments per post and friend edges.
+
+Running this module imports an existing ``data/`` tree into a SQLite database:
+
+    python storage.py import --db data/instanet.db
+
+or moves images uploaded before the blob store into it, once, while the
+server is stopped:
+
+    python storage.py import-images --storage sqlite --db data/instanet.db
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from blob_store import BlobStore
+from constants import (
+    USERS_FILE, POSTS_FILE, MESSAGES_DIR, IMAGES_DIR, SQLITE_DB_FILE, STORAGE_BACKENDS, DEFAULT_STORAGE,
+    IMAGE_VARIANTS, BUFFER_SIZE
+)
+from message_store import MessageLog
+from post_store import PostStore, read_posts
+from user_store import UserStore
+
+
+WRITE_OPERATIONS = frozenset({  # Storage methods that modify data
+    'create_user', 'send_friend_request', 'accept_friend_request', 'reject_friend_request',
+    'append_message', 'add_post', 'add_comment', 'rewrite_image_paths'
+})
+
+
+class Storage(ABC):
+    """
+    Interface implemented by every storage backend.
+
+    User methods mirror `UserStore`; message ids are positions within a
+    conversation, as in `MessageLog`.
+    """
+
+    @abstractmethod
+    def create_user(self, username: str, password: str) -> bool:
+        """
+        Add a user; False if the username is taken.
+        """
+
+    @abstractmethod
+    def authenticate(self, username: str, password: Optional[str]) -> bool:
+        """
+        Check a username and password.
+        """
+
+    @abstractmethod
+    def exists(self, username: str) -> bool:
+        """
+        Check whether a user exists.
+        """
+
+    @abstractmethod
+    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a user's password, friends and requests, or None.
+        """
+
+    @abstractmethod
+    def get_friends(self, username: str) -> List[str]:
+        """
+        Return a user's friends.
+        """
+
+    @abstractmethod
+    def list_usernames(self) -> List[str]:
+        """
+        Return all usernames.
+        """
+
+    @abstractmethod
+    def send_friend_request(self, sender: str, receiver: str) -> bool:
+        """
+        Record a friend request; False if it is invalid or pending.
+        """
+
+    @abstractmethod
+    def accept_friend_request(self, user: str, friend: str) -> bool:
+        """
+        Accept a pending request, making both users friends.
+        """
+
+    @abstractmethod
+    def reject_friend_request(self, user: str, friend: str) -> bool:
+        """
+        Drop a pending request.
+        """
+
+    @abstractmethod
+    def append_message(self, user1: str, user2: str, message: Dict[str, Any]) -> int:
+        """
+        Append a message to a conversation and return its id.
+        """
+
+    @abstractmethod
+    def get_messages(self, user1: str, user2: str, limit: Optional[int] = None,
+                     before: Optional[int] = None, after: Optional[int] = None
+                     ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Return a page of a conversation and whether more messages exist.
+        """
+
+    @abstractmethod
+    def add_post(self, post: Dict[str, Any]) -> None:
+        """
+        Store a new post.
+        """
+
+    @abstractmethod
+    def add_comment(self, image_path: str, user: str, text: str, post_id: Optional[int] = None) -> bool:
+        """
+        Add a comment to the post with the given id, or else the first post
+        with the given image; False if not found.
+        """
+
+    @abstractmethod
+    def list_posts(self) -> List[Dict[str, Any]]:
+        """
+        Return all posts, oldest first.
+        """
+
+    @abstractmethod
+    def get_feed(self, authors: List[str], limit: int,
+                 before: Optional[int] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Return the newest posts by the given authors, each carrying its `id`,
+        and whether older ones exist; `before` limits the page to smaller ids.
+        """
+
+    @abstractmethod
+    def can_view_image(self, username: str, image_path: str) -> bool:
+        """
+        Check whether a user may download an image: one posted by the user or
+        a friend, or sent in one of the user's conversations.
+        """
+
+    @abstractmethod
+    def rewrite_image_paths(self, rename: Callable[[str], Optional[str]]) -> int:
+        """
+        Call `rename` once for every post and message holding an image and
+        store the path it returns, if any; return the number changed.
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Persist pending changes and release resources.
+        """
+
+
+class JsonStorage(Storage):
+    """
+    Storage backed by the JSON files in the data directory.
+
+    Args:
+        users_file (str): Path to users.json
+        posts_file (str): Path to posts.json; posts are logged beside it in posts.jsonl
+        messages_dir (str): Directory of conversation logs
+    """
+
+    def __init__(self, users_file: str = USERS_FILE, posts_file: str = POSTS_FILE,
+                 messages_dir: str = MESSAGES_DIR):
+        self.users = UserStore(users_file)
+        self.messages = MessageLog(messages_dir)
+        self.posts = PostStore(posts_file)
+
+    def create_user(self, username, password):
+        return self.users.create_user(username, password)
+
+    def authenticate(self, username, password):
+        return self.users.authenticate(username, password)
+
+    def exists(self, username):
+        return self.users.exists(username)
+
+    def get_user(self, username):
+        return self.users.get_user(username)
+
+    def get_friends(self, username):
+        return self.users.get_friends(username)
+
+    def list_usernames(self):
+        return self.users.list_usernames()
+
+    def send_friend_request(self, sender, receiver):
+        return self.users.send_friend_request(sender, receiver)
+
+    def accept_friend_request(self, user, friend):
+        return self.users.accept_friend_request(user, friend)
+
+    def reject_friend_request(self, user, friend):
+        return self.users.reject_friend_request(user, friend)
+
+    def append_message(self, user1, user2, message):
+        return self.messages.append(user1, user2, message)
+
+    def get_messages(self, user1, user2, limit=None, before=None, after=None):
+        return self.messages.get_messages(user1, user2, limit=limit, before=before, after=after)
+
+    def add_post(self, post):
+        self.posts.add(post)
+
+    def add_comment(self, image_path, user, text, post_id=None):
+        return self.posts.add_comment(image_path, user, text, post_id=post_id)
+
+    def list_posts(self):
+        return self.posts.list_posts()
+
+    def get_feed(self, authors, limit, before=None):
+        return self.posts.get_feed(authors, limit, before=before)
+
+    def can_view_image(self, username, image_path):
+        authors = self.posts.image_authors(image_path)
+        if username in authors or not authors.isdisjoint(self.users.get_friends(username)):
+            return True
+        return username in self.messages.image_users(image_path)
+
+    def rewrite_image_paths(self, rename):
+        return self.posts.rewrite_image_paths(rename) + self.messages.rewrite_image_paths(rename)
+
+    def close(self):
+        self.users.close()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS friends (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    friend TEXT NOT NULL,
+    UNIQUE (username, friend)
+);
+CREATE INDEX IF NOT EXISTS friends_by_friend ON friends (friend);
+CREATE TABLE IF NOT EXISTS friend_requests (
+    id INTEGER PRIMARY KEY,
+    receiver TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    UNIQUE (receiver, sender)
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    image_path TEXT,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_by_author ON posts (username, id);
+CREATE INDEX IF NOT EXISTS posts_by_image ON posts (image_path);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES posts (id),
+    username TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_by_post ON comments (post_id, id);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    receiver TEXT NOT NULL,
+    timestamp TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (conversation, seq)
+);
+CREATE INDEX IF NOT EXISTS messages_by_time ON messages (conversation, timestamp);
+CREATE INDEX IF NOT EXISTS messages_by_image ON messages (json_extract(data, '$.image_path'));
+"""
+
+
+class SqliteStorage(Storage):
+    """
+    Storage backed by a SQLite database in WAL mode.
+
+    Each thread gets its own connection so readers never wait on each other;
+    writes are serialized through one lock and run in short transactions.
+
+    Args:
+        path (str): Path to the database file
+    """
+
+    def __init__(self, path: str = SQLITE_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Return this thread's database connection.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            with self._write_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run a block of writes as one transaction.
+        """
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def create_user(self, username, password):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)', (username, password)
+            )
+            return cursor.rowcount == 1
+
+    def authenticate(self, username, password):
+        row = self._connection().execute(
+            'SELECT password FROM users WHERE username = ?', (username,)
+        ).fetchone()
+        return row is not None and row[0] == password
+
+    def exists(self, username):
+        return self._connection().execute(
+            'SELECT 1 FROM users WHERE username = ?', (username,)
+        ).fetchone() is not None
+
+    def get_user(self, username):
+        conn = self._connection()
+        row = conn.execute('SELECT password FROM users WHERE username = ?', (username,)).fetchone()
+        if row is None:
+            return None
+        requests = conn.execute(
+            'SELECT sender FROM friend_requests WHERE receiver = ? ORDER BY id', (username,)
+        ).fetchall()
+        return {
+            'password': row[0],
+            'friends': self.get_friends(username),
+            'requests': [sender for (sender,) in requests],
+        }
+
+    def get_friends(self, username):
+        rows = self._connection().execute(
+            'SELECT friend FROM friends WHERE username = ? ORDER BY id', (username,)
+        ).fetchall()
+        return [friend for (friend,) in rows]
+
+    def list_usernames(self):
+        return [username for (username,) in self._connection().execute('SELECT username FROM users')]
+
+    def send_friend_request(self, sender, receiver):
+        if sender == receiver:
+            return False
+        with self._transaction() as conn:
+            known = conn.execute(
+                'SELECT COUNT(*) FROM users WHERE username IN (?, ?)', (sender, receiver)
+            ).fetchone()[0]
+            if known != 2:
+                return False
+            if conn.execute(
+                'SELECT 1 FROM friends WHERE username = ? AND friend = ?', (receiver, sender)
+            ).fetchone():
+                return False
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO friend_requests (receiver, sender) VALUES (?, ?)', (receiver, sender)
+            )
+            return cursor.rowcount == 1
+
+    def accept_friend_request(self, user, friend):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'DELETE FROM friend_requests WHERE receiver = ? AND sender = ?', (user, friend)
+            )
+            if cursor.rowcount == 0 or not conn.execute(
+                'SELECT 1 FROM users WHERE username = ?', (friend,)
+            ).fetchone():
+                return False
+            conn.executemany(
+                'INSERT OR IGNORE INTO friends (username, friend) VALUES (?, ?)',
+                [(user, friend), (friend, user)]
+            )
+            return True
+
+    def reject_friend_request(self, user, friend):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'DELETE FROM friend_requests WHERE receiver = ? AND sender = ?', (user, friend)
+            )
+            return cursor.rowcount == 1
+
+    def append_message(self, user1, user2, message):
+        conversation = MessageLog.conversation_key(user1, user2)
+        with self._transaction() as conn:
+            seq = conn.execute(
+                'SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation = ?', (conversation,)
+            ).fetchone()[0]
+            conn.execute(
+                'INSERT INTO messages (conversation, seq, sender, receiver, timestamp, data) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (conversation, seq, message.get('sender'), message.get('receiver'),
+                 message.get('timestamp'), json.dumps(message))
+            )
+        return seq
+
+    def get_messages(self, user1, user2, limit=None, before=None, after=None):
+        conversation = MessageLog.conversation_key(user1, user2)
+        low = -1 if after is None else after
+        high = None if before is None else before
+        query = 'SELECT seq, data FROM messages WHERE conversation = ? AND seq > ?'
+        params: List[Any] = [conversation, low]
+        if high is not None:
+            query += ' AND seq < ?'
+            params.append(high)
+        # Page forward from `after`, otherwise backward from `before` / the newest
+        query += ' ORDER BY seq ' + ('ASC' if after is not None else 'DESC')
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit + 1)
+        rows = self._connection().execute(query, params).fetchall()
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit] if limit is not None else rows
+        if after is None:
+            rows.reverse()
+        messages = []
+        for seq, data in rows:
+            message = json.loads(data)
+            message['id'] = seq
+            messages.append(message)
+        return messages, has_more
+
+    def add_post(self, post):
+        with self._transaction() as conn:
+            data = {key: value for key, value in post.items() if key != 'comments'}
+            cursor = conn.execute(
+                'INSERT INTO posts (username, image_path, timestamp, data) VALUES (?, ?, ?, ?)',
+                (post.get('username'), post.get('image_path'), post.get('timestamp'), json.dumps(data))
+            )
+            conn.executemany(
+                'INSERT INTO comments (post_id, username, text) VALUES (?, ?, ?)',
+                [(cursor.lastrowid, c.get('user'), c.get('text')) for c in post.get('comments', [])]
+            )
+
+    def add_comment(self, image_path, user, text, post_id=None):
+        with self._transaction() as conn:
+            if post_id is not None:
+                row = conn.execute('SELECT id FROM posts WHERE id = ?', (post_id,)).fetchone()
+            else:
+                row = conn.execute(
+                    'SELECT id FROM posts WHERE image_path = ? ORDER BY id LIMIT 1', (image_path,)
+                ).fetchone()
+            if row is None:
+                return False
+            conn.execute(
+                'INSERT INTO comments (post_id, username, text) VALUES (?, ?, ?)', (row[0], user, text)
+            )
+        return True
+
+    def _attach_comments(self, rows) -> List[Dict[str, Any]]:
+        """
+        Build post dicts from (id, data) rows, including their comments.
+        """
+        posts = {}
+        for post_id, data in rows:
+            posts[post_id] = json.loads(data)
+        if posts:
+            placeholders = ','.join('?' * len(posts))
+            for post_id, username, text in self._connection().execute(
+                f'SELECT post_id, username, text FROM comments WHERE post_id IN ({placeholders}) '
+                'ORDER BY post_id, id', list(posts)
+            ):
+                posts[post_id].setdefault('comments', []).append({'user': username, 'text': text})
+        return list(posts.values())
+
+    def list_posts(self):
+        rows = self._connection().execute('SELECT id, data FROM posts ORDER BY id').fetchall()
+        return self._attach_comments(rows)
+
+    def get_feed(self, authors, limit, before=None):
+        authors = list(set(authors))
+        if not authors:
+            return [], False
+        placeholders = ','.join('?' * len(authors))
+        query = f'SELECT id, data FROM posts WHERE username IN ({placeholders})'
+        params: List[Any] = list(authors)
+        if before is not None:
+            query += ' AND id < ?'
+            params.append(before)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit + 1)
+        rows = self._connection().execute(query, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        posts = self._attach_comments(rows)
+        for (post_id, _), post in zip(rows, posts):
+            post['id'] = post_id
+        return posts, has_more
+
+    def can_view_image(self, username, image_path):
+        conn = self._connection()
+        if conn.execute(
+            'SELECT 1 FROM posts WHERE image_path = ? AND (username = ? OR username IN '
+            '(SELECT friend FROM friends WHERE username = ?)) LIMIT 1', (image_path, username, username)
+        ).fetchone():
+            return True
+        return conn.execute(
+            "SELECT 1 FROM messages WHERE json_extract(data, '$.image_path') = ? "
+            'AND ? IN (sender, receiver) LIMIT 1', (image_path, username)
+        ).fetchone() is not None
+
+    def rewrite_image_paths(self, rename):
+        changed = 0
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT id, image_path FROM posts WHERE image_path IS NOT NULL').fetchall()
+            for post_id, image_path in rows:
+                new_path = rename(image_path) if image_path else None
+                if new_path is not None:
+                    conn.execute(
+                        "UPDATE posts SET image_path = ?, data = json_set(data, '$.image_path', ?) WHERE id = ?",
+                        (new_path, new_path, post_id)
+                    )
+                    changed += 1
+            rows = conn.execute(
+                "SELECT conversation, seq, json_extract(data, '$.image_path') FROM messages "
+                "WHERE json_extract(data, '$.image_path') IS NOT NULL ORDER BY conversation, seq"
+            ).fetchall()
+            for conversation, seq, image_path in rows:
+                new_path = rename(image_path) if image_path else None
+                if new_path is not None:
+                    conn.execute(
+                        "UPDATE messages SET data = json_set(data, '$.image_path', ?) "
+                        'WHERE conversation = ? AND seq = ?', (new_path, conversation, seq)
+                    )
+                    changed += 1
+        return changed
+
+    def close(self):
+        with self._write_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def create_storage(backend: str = 'json', db_path: str = SQLITE_DB_FILE) -> Storage:
+    """
+    Create the storage backend selected on the command line.
+
+    Args:
+        backend (str): 'json' or 'sqlite'
+        db_path (str): Database path for the SQLite backend
+
+    Returns:
+        Storage: The storage backend
+    """
+    if backend == 'sqlite':
+        return SqliteStorage(db_path)
+    if backend == 'json':
+        return JsonStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def import_json_data(target: Storage, users_file: str = USERS_FILE, posts_file: str = POSTS_FILE,
+                     messages_dir: str = MESSAGES_DIR) -> Dict[str, int]:
+    """
+    Copy a JSON data tree into another storage backend.
+
+    The source files are only read; legacy ``posts.json`` and ``.json``
+    conversations are not migrated in place. Users and friend edges already present in the target
+    are skipped, as are posts and conversations when the target already
+    holds some.
+
+    Returns:
+        dict: Number of users, posts and messages imported
+    """
+    counts = {'users': 0, 'posts': 0, 'messages': 0}
+    users = {}
+    if os.path.exists(users_file):
+        with open(users_file, 'r') as f:
+            users = json.load(f)
+    for username, data in users.items():
+        if target.create_user(username, data.get('password', '')):
+            counts['users'] += 1
+    for username, data in users.items():
+        for sender in data.get('requests', []):
+            target.send_friend_request(sender, username)
+        for friend in data.get('friends', []):
+            if friend in users and friend not in target.get_friends(username):
+                target.send_friend_request(friend, username)
+                target.accept_friend_request(username, friend)
+
+    if not target.list_posts():
+        for post in read_posts(posts_file):
+            target.add_post(post)
+            counts['posts'] += 1
+
+    if os.path.isdir(messages_dir):
+        for name in sorted(os.listdir(messages_dir)):
+            stem, extension = os.path.splitext(name)
+            path = os.path.join(messages_dir, name)
+            if extension == '.jsonl':
+                with open(path, 'rb') as f:
+                    messages = [json.loads(line) for line in f if line.endswith(b'\n')]
+            elif extension == '.json' and not os.path.exists(os.path.join(messages_dir, f"{stem}.jsonl")):
+                with open(path, 'r') as f:
+                    messages = json.load(f)
+            else:
+                continue
+            if not messages:
+                continue
+            user1, user2 = messages[0]['sender'], messages[0]['receiver']
+            if target.get_messages(user1, user2, limit=1)[0]:
+                continue
+            for message in messages:
+                message.pop('id', None)
+                target.append_message(user1, user2, message)
+                counts['messages'] += 1
+    return counts
+
+
+def import_images(target: Storage, blobs: BlobStore, images_dir: str = IMAGES_DIR) -> Dict[str, int]:
+    """
+    Move the images uploaded before the blob store into it.
+
+    Every post and message naming a file in the images directory is pointed
+    at the file's blob instead, and counts as one reference to it. Identical
+    files end up as a single blob. Once the stored paths are rewritten, the
+    imported files and their derivatives are removed. Run it while the
+    server is stopped.
+
+    Args:
+        target (Storage): The storage backend holding the posts and messages
+        blobs (BlobStore): The blob store receiving the images
+        images_dir (str): Directory of the images uploaded before the blob store
+
+    Returns:
+        dict: Number of files imported, blobs they were stored as, and
+            references rewritten
+    """
+    digests: Dict[str, str] = {}  # Imported file name -> digest of its blob
+
+    def rename(image_path):
+        if blobs.digest_of(image_path) is not None:
+            return None
+        name = os.path.basename(str(image_path).replace('\\', '/'))
+        source = os.path.join(images_dir, name)
+        if not name or name.startswith('.') or not os.path.isfile(source):
+            return None
+        if name in digests:
+            blobs.retain(digests[name])
+        else:
+            with open(source, 'rb') as f, blobs.writer() as writer:
+                for chunk in iter(lambda: f.read(BUFFER_SIZE), b''):
+                    writer.write(chunk)
+                digests[name] = writer.commit()
+        return blobs.path(digests[name])
+
+    references = target.rewrite_image_paths(rename)
+    for name in digests:
+        os.remove(os.path.join(images_dir, name))
+        stem = os.path.splitext(name)[0]
+        for variant in IMAGE_VARIANTS:
+            variant_path = os.path.join(images_dir, 'variants', f"{stem}_{variant}.jpg")
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+    return {'files': len(digests), 'blobs': len(set(digests.values())), 'references': references}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='InstaNet storage tools')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    import_parser = subcommands.add_parser('import', help='Import the JSON data tree into SQLite')
+    import_parser.add_argument('--db', default=SQLITE_DB_FILE, help='SQLite database path (default: %(default)s)')
+    images_parser = subcommands.add_parser('import-images',
+                                           help='Move images uploaded before the blob store into it')
+    images_parser.add_argument('--storage', choices=STORAGE_BACKENDS, default=DEFAULT_STORAGE,
+                               help='Storage backend holding the posts and messages (default: %(default)s)')
+    images_parser.add_argument('--db', default=SQLITE_DB_FILE, help='SQLite database path (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        storage = SqliteStorage(args.db)
+        counts = import_json_data(storage)
+        storage.close()
+        print(f"Imported {counts['users']} users, {counts['posts']} posts "
+              f"and {counts['messages']} messages into {args.db}")
+    elif args.command == 'import-images':
+        storage = create_storage(args.storage, args.db)
+        blobs = BlobStore()
+        counts = import_images(storage, blobs)
+        blobs.close()
+        storage.close()
+        print(f"Imported {counts['files']} images as {counts['blobs']} blobs "
+              f"and rewrote {counts['references']} image paths")
@@ -0,0 +1,112 @@
+"""
+Tests for the content-addressed, reference-counted blob store.
+"""
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from blob_store import TMP_MAX_AGE, BlobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    yield store
+    store.close()
+
+
+def test_identical_blobs_are_stored_once(store):
+    first = store.put(b'image bytes')
+    second = store.put(b'image bytes')
+    other = store.put(b'other bytes')
+    assert first == second == hashlib.sha256(b'image bytes').hexdigest()
+    assert other != first
+    assert store.stored_bytes == len(b'image bytes') + len(b'other bytes')
+    with open(store.path(first), 'rb') as f:
+        assert f.read() == b'image bytes'
+    assert store.path(first).endswith(os.path.join(first[:2], first[2:4], first))
+
+
+def test_streamed_writer_matches_put(store):
+    with store.writer() as writer:
+        writer.write(b'image ')
+        writer.write(b'bytes')
+        digest = writer.commit()
+    assert digest == store.put(b'image bytes')
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_discarded_writer_leaves_nothing(store):
+    with store.writer() as writer:
+        writer.write(b'abandoned')
+    assert os.listdir(store.tmp_dir) == []
+    assert store.stored_bytes == 0
+
+
+def test_blob_is_collected_after_its_last_reference(store):
+    digest = store.put(b'shared')
+    store.put(b'shared')
+    store.release(digest)
+    assert store.collect_garbage() == []
+    assert store.exists(digest)
+    store.release(digest)
+    assert store.collect_garbage() == [digest]
+    assert not store.exists(digest)
+    assert store.stored_bytes == 0
+
+
+def test_retain_adds_a_reference(store):
+    digest = store.put(b'retained')
+    store.retain(digest)
+    store.release(digest)
+    assert store.collect_garbage() == []
+    with pytest.raises(KeyError):
+        store.retain('0' * 64)
+
+
+def test_reference_counts_survive_reopening(tmp_path, store):
+    kept = store.put(b'kept')
+    store.put(b'kept')
+    released = store.put(b'released')
+    store.release(kept)
+    store.release(released)
+    store.close()
+
+    reopened = BlobStore(store.directory)
+    with open(reopened.refs_path) as f:
+        assert sorted(f) == sorted([f"{kept} 1\n", f"{released} 0\n"])  # Compacted to one line per blob
+    assert reopened.collect_garbage() == [released]
+    assert reopened.exists(kept)
+    reopened.close()
+
+
+def test_blob_unknown_to_the_log_is_never_collected(store):
+    digest = store.put(b'orphan')
+    store.close()
+    os.remove(store.refs_path)
+    reopened = BlobStore(store.directory)
+    assert reopened.collect_garbage() == []
+    assert reopened.exists(digest)
+    reopened.close()
+
+
+def test_abandoned_temporary_files_are_collected(store):
+    stale = os.path.join(store.tmp_dir, 'stale')
+    fresh = os.path.join(store.tmp_dir, 'fresh')
+    for path in (stale, fresh):
+        with open(path, 'wb') as f:
+            f.write(b'partial upload')
+    old = time.time() - TMP_MAX_AGE - 1
+    os.utime(stale, (old, old))
+    store.collect_garbage()
+    assert os.listdir(store.tmp_dir) == ['fresh']
+
+
+def test_digest_of(store):
+    digest = store.put(b'x')
+    assert store.digest_of(store.path(digest)) == digest
+    assert store.digest_of(store.path(digest).replace('/', '\\')) == digest
+    assert store.digest_of('data/images/user1_2025.jpg') is None
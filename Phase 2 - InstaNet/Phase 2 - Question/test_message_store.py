@@ -0,0 +1,121 @@
+"""
+Tests for the append-only per-conversation message log.
+"""
+
+import json
+import os
+
+import pytest
+
+from message_store import OFFSET, MessageLog
+
+
+def message(i, sender='alice', receiver='bob', **extra):
+    return dict({'sender': sender, 'receiver': receiver, 'message': f"m{i}"}, **extra)
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = MessageLog(str(tmp_path))
+    for i in range(10):
+        log.append('alice', 'bob', message(i))
+    return log
+
+
+def texts(messages):
+    return [m['message'] for m in messages]
+
+
+def test_append_returns_positions_and_both_orders_share_a_conversation(tmp_path):
+    log = MessageLog(str(tmp_path))
+    assert log.append('bob', 'alice', message(0)) == 0
+    assert log.append('alice', 'bob', message(1)) == 1
+    assert log.count('bob', 'alice') == 2
+    assert sorted(os.listdir(tmp_path)) == ['alice_bob.idx', 'alice_bob.jsonl']
+
+
+def test_whole_conversation_without_cursor(log):
+    messages, has_more = log.get_messages('bob', 'alice')
+    assert texts(messages) == [f"m{i}" for i in range(10)]
+    assert [m['id'] for m in messages] == list(range(10))
+    assert not has_more
+
+
+def test_limit_returns_newest(log):
+    messages, has_more = log.get_messages('alice', 'bob', limit=3)
+    assert texts(messages) == ['m7', 'm8', 'm9']
+    assert has_more
+
+
+def test_before_pages_backward(log):
+    messages, has_more = log.get_messages('alice', 'bob', limit=3, before=7)
+    assert texts(messages) == ['m4', 'm5', 'm6']
+    assert has_more
+    messages, has_more = log.get_messages('alice', 'bob', limit=5, before=3)
+    assert texts(messages) == ['m0', 'm1', 'm2']
+    assert not has_more
+
+
+def test_after_pages_forward(log):
+    messages, has_more = log.get_messages('alice', 'bob', limit=3, after=2)
+    assert texts(messages) == ['m3', 'm4', 'm5']
+    assert has_more
+    messages, has_more = log.get_messages('alice', 'bob', after=6)
+    assert texts(messages) == ['m7', 'm8', 'm9']
+    assert not has_more
+    assert log.get_messages('alice', 'bob', after=9) == ([], False)
+
+
+def test_after_and_before_bound_the_page(log):
+    messages, has_more = log.get_messages('alice', 'bob', after=2, before=6)
+    assert texts(messages) == ['m3', 'm4', 'm5']
+    assert not has_more
+
+
+def test_torn_line_is_dropped_and_index_rebuilt(tmp_path, log):
+    log_path = tmp_path / 'alice_bob.jsonl'
+    # A crash after writing half a line and before its index entry
+    with open(log_path, 'ab') as f:
+        f.write(b'{"sender": "alice", "mess')
+    reopened = MessageLog(str(tmp_path))
+    assert reopened.count('alice', 'bob') == 10
+    assert log_path.read_bytes().endswith(b'\n')
+    assert reopened.append('alice', 'bob', message(10)) == 10
+    messages, _ = reopened.get_messages('alice', 'bob', limit=2)
+    assert texts(messages) == ['m9', 'm10']
+
+
+def test_missing_index_entry_is_rebuilt(tmp_path, log):
+    index_path = tmp_path / 'alice_bob.idx'
+    # A crash after appending a complete line but before its index entry
+    with open(tmp_path / 'alice_bob.jsonl', 'ab') as f:
+        f.write(json.dumps(message(10)).encode() + b'\n')
+    reopened = MessageLog(str(tmp_path))
+    assert reopened.count('alice', 'bob') == 11
+    assert index_path.stat().st_size == 11 * OFFSET.size
+    messages, _ = reopened.get_messages('alice', 'bob', limit=1, before=11)
+    assert texts(messages) == ['m10']
+
+
+def test_legacy_conversation_is_converted(tmp_path):
+    (tmp_path / 'alice_bob.json').write_text(json.dumps([message(0), message(1, 'bob', 'alice')]))
+    log = MessageLog(str(tmp_path))
+    assert log.count('alice', 'bob') == 2
+    assert not (tmp_path / 'alice_bob.json').exists()
+    messages, _ = log.get_messages('alice', 'bob')
+    assert texts(messages) == ['m0', 'm1']
+
+
+def test_image_users_and_rewrite(tmp_path, log):
+    log.append('alice', 'bob', message(10, image_path='data/images/a.jpg'))
+    log.append('carol', 'bob', message(11, 'carol', 'bob', image_path='data/images/a.jpg'))
+    assert log.image_users('data/images/a.jpg') == {'alice', 'bob', 'carol'}
+    log.append('dave', 'erin', message(12, 'dave', 'erin', image_path='data/images/b.jpg'))
+    assert log.image_users('data/images/b.jpg') == {'dave', 'erin'}
+
+    renamed = log.rewrite_image_paths(lambda path: 'blob' if path.endswith('a.jpg') else None)
+    assert renamed == 2
+    assert log.image_users('data/images/a.jpg') == set()
+    assert log.image_users('blob') == {'alice', 'bob', 'carol'}
+    messages, _ = MessageLog(str(tmp_path)).get_messages('alice', 'bob', after=9)
+    assert [m['image_path'] for m in messages] == ['blob']
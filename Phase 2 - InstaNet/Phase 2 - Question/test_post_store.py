@@ -0,0 +1,108 @@
+"""
+Tests for the append-only post log and its in-memory indexes.
+"""
+
+import json
+
+import pytest
+
+from post_store import PostStore, read_posts
+
+
+def post(username, n):
+    return {'username': username, 'image_path': f"data/images/{username}_{n}.jpg", 'caption': f"{username} {n}"}
+
+
+@pytest.fixture
+def posts_file(tmp_path):
+    return str(tmp_path / 'posts.json')
+
+
+def captions(posts):
+    return [p['caption'] for p in posts]
+
+
+def test_posts_and_comments_survive_replay(posts_file):
+    store = PostStore(posts_file)
+    assert store.add(post('alice', 0)) == 0
+    assert store.add(post('bob', 0)) == 1
+    assert store.add_comment(None, 'bob', 'nice', post_id=0)
+    assert store.add_comment('data/images/bob_0.jpg', 'alice', 'thanks')
+
+    replayed = PostStore(posts_file).list_posts()
+    assert replayed == store.list_posts()
+    assert replayed[0]['comments'] == [{'user': 'bob', 'text': 'nice'}]
+    assert replayed[1]['comments'] == [{'user': 'alice', 'text': 'thanks'}]
+    assert read_posts(posts_file) == replayed
+
+
+def test_add_comment_rejects_unknown_posts(posts_file):
+    store = PostStore(posts_file)
+    store.add(post('alice', 0))
+    assert not store.add_comment(None, 'bob', 'x', post_id=1)
+    assert not store.add_comment(None, 'bob', 'x', post_id=-1)
+    assert not store.add_comment('data/images/missing.jpg', 'bob', 'x')
+
+
+def test_torn_final_line_is_dropped(tmp_path, posts_file):
+    store = PostStore(posts_file)
+    store.add(post('alice', 0))
+    with open(tmp_path / 'posts.jsonl', 'ab') as f:
+        f.write(b'{"post": {"username": "al')
+    reopened = PostStore(posts_file)
+    assert captions(reopened.list_posts()) == ['alice 0']
+    assert reopened.add(post('alice', 1)) == 1
+    assert captions(PostStore(posts_file).list_posts()) == ['alice 0', 'alice 1']
+
+
+def test_comment_on_unknown_post_is_skipped(tmp_path, posts_file, capsys):
+    with open(tmp_path / 'posts.jsonl', 'w') as f:
+        f.write(json.dumps({'post': post('alice', 0)}) + '\n')
+        f.write(json.dumps({'comment': {'user': 'bob', 'text': 'lost'}, 'post_id': 3}) + '\n')
+        f.write(json.dumps({'comment': {'user': 'bob', 'text': 'kept'}, 'post_id': 0}) + '\n')
+    assert PostStore(posts_file).list_posts()[0]['comments'] == [{'user': 'bob', 'text': 'kept'}]
+    assert read_posts(posts_file)[0]['comments'] == [{'user': 'bob', 'text': 'kept'}]
+    assert 'unknown post 3' in capsys.readouterr().out
+
+
+def test_legacy_posts_json_is_migrated(tmp_path, posts_file):
+    legacy = [dict(post('alice', 0), comments=[{'user': 'bob', 'text': 'old'}]), post('bob', 0)]
+    (tmp_path / 'posts.json').write_text(json.dumps(legacy))
+    assert read_posts(posts_file) == legacy  # Reading alone leaves the tree untouched
+
+    store = PostStore(posts_file)
+    assert not (tmp_path / 'posts.json').exists()
+    assert store.list_posts() == legacy
+    store.add_comment(None, 'alice', 'new', post_id=0)
+    assert PostStore(posts_file).list_posts()[0]['comments'] == [
+        {'user': 'bob', 'text': 'old'}, {'user': 'alice', 'text': 'new'}
+    ]
+
+
+def test_feed_pages_by_author(posts_file):
+    store = PostStore(posts_file)
+    for n in range(5):
+        store.add(post('alice', n))
+        store.add(post('bob', n))
+        store.add(post('carol', n))
+    page, has_more = store.get_feed(['alice', 'bob'], 3)
+    assert captions(page) == ['bob 4', 'alice 4', 'bob 3']
+    assert has_more
+    page, has_more = store.get_feed(['alice', 'bob'], 3, before=page[-1]['id'])
+    assert captions(page) == ['alice 3', 'bob 2', 'alice 2']
+    page, has_more = store.get_feed(['carol'], 10, before=6)
+    assert captions(page) == ['carol 1', 'carol 0']
+    assert not has_more
+
+
+def test_image_authors_and_rewrite(posts_file):
+    store = PostStore(posts_file)
+    store.add(post('alice', 0))
+    store.add(dict(post('bob', 0), image_path='data/images/alice_0.jpg'))
+    assert store.image_authors('data/images/alice_0.jpg') == {'alice', 'bob'}
+
+    assert store.rewrite_image_paths(lambda path: 'blob' if path.endswith('alice_0.jpg') else None) == 2
+    assert store.image_authors('blob') == {'alice', 'bob'}
+    assert store.image_authors('data/images/alice_0.jpg') == set()
+    assert store.add_comment('blob', 'carol', 'hi')
+    assert [p['image_path'] for p in PostStore(posts_file).list_posts()] == ['blob', 'blob']
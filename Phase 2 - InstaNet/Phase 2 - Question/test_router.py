@@ -0,0 +1,98 @@
+"""
+Tests for the action router and its middleware.
+"""
+
+import pytest
+
+from router import INVALID_ACTION, Router, authorize, rate_limit, timing
+
+
+class Connection:
+    """
+    Stands in for a client connection; only its logged-in user matters here.
+    """
+
+    def __init__(self, username=None):
+        self.username = username
+
+
+def echo(request, **kwargs):
+    return {'status': 'success', 'request': request, **kwargs}
+
+
+@pytest.fixture
+def router():
+    router = Router()
+    router.add('get_all_users', echo)
+    router.add('subscribe', echo, auth_required=True)
+    router.add('send_message', echo, actor='sender', mutating=True,
+               expects_image=lambda request: bool(request.get('is_image')))
+    router.use(authorize)
+    return router
+
+
+def test_unknown_action(router):
+    assert router.dispatch({'action': 'drop_tables'}) == {'status': 'error', 'message': 'Invalid action'}
+    assert router.label({'action': 'drop_tables'}) == INVALID_ACTION
+    assert router.label({'action': ['get_all_users']}) == INVALID_ACTION
+
+
+def test_duplicate_action_is_refused(router):
+    with pytest.raises(ValueError):
+        router.add('get_all_users', echo)
+
+
+def test_public_route_needs_no_login(router):
+    assert router.dispatch({'action': 'get_all_users'})['status'] == 'success'
+
+
+def test_login_required(router):
+    response = router.dispatch({'action': 'subscribe'}, conn=Connection())
+    assert response == {'status': 'error', 'message': 'Login required'}
+    assert router.dispatch({'action': 'subscribe'})['message'] == 'Login required'
+
+
+def test_authorize_rejects_mismatched_actor(router):
+    request = {'action': 'send_message', 'sender': 'bob', 'receiver': 'carol'}
+    response = router.dispatch(request, conn=Connection('alice'))
+    assert response == {'status': 'error', 'message': 'Permission denied'}
+    request.pop('sender')
+    assert router.dispatch(request, conn=Connection('alice'))['message'] == 'Permission denied'
+
+
+def test_authorize_passes_the_logged_in_actor(router):
+    conn = Connection('alice')
+    request = {'action': 'send_message', 'sender': 'alice', 'receiver': 'bob'}
+    response = router.dispatch(request, upload='upload', conn=conn)
+    assert response == {'status': 'success', 'request': request, 'upload': 'upload'}
+    response = router.dispatch({'action': 'subscribe'}, conn=conn)
+    assert response['conn'] is conn
+
+
+def test_route_metadata(router):
+    route = router.routes['send_message']
+    assert route.auth_required and route.mutating
+    assert not route.uses_connection  # An actor is checked by authorize; the handler needs no connection
+    assert router.routes['subscribe'].uses_connection
+    assert router.has_image({'action': 'send_message', 'is_image': True})
+    assert not router.has_image({'action': 'send_message'})
+    assert not router.has_image({'action': 'get_all_users'})
+
+
+def test_middleware_order_and_timing(router):
+    observed = []
+    router.use(timing(lambda action, status, seconds: observed.append((action, status))))
+    router.dispatch({'action': 'subscribe'})
+    router.dispatch({'action': 'nope'})
+    # authorize was added first, so it answers before timing sees the request
+    assert observed == [('invalid', 'error')]
+
+
+def test_rate_limit_only_counts_mutating_requests(router):
+    router.use(rate_limit(rate=0.001, burst=2))
+    conn = Connection('alice')
+    send = {'action': 'send_message', 'sender': 'alice', 'receiver': 'bob'}
+    assert [router.dispatch(send, conn=conn)['status'] for _ in range(3)] == ['success', 'success', 'error']
+    assert router.dispatch(send, conn=conn)['message'] == 'Rate limit exceeded'
+    assert router.dispatch({'action': 'get_all_users'}, conn=conn)['status'] == 'success'
+    assert router.dispatch(send, conn=Connection('alice'))['status'] == 'success'  # Buckets are per connection
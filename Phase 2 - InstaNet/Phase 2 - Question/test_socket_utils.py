@@ -0,0 +1,94 @@
+"""
+Tests for the framed and legacy message protocols in socket_utils.
+"""
+
+import socket
+import threading
+
+import pytest
+
+from socket_utils import (
+    FRAME_HEADER, FRAME_JSON, FRAME_JSON_WITH_IMAGE, MessageConnection, encode_message,
+    receive_json_message, send_json_message
+)
+from constants import FRAME_MAGIC, PROTOCOL_VERSION
+
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+
+def test_encode_message_framed_header():
+    data = encode_message({'action': 'get_all_users'})
+    magic, version, frame_type, length = FRAME_HEADER.unpack(data[:FRAME_HEADER.size])
+    assert (magic, version, frame_type) == (FRAME_MAGIC, PROTOCOL_VERSION, FRAME_JSON)
+    assert length == len(data) - FRAME_HEADER.size
+
+
+def test_encode_message_legacy_is_bare_json():
+    assert encode_message({'a': 1}, framed=False) == b'{"a": 1}'
+
+
+def test_framed_round_trip(pair):
+    sender, receiver = MessageConnection(pair[0]), MessageConnection(pair[1])
+    messages = [{'action': 'get_feed', 'n': i, 'text': '}{' * i} for i in range(5)]
+    for message in messages:
+        sender.send_message(message)
+    assert [receiver.receive_message() for _ in messages] == messages
+    assert receiver.bytes_received == sender.bytes_sent
+
+
+def test_framed_round_trip_with_image(pair):
+    sender, receiver = MessageConnection(pair[0]), MessageConnection(pair[1])
+    image = bytes(range(256)) * 1000
+    thread = threading.Thread(target=sender.send_message_with_image, args=({'action': 'upload_post'}, image))
+    thread.start()
+    assert receiver.receive_message() == {'action': 'upload_post'}
+    assert receiver.image_attached
+    assert bytes(receiver.receive_image()) == image
+    thread.join()
+
+
+def test_detects_framed_peer(pair):
+    receiver = MessageConnection(pair[1], framed=None)
+    pair[0].sendall(encode_message({'action': 'login'}))
+    assert receiver.receive_message() == {'action': 'login'}
+    assert receiver.framed is True
+
+
+def test_detects_legacy_peer_and_answers_in_kind(pair):
+    receiver = MessageConnection(pair[1], framed=None)
+    # Two bare messages back to back, the second split across sends
+    pair[0].sendall(b'{"action": "login"} {"action": ')
+    pair[0].sendall(b'"get_feed"}')
+    assert receiver.receive_message() == {'action': 'login'}
+    assert receiver.receive_message() == {'action': 'get_feed'}
+    assert receiver.framed is False
+    receiver.send_message({'status': 'success'})
+    assert receive_json_message(pair[0]) == {'status': 'success'}
+
+
+def test_legacy_helpers_round_trip(pair):
+    message = {'text': 'x' * 100000, 'nested': {'brace': '}'}}
+    thread = threading.Thread(target=send_json_message, args=(pair[0], message))
+    thread.start()
+    assert receive_json_message(pair[1]) == message
+    thread.join()
+
+
+def test_rejects_oversized_frame(pair):
+    receiver = MessageConnection(pair[1], max_message_size=10)
+    pair[0].sendall(encode_message({'text': 'longer than ten bytes'}))
+    with pytest.raises(RuntimeError, match='exceeds limit'):
+        receiver.receive_message()
+
+
+def test_rejects_unknown_frame_type(pair):
+    receiver = MessageConnection(pair[1])
+    pair[0].sendall(FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_VERSION, FRAME_JSON_WITH_IMAGE + 1, 2) + b'{}')
+    with pytest.raises(RuntimeError, match='Unsupported frame type'):
+        receiver.receive_message()
@@ -0,0 +1,148 @@
+"""
+Tests for the storage backends and the tools importing older data trees.
+"""
+
+import json
+import os
+
+import pytest
+
+from blob_store import BlobStore
+from storage import JsonStorage, SqliteStorage, import_images, import_json_data
+
+USERS = {
+    'alice': {'password': 'a', 'friends': ['bob'], 'requests': ['carol']},
+    'bob': {'password': 'b', 'friends': ['alice'], 'requests': []},
+    'carol': {'password': 'c', 'friends': [], 'requests': []},
+}
+POSTS = [
+    {'username': 'alice', 'image_path': 'data\\images\\alice_1.jpg', 'caption': 'first',
+     'comments': [{'user': 'bob', 'text': 'nice'}]},
+    {'username': 'bob', 'image_path': 'data/images/bob_1.jpg', 'caption': 'second'},
+]
+MESSAGES = [
+    {'sender': 'alice', 'receiver': 'bob', 'message': 'Image', 'is_image': True,
+     'image_path': 'data\\images\\alice_bob_1.jpg'},
+    {'sender': 'bob', 'receiver': 'alice', 'message': 'hello', 'is_image': False},
+]
+
+
+@pytest.fixture
+def data(tmp_path):
+    """
+    A data tree as written by older releases: JSON arrays and flat images.
+    """
+    root = tmp_path / 'data'
+    for directory in ('users', 'posts', 'messages', 'images/variants'):
+        (root / directory).mkdir(parents=True)
+    (root / 'users' / 'users.json').write_text(json.dumps(USERS))
+    (root / 'posts' / 'posts.json').write_text(json.dumps(POSTS))
+    (root / 'messages' / 'alice_bob.json').write_text(json.dumps(MESSAGES))
+    # The message forwards alice's post image, so the two files are identical
+    (root / 'images' / 'alice_1.jpg').write_bytes(b'alice image')
+    (root / 'images' / 'alice_bob_1.jpg').write_bytes(b'alice image')
+    (root / 'images' / 'bob_1.jpg').write_bytes(b'bob image')
+    (root / 'images' / 'variants' / 'alice_1_feed.jpg').write_bytes(b'derivative')
+    return root
+
+
+def paths(data):
+    return {
+        'users_file': str(data / 'users' / 'users.json'),
+        'posts_file': str(data / 'posts' / 'posts.json'),
+        'messages_dir': str(data / 'messages'),
+    }
+
+
+def json_storage(data):
+    files = paths(data)
+    return JsonStorage(files['users_file'], files['posts_file'], files['messages_dir'])
+
+
+def test_import_json_data_into_sqlite(tmp_path, data):
+    storage = SqliteStorage(str(tmp_path / 'instanet.db'))
+    counts = import_json_data(storage, **paths(data))
+    assert counts == {'users': 3, 'posts': 2, 'messages': 2}
+    assert storage.authenticate('alice', 'a')
+    assert storage.get_user('alice')['friends'] == ['bob']
+    assert storage.get_user('alice')['requests'] == ['carol']
+    assert storage.list_posts() == POSTS
+    messages, has_more = storage.get_messages('bob', 'alice')
+    assert [m['message'] for m in messages] == ['Image', 'hello']
+    assert not has_more
+
+    # The source tree is left as it was, and a second import adds nothing
+    assert (data / 'posts' / 'posts.json').exists()
+    assert (data / 'messages' / 'alice_bob.json').exists()
+    assert import_json_data(storage, **paths(data)) == {'users': 0, 'posts': 0, 'messages': 0}
+    storage.close()
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_import_images_into_blob_store(tmp_path, data, backend):
+    if backend == 'json':
+        storage = json_storage(data)
+    else:
+        storage = SqliteStorage(str(tmp_path / 'instanet.db'))
+        import_json_data(storage, **paths(data))
+    blobs = BlobStore(str(data / 'blobs'))
+
+    counts = import_images(storage, blobs, str(data / 'images'))
+    assert counts == {'files': 3, 'blobs': 2, 'references': 3}
+    assert os.listdir(data / 'images' / 'variants') == []
+    assert os.listdir(data / 'images') == ['variants']
+
+    alice_blob, bob_blob = [post['image_path'] for post in storage.list_posts()]
+    assert alice_blob == blobs.path(blobs.digest_of(alice_blob))
+    assert bob_blob == blobs.path(blobs.digest_of(bob_blob))
+    messages, _ = storage.get_messages('alice', 'bob')
+    assert messages[0]['image_path'] == alice_blob
+    assert 'image_path' not in messages[1]
+    with open(alice_blob, 'rb') as f:
+        assert f.read() == b'alice image'
+    assert storage.can_view_image('bob', alice_blob)
+
+    # Each post and message holding a blob counts as one reference
+    blobs.close()
+    blobs = BlobStore(str(data / 'blobs'))  # Compacts the reference log
+    with open(data / 'blobs' / 'refs.log') as f:
+        assert sorted(int(line.split()[1]) for line in f) == [1, 2]
+
+    # Running it again finds nothing left to import
+    assert import_images(storage, blobs, str(data / 'images')) == {'files': 0, 'blobs': 0, 'references': 0}
+    blobs.close()
+    storage.close()
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def storage(request, tmp_path):
+    if request.param == 'json':
+        (tmp_path / 'messages').mkdir()  # Created by the server at startup
+        storage = JsonStorage(str(tmp_path / 'users.json'), str(tmp_path / 'posts.json'), str(tmp_path / 'messages'))
+    else:
+        storage = SqliteStorage(str(tmp_path / 'instanet.db'))
+    for username in ('alice', 'bob', 'carol', 'dave'):
+        storage.create_user(username, 'secret')
+    storage.send_friend_request('bob', 'alice')
+    storage.accept_friend_request('alice', 'bob')
+    yield storage
+    storage.close()
+
+
+def test_can_view_image(storage):
+    storage.add_post({'username': 'alice', 'image_path': 'post.jpg', 'caption': ''})
+    storage.append_message('carol', 'dave', {'sender': 'carol', 'receiver': 'dave', 'message': 'Image',
+                                             'is_image': True, 'image_path': 'dm.jpg'})
+    assert storage.can_view_image('alice', 'post.jpg')      # Own post
+    assert storage.can_view_image('bob', 'post.jpg')        # A friend's post
+    assert not storage.can_view_image('carol', 'post.jpg')
+    assert storage.can_view_image('carol', 'dm.jpg')        # Sent it
+    assert storage.can_view_image('dave', 'dm.jpg')         # Received it
+    assert not storage.can_view_image('alice', 'dm.jpg')
+    assert not storage.can_view_image('alice', 'unknown.jpg')
+
+    # Messages sent after the first lookup are indexed too
+    storage.append_message('alice', 'carol', {'sender': 'alice', 'receiver': 'carol', 'message': 'Image',
+                                              'is_image': True, 'image_path': 'dm.jpg'})
+    assert storage.can_view_image('alice', 'dm.jpg')
+    assert not storage.can_view_image('bob', 'dm.jpg')
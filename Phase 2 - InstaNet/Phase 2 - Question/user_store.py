@@ -0,0 +1,219 @@
+"""
+This module implements the in-memory user and friend-graph store used by the server.
+
+The store loads users.json once at startup and serves every read from memory.
+Mutations mark the store dirty; a background thread batches them and persists
+a snapshot by writing a temporary file and atomically replacing users.json, so
+request latency does not depend on the size of the user file.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from constants import USERS_FILE, USERS_FLUSH_INTERVAL
+
+
+class UserStore:
+    """
+    Thread-safe user store with write-behind persistence.
+
+    Friends and pending requests are kept as insertion-ordered dicts so that
+    membership checks are O(1) while the JSON file keeps its list layout.
+
+    Args:
+        path (str): Path to the users JSON file
+        flush_interval (float): Seconds to batch mutations before writing them out
+    """
+
+    def __init__(self, path: str = USERS_FILE, flush_interval: float = USERS_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = threading.Event()
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._load()
+        self._flusher = threading.Thread(target=self._flush_loop, name="user-store-flush", daemon=True)
+        self._flusher.start()
+
+    def _load(self) -> None:
+        """
+        Load all users from disk into memory.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            users = json.load(f)
+        for username, data in users.items():
+            self._users[username] = {
+                'password': data.get('password'),
+                'friends': dict.fromkeys(data.get('friends', [])),
+                'requests': dict.fromkeys(data.get('requests', [])),
+            }
+
+    def _snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Copy the store into the JSON file layout. Must be called with the lock held.
+        """
+        return {
+            username: {
+                'password': data['password'],
+                'friends': list(data['friends']),
+                'requests': list(data['requests']),
+            }
+            for username, data in self._users.items()
+        }
+
+    def _mark_dirty(self) -> None:
+        """
+        Schedule the current state to be written by the flush thread.
+        """
+        self._dirty.set()
+
+    def _flush_loop(self) -> None:
+        """
+        Persist batched mutations until the store is closed.
+        """
+        while not self._closed.is_set():
+            self._dirty.wait()
+            # Give further mutations a chance to join this write
+            self._closed.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write pending changes to disk now, replacing the file atomically.
+        """
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty.is_set():
+                    return
+                self._dirty.clear()
+                snapshot = self._snapshot()
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(snapshot, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"[ERROR] Failed to persist users: {e}")
+                self._dirty.set()
+
+    def close(self) -> None:
+        """
+        Stop the flush thread and write any pending changes.
+        """
+        self._closed.set()
+        self._dirty.set()
+        self._flusher.join()
+        self.flush()
+
+    def authenticate(self, username: str, password: Optional[str]) -> bool:
+        """
+        Check a username and password.
+        """
+        with self._lock:
+            user = self._users.get(username)
+            return user is not None and user['password'] == password
+
+    def exists(self, username: str) -> bool:
+        """
+        Check whether a user exists.
+        """
+        with self._lock:
+            return username in self._users
+
+    def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of a user's data, or None if the user does not exist.
+        """
+        with self._lock:
+            user = self._users.get(username)
+            if user is None:
+                return None
+            return {
+                'password': user['password'],
+                'friends': list(user['friends']),
+                'requests': list(user['requests']),
+            }
+
+    def get_friends(self, username: str) -> List[str]:
+        """
+        Return a user's friends, or an empty list if the user does not exist.
+        """
+        with self._lock:
+            user = self._users.get(username)
+            return list(user['friends']) if user else []
+
+    def list_usernames(self) -> List[str]:
+        """
+        Return all usernames.
+        """
+        with self._lock:
+            return list(self._users)
+
+    def create_user(self, username: str, password: str) -> bool:
+        """
+        Add a user with no friends or requests.
+
+        Returns:
+            bool: False if the username is already taken
+        """
+        with self._lock:
+            if username in self._users:
+                return False
+            self._users[username] = {'password': password, 'friends': {}, 'requests': {}}
+        self._mark_dirty()
+        return True
+
+    def send_friend_request(self, sender: str, receiver: str) -> bool:
+        """
+        Record a friend request from sender to receiver.
+
+        Returns:
+            bool: False if either user is unknown, they are already friends,
+                or the request is already pending
+        """
+        with self._lock:
+            if sender == receiver or sender not in self._users or receiver not in self._users:
+                return False
+            target = self._users[receiver]
+            if sender in target['friends'] or sender in target['requests']:
+                return False
+            target['requests'][sender] = None
+        self._mark_dirty()
+        return True
+
+    def accept_friend_request(self, user: str, friend: str) -> bool:
+        """
+        Accept a pending request from friend, making both users friends.
+        """
+        with self._lock:
+            if user not in self._users or friend not in self._users:
+                return False
+            requests = self._users[user]['requests']
+            if friend not in requests:
+                return False
+            del requests[friend]
+            self._users[user]['friends'][friend] = None
+            self._users[friend]['friends'][user] = None
+        self._mark_dirty()
+        return True
+
+    def reject_friend_request(self, user: str, friend: str) -> bool:
+        """
+        Drop a pending request from friend.
+        """
+        with self._lock:
+            if user not in self._users:
+                return False
+            requests = self._users[user]['requests']
+            if friend not in requests:
+                return False
+            del requests[friend]
+        self._mark_dirty()
+        return True